@@ -1,15 +1,35 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import pandas as pd
-import os
+from boot import boot_stage, boot_report
+
+with boot_stage("import flask"):
+    from flask import Flask, Response, request, jsonify, stream_with_context
+    from flask_cors import CORS
+import json
+import threading
+import time
 import numpy as np
 
-from models import ranked_model, feature_names, categorical_columns, location_model, df
-from services import fetch_top_shops, generate_ai_insights
-from market_gap import get_market_analysis_logic
-from business_logic import PlanGenerator
-from utils import make_json_safe
-from sklearn.preprocessing import LabelEncoder
+with boot_stage("import models"):
+    from models import (
+        df, top_candidates, rank_cache,
+        pincode_records, city_pincodes, lookup_viability, predict_viability,
+        viability_feature_row, ranker_batcher, viability_batcher,
+    )
+with boot_stage("import services"):
+    from services import top_shops
+    from insights import insight_fields, insight_queue
+    from market_gap import get_market_analysis_logic, get_market_gap_heatmap, get_ring_analysis
+from utils import make_json_safe, normalize_query, poi_cache
+from jobs import JobQueue, JobQueueFull
+from upstream import upstream_stats
+from pipeline import run_inline, run_stages
+from config import (
+    PREDICT_CITY_BATCH_MAX, PREDICT_CITY_BATCH_SHOPS_DEADLINE_MS, PREDICT_CITY_SHOPS_DEADLINE_MS,
+    PREDICT_CITY_INSIGHTS_DEADLINE_MS, INSIGHT_STREAM_TIMEOUT, INSIGHT_MAX_WAITERS, INSIGHT_POLL_MAX_WAIT,
+    PLAN_STREAM_MAX_OPEN
+)
+
+# business_logic (LangChain + Gemini) is imported on the first strategy call
+# so workers do not pay for the LLM stack at boot.
 
 app = Flask(__name__)
 # Explicitly allow common local origins to prevent CORS issues
@@ -36,49 +56,76 @@ def predict_location():
     target_customer = data.get("target_customer", "")
     
     raw_investment = data.get("investment_max", 0)
-    investment_in_lakhs = float(raw_investment) / 100000
-
-    dataset = df.copy()
-    
-    if target_customer == "youth":
-        dataset["target_ratio"] = dataset["Youth_Pop_%"]
-        dataset["target_type"] = "youth"
-    elif target_customer == "female":
-        dataset["target_ratio"] = dataset["Female_Pop_%"]
-        dataset["target_type"] = "female"
-    else:
-        dataset["target_ratio"] = dataset["Male_Pop_%"]
-        dataset["target_type"] = "male"
-        
-    candidates =  dataset[
-        (dataset["Business_Category"] == category) & 
-        (dataset["target_type"] == target_customer)
-    ].copy()
-    
-    if candidates.empty:
+    try:
+        investment_in_lakhs = float(raw_investment) / 100000
+    except (TypeError, ValueError):
+        investment_in_lakhs = None
+    # NaN/inf cannot be bucketed for the rank cache (nor ranked meaningfully)
+    if investment_in_lakhs is None or not np.isfinite(investment_in_lakhs):
+        return jsonify({"error": f"Invalid investment_max '{raw_investment}'"}), 400
+
+    # Only this (category, target_customer) partition is ranked; derived
+    # features and categorical dtypes are materialized at startup in models.py
+    top_3 = top_candidates(category, target_customer, investment_in_lakhs, k=3)
+
+    if top_3 is None:
         return jsonify({"status": "error", "message": "No matching locations found"})
-        
-    candidates['Investment_Lakhs'] = investment_in_lakhs
-    
-    # 3. Dynamic Feature Engineering
-    candidates['Residential_density'] = candidates['Population'] / candidates['Total_Area']
-    candidates['Market_Saturation_Index'] = candidates['Population'] / (candidates['Competitor_Count'] + 1)
-    
-    # 4. Critical: Ensure Categorical Dtypes
-    for col in categorical_columns:
-        if col in candidates.columns:
-            candidates[col] = candidates[col].astype('category')
-            
-    candidates['rank_score'] = ranked_model.predict(candidates[feature_names])
 
-    # 6. Get Top 3
-    top_3 = candidates.sort_values(by='rank_score', ascending=False).head(3)
     return jsonify(make_json_safe(top_3.to_dict(orient="records")))
 
 
-# Make sure your label encoder classes match training
-label_encoder = LabelEncoder()
-label_encoder.classes_ = np.array(["Low", "Medium", "High"])
+# Class order must match training (Low=0, Medium=1, High=2)
+VIABILITY_LABELS = np.array(["Low", "Medium", "High"])
+
+def city_viability_payload(row, pincode, category, proba):
+    """
+    Model verdict, demographics and market factors for one pincode record.
+    With proba=None (prediction unavailable) the verdict fields are None.
+    """
+    if proba is None:
+        prediction = city_index_score = confidence_distribution = None
+    else:
+        predicted_index = np.argmax(proba)
+        prediction = VIABILITY_LABELS[predicted_index]
+        city_index_score = round(proba[predicted_index] * 100, 2)
+        # Full Probability Distribution
+        confidence_distribution = {
+            "Low": round(proba[0] * 100, 2),
+            "Medium": round(proba[1] * 100, 2),
+            "High": round(proba[2] * 100, 2),
+        }
+
+    # ==============================
+    # Additional Analytics
+    # ==============================
+    population = row.get("Population", 0)
+    total_area = row.get("Total_Area", 1)
+    density = population / max(total_area, 1)
+
+    return {
+        "city": row["City"],
+        "pincode": pincode,
+        "product_type": category,
+        "predicted_category": prediction,
+        "city_index_score": city_index_score,
+        "confidence_distribution": confidence_distribution,
+
+        # Demographics
+        "population": population,
+        "density": round(density, 2),
+        "male_ratio": row.get("Male_Pop_%", 0),
+        "female_ratio": row.get("Female_Pop_%", 0),
+        "youth_ratio": row.get("Youth_Pop_%", 0),
+
+        # Economy
+        "avg_income": row.get("Avg_Income", 0),
+        "rent": row.get("Rent", 0),
+
+        # Market Factors
+        "footfall_monthly": row.get("Footfall_Proxy", 0),
+        "competitor_count": row.get("Competitor_Count", 0),
+        "mall_proximity": row.get("Mall_Proximity", 0),
+    }
 
 # -------- City Prediction by Pincode --------
 @app.route("/api/predict_city", methods=["POST"])
@@ -94,90 +141,53 @@ def predict_city():
         # Lookup the row by pincode
         # Using int(float()) to handle strings like '414001.0'
         pincode_int = int(float(pincode))
-        city_data = df[df["Pincode"] == pincode_int]
-        
-        if city_data.empty:
+        row = pincode_records.get(pincode_int)
+
+        if row is None:
             return jsonify({"error": f"Pincode '{pincode}' not found in database"}), 404
-        
-        row = city_data.iloc[0]
-        city = row["City"]
 
-        # ==============================
-        # Feature Engineering 
-        # ==============================
-        residential_density = row["Population"] / max(row["Total_Area"], 1)
-
-        input_df = pd.DataFrame([{
-            "Competitor_Count": row.get("Competitor_Count", 0),
-            "Mall_Proximity": row.get("Mall_Proximity", 0),
-            "Footfall_Proxy": row.get("Footfall_Proxy", 0),
-            "Rent": row.get("Rent", 0),
-            "Avg_Income": row.get("Avg_Income", 0),
-            "Residential_density": residential_density,
-            "Youth_Pop_%": row.get("Youth_Pop_%", 0),
-            "Business_Category": category
-        }])
-
-        if "Business_Category" in categorical_columns:
-            input_df["Business_Category"] = input_df["Business_Category"].astype("category")
+        city = row["City"]
 
         # ==============================
         # MODEL PREDICTION
         # ==============================
-        proba = location_model.predict_proba(input_df)[0]
-        predicted_index = np.argmax(proba)
-        prediction = label_encoder.inverse_transform([predicted_index])[0]
-        city_index_score = round(proba[predicted_index] * 100, 2)
-
-        # ==============================
-        # Additional Analytics
-        # ==============================
-        population = row.get("Population", 0)
-        total_area = row.get("Total_Area", 1)
-        density = population / max(total_area, 1)
+        # Served from the startup viability matrix; unseen categories fall
+        # back to live inference.
+        def prediction():
+            proba = lookup_viability(pincode_int, category)
+            if proba is None:
+                proba = predict_viability([viability_feature_row(row, category)])[0]
+            return proba
 
         # ==============================
-        # NEW LOGIC INTEGRATION
+        # STAGED PIPELINE
         # ==============================
-        market_analysis = fetch_top_shops(city, category)
-
-        response_payload = {
-            "city": city,
-            "pincode": pincode,
-            "product_type": category,
-            "predicted_category": prediction,
-            "city_index_score": city_index_score,
-
-            # Full Probability Distribution
-            "confidence_distribution": {
-                "Low": round(proba[0] * 100, 2),
-                "Medium": round(proba[1] * 100, 2),
-                "High": round(proba[2] * 100, 2),
-            },
-
-            # Demographics
-            "population": population,
-            "density": round(density, 2),
-            "male_ratio": row.get("Male_Pop_%", 0),
-            "female_ratio": row.get("Female_Pop_%", 0),
-            "youth_ratio": row.get("Youth_Pop_%", 0),
-
-            # Economy
-            "avg_income": row.get("Avg_Income", 0),
-            "rent": row.get("Rent", 0),
-
-            # Market Factors
-            "footfall_monthly": row.get("Footfall_Proxy", 0),
-            "competitor_count": row.get("Competitor_Count", 0),
-            "mall_proximity": row.get("Mall_Proximity", 0),
-
-            # Insights
-            "insights": generate_ai_insights(row.to_dict()),
-
+        # The prediction is local and cheap, so it runs on the request
+        # thread where slow third-party stages cannot queue ahead of it.
+        # Competitor shops and insights run concurrently, each within its
+        # own deadline, and the response carries whatever finished plus a
+        # per-stage status block.
+        proba, prediction_status = run_inline("prediction", prediction)
+        shops_deadline = time.monotonic() + PREDICT_CITY_SHOPS_DEADLINE_MS / 1000
+        results, stages = run_stages([
+            ("shops", lambda: top_shops(city, category, deadline=shops_deadline), PREDICT_CITY_SHOPS_DEADLINE_MS / 1000),
+            ("insights", lambda: insight_fields(row), PREDICT_CITY_INSIGHTS_DEADLINE_MS / 1000),
+        ])
+        stages = {"prediction": prediction_status, **stages}
+        market_analysis = results.get("shops", {"markers": [], "brand_counts": {}})
+
+        response_payload = city_viability_payload(row, pincode, category, proba)
+        # Insights are generated in the background; a cache miss returns
+        # 'insights': None plus a token for /api/insights/<token>
+        response_payload.update(results.get("insights", {
+            "insights": None, "insights_token": None, "insights_status": stages["insights"]["status"]
+        }))
+        response_payload.update({
             # NEW DATA STRUCTURE PASS-THROUGH
             "market_analysis": market_analysis,
-            "shops": market_analysis.get("markers", [])
-        }
+            "shops": market_analysis.get("markers", []),
+            "stages": stages,
+        })
 
         return jsonify(make_json_safe(response_payload))
 
@@ -185,7 +195,168 @@ def predict_city():
         print(f"Error in predict_city: {str(e)}")
         return jsonify({"error": "Failed to predict city viability", "details": str(e)}), 500
     
+# -------- Batch City Prediction --------
+@app.route("/api/predict_city/batch", methods=["POST"])
+def predict_city_batch():
+    """
+    Scores many (pincode, business_category) items at once. Matrix hits are
+    looked up; everything else is assembled into one feature frame and scored
+    with a single predict_proba call. Shops/insights are opt-in per item via
+    'include_shops' / 'include_insights' (insights come back as a token
+    while they are generated, as in predict_city). Each distinct city and
+    category is searched once, concurrently, under one overall deadline;
+    'shops_status' reports ok/timeout/error per item.
+    """
+    data = request.get_json() or {}
+    items = data.get("items")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "'items' must be a non-empty list"}), 400
+    if len(items) > PREDICT_CITY_BATCH_MAX:
+        return jsonify({"error": f"At most {PREDICT_CITY_BATCH_MAX} items per batch"}), 400
+
+    try:
+        results = [None] * len(items)
+        resolved = []   # (position, item, row, pincode, category)
+        live = []       # positions in `resolved` that need live inference
+        probas = {}
+
+        for pos, item in enumerate(items):
+            pincode = item.get("pincode") if isinstance(item, dict) else None
+            category = item.get("business_category") if isinstance(item, dict) else None
+            if not pincode or not category:
+                results[pos] = {"pincode": pincode, "error": "Both 'pincode' and 'business_category' are required"}
+                continue
+            try:
+                pincode_int = int(float(pincode))
+            except (TypeError, ValueError, OverflowError):
+                results[pos] = {"pincode": pincode, "error": f"Invalid pincode '{pincode}'"}
+                continue
+
+            row = pincode_records.get(pincode_int)
+            if row is None:
+                results[pos] = {"pincode": pincode, "error": f"Pincode '{pincode}' not found in database"}
+                continue
+
+            proba = lookup_viability(pincode_int, category)
+            if proba is None:
+                live.append(len(resolved))
+            else:
+                probas[len(resolved)] = proba
+            resolved.append((pos, item, row, pincode, category))
+
+        if live:
+            live_proba = predict_viability(
+                [viability_feature_row(resolved[k][2], resolved[k][4]) for k in live]
+            )
+            probas.update(zip(live, live_proba))
+
+        # One search per distinct (city, category), all sharing one deadline
+        shop_keys = {}
+        for pos, item, row, pincode, category in resolved:
+            if item.get("include_shops"):
+                key = (normalize_query(row["City"]), normalize_query(category))
+                shop_keys.setdefault(key, (row["City"], category))
+        shops, shop_stages = {}, {}
+        if shop_keys:
+            shops_deadline = time.monotonic() + PREDICT_CITY_BATCH_SHOPS_DEADLINE_MS / 1000
+            shops, shop_stages = run_stages([
+                (key, lambda city=city, category=category: top_shops(city, category, deadline=shops_deadline),
+                 PREDICT_CITY_BATCH_SHOPS_DEADLINE_MS / 1000)
+                for key, (city, category) in shop_keys.items()
+            ])
+
+        for k, (pos, item, row, pincode, category) in enumerate(resolved):
+            payload = city_viability_payload(row, pincode, category, probas[k])
+            if item.get("include_shops"):
+                key = (normalize_query(row["City"]), normalize_query(category))
+                payload["shops_status"] = shop_stages[key]["status"]
+                if key in shops:
+                    payload["market_analysis"] = shops[key]
+                    payload["shops"] = shops[key].get("markers", [])
+            if item.get("include_insights"):
+                payload.update(insight_fields(row))
+            results[pos] = payload
+
+        return jsonify(make_json_safe({"results": results}))
+
+    except Exception as e:
+        print(f"Error in predict_city_batch: {str(e)}")
+        return jsonify({"error": "Failed to predict city viability", "details": str(e)}), 500
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(make_json_safe(data))}\n\n"
+
+
+# -------- AI Insights --------
+# Waiting for an insight holds a request thread; only INSIGHT_MAX_WAITERS of
+# a worker's SERVER_THREADS may do so, so waiting dashboards cannot block
+# /api/predict_city.
+insight_waiters = threading.BoundedSemaphore(INSIGHT_MAX_WAITERS)
+
+
+@app.route("/api/insights/<token>", methods=["GET"])
+def get_insights(token):
+    # ?wait=<seconds> (at most INSIGHT_POLL_MAX_WAIT) long-polls while pending,
+    # if a waiter slot is free; otherwise the current status comes back at once
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0.0), INSIGHT_POLL_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "'wait' must be a number of seconds"}), 400
+
+    if wait and insight_waiters.acquire(blocking=False):
+        try:
+            status = insight_queue.wait(token, wait)
+        finally:
+            insight_waiters.release()
+    else:
+        status = insight_queue.status(token)
+    if status["status"] == "unknown":
+        return jsonify({"error": f"No insight for token '{token}'", **status}), 404
+    return jsonify(status)
+
+
+@app.route("/api/insights/<token>/stream", methods=["GET"])
+def stream_insights(token):
+    """
+    Server-sent events: keep-alive comments while the insight is generated,
+    then one 'insight' event carrying the same JSON as /api/insights/<token>.
+    Answers 503 when INSIGHT_MAX_WAITERS requests are already waiting.
+    """
+    status = insight_queue.status(token)
+    if status["status"] == "unknown":
+        return jsonify({"error": f"No insight for token '{token}'"}), 404
+    if status["status"] != "pending":
+        return Response(sse_event("insight", status), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    if not insight_waiters.acquire(blocking=False):
+        return jsonify({"error": "Too many insight streams open, poll /api/insights/<token> instead"}), 503, {"Retry-After": "2"}
+
+    def events():
+        deadline = time.monotonic() + INSIGHT_STREAM_TIMEOUT
+        status = insight_queue.status(token)
+        while status["status"] == "pending" and time.monotonic() < deadline:
+            status = insight_queue.wait(token, min(15, deadline - time.monotonic()))
+            if status["status"] == "pending":
+                yield ": keep-alive\n\n"
+        yield sse_event("insight", status)
+
+    response = Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    # Released when the response closes, even if the client leaves before the first event
+    response.call_on_close(insight_waiters.release)
+    return response
+
 # -------- Strategy & Business Plan Generator --------
+def strategy_summary(market_package):
+    """The market-gap part of a /api/generate_strategy response."""
+    return {
+        "market_gap_score": market_package["gap_score"],
+        "best_opportunity": market_package["niche"],
+        "status": market_package["status"],
+        "location": market_package["location"],
+        "area_sq_km": market_package["area_sq_km"],
+    }
+
+
 @app.route("/api/generate_strategy", methods=["POST"])
 def generate_strategy():
     data = request.get_json()
@@ -199,22 +370,13 @@ def generate_strategy():
         # 1. Get Market Data (Member A Logic)
         market_package = get_market_analysis_logic(domain, location)
 
-        # 2. Generate AI Business Plan (Member B Logic)
-        api_key = os.getenv("GEMINI_API_KEY")
-        generator = PlanGenerator(api_key=api_key)
-        
-        # Use the PlanGenerator logic to create the structured plan
-        business_plan_obj = generator.create_plan(market_package)
-        
+        # 2. Generate AI Business Plan (Member B Logic) with the process-wide generator
+        from business_logic import get_plan_generator
+        business_plan_obj = get_plan_generator().create_plan(market_package)
+
         # 3. Consolidate everything for the Frontend
-        response_data = {
-            "market_gap_score": market_package["gap_score"],
-            "best_opportunity": market_package["niche"],
-            "status": market_package["status"],
-            "location": market_package["location"],
-            "area_sq_km": market_package["area_sq_km"],
-            "business_plan": business_plan_obj.dict() # Convert Pydantic to Dict for JSON
-        }
+        response_data = strategy_summary(market_package)
+        response_data["business_plan"] = business_plan_obj.dict() # Convert Pydantic to Dict for JSON
 
         return jsonify(make_json_safe(response_data))
 
@@ -223,6 +385,160 @@ def generate_strategy():
         return jsonify({"error": "Failed to generate business plan", "details": str(e)}), 500
 
 
+# A plan stream does its work on the request thread; only PLAN_STREAM_MAX_OPEN
+# of a worker's SERVER_THREADS may do so at once.
+plan_streams = threading.BoundedSemaphore(PLAN_STREAM_MAX_OPEN)
+
+
+@app.route("/api/generate_strategy/stream", methods=["POST"])
+def generate_strategy_stream():
+    """
+    Same body as /api/generate_strategy, answered as server-sent events:
+    'market' once the gap analysis is done, 'section' ({"name", "value"})
+    for each business-plan section as soon as Gemini has written it, then
+    'plan' with the full /api/generate_strategy response, or 'error'.
+    Answers 503 when PLAN_STREAM_MAX_OPEN streams are already open.
+    """
+    data = request.get_json() or {}
+    domain = data.get("domain")
+    location = data.get("location")
+
+    if not domain or not location:
+        return jsonify({"error": "Domain and location are required"}), 400
+    if not plan_streams.acquire(blocking=False):
+        return jsonify({"error": "Too many plan streams open, use /api/strategy_jobs instead"}), 503, {"Retry-After": "10"}
+
+    def events():
+        try:
+            market_package = get_market_analysis_logic(domain, location)
+            summary = strategy_summary(market_package)
+            yield sse_event("market", summary)
+
+            from business_logic import get_plan_generator
+            for kind, value in get_plan_generator().stream_plan(market_package):
+                if kind == "section":
+                    name, section = value
+                    yield sse_event("section", {"name": name, "value": section})
+                else:
+                    yield sse_event("plan", {**summary, "business_plan": value.dict()})
+        except Exception as e:
+            print(f"Error streaming strategy: {str(e)}")
+            yield sse_event("error", {"error": "Failed to generate business plan", "details": str(e)})
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+    # Released when the response closes, even if the client leaves mid-plan
+    response.call_on_close(plan_streams.release)
+    return response
+
+
+# -------- Strategy Jobs --------
+# Strategy generation takes tens of seconds (Geoapify fan-out, subcategory
+# deep dive, Gemini), so it also runs as a background job that clients poll.
+STRATEGY_STAGES = ("geocode", "categories", "subcategories", "plan")
+strategy_jobs = JobQueue()
+
+
+def run_strategy_job(params, progress):
+    market_package = get_market_analysis_logic(params["domain"], params["location"], progress=progress.stage)
+
+    progress.stage("plan")
+    from business_logic import get_plan_generator
+    business_plan_obj = get_plan_generator().create_plan(market_package)
+
+    response_data = strategy_summary(market_package)
+    response_data["business_plan"] = business_plan_obj.dict()
+    return make_json_safe(response_data)
+
+
+@app.route("/api/strategy_jobs", methods=["POST"])
+def submit_strategy_job():
+    """
+    Queues /api/generate_strategy work and answers 202 with the job record.
+    An identical (domain, location) job that is in progress or recently
+    finished is returned instead of starting another ('deduplicated': true).
+    """
+    data = request.get_json() or {}
+    domain = data.get("domain")
+    location = data.get("location")
+
+    if not domain or not location:
+        return jsonify({"error": "Domain and location are required"}), 400
+
+    try:
+        job, created = strategy_jobs.submit(
+            "strategy", {"domain": domain, "location": location}, run_strategy_job,
+            stages=STRATEGY_STAGES, key=f"{normalize_query(domain)}|{normalize_query(location)}"
+        )
+    except JobQueueFull as e:
+        return jsonify({"error": "Too many strategy jobs in progress", "details": str(e)}), 503, {"Retry-After": "10"}
+
+    status_url = f"/api/strategy_jobs/{job['id']}"
+    return jsonify({**job, "deduplicated": not created, "status_url": status_url}), 202, {"Location": status_url}
+
+
+@app.route("/api/strategy_jobs/<job_id>", methods=["GET"])
+def get_strategy_job(job_id):
+    # status is queued/running/done/error; 'result' holds the
+    # /api/generate_strategy response once done
+    job = strategy_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    return jsonify(job)
+
+
+# -------- Market-Gap Heatmap --------
+@app.route("/api/market_gap/heatmap", methods=["POST"])
+def market_gap_heatmap():
+    """
+    Gap scores for every cell of a grid over a bounding box, from one POI
+    download. Body: {"domain", "bbox": [west, south, east, north],
+    "cell_size_m" (default 500), "include_categories" (optional)}.
+    """
+    data = request.get_json() or {}
+    domain = data.get("domain")
+    bbox = data.get("bbox")
+
+    if not domain or not isinstance(bbox, list) or len(bbox) != 4:
+        return jsonify({"error": "'domain' and 'bbox' ([west, south, east, north]) are required"}), 400
+
+    try:
+        heatmap = get_market_gap_heatmap(
+            domain, bbox, data.get("cell_size_m", 500),
+            include_categories=bool(data.get("include_categories"))
+        )
+        return jsonify(make_json_safe(heatmap))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error building market-gap heatmap: {str(e)}")
+        return jsonify({"error": "Failed to build market-gap heatmap", "details": str(e)}), 500
+
+
+# -------- Multi-Radius Ring Analysis --------
+@app.route("/api/market_gap/rings", methods=["POST"])
+def market_gap_rings():
+    """
+    Competitor metrics and gap scores for several radii around one location
+    from a single POI fetch. Body: {"domain", "location", "radii" (metres,
+    default [500, 1000, 2000])}.
+    """
+    data = request.get_json() or {}
+    domain = data.get("domain")
+    location = data.get("location")
+
+    if not domain or not location:
+        return jsonify({"error": "Domain and location are required"}), 400
+
+    try:
+        rings = get_ring_analysis(domain, location, data.get("radii") or (500, 1000, 2000))
+        return jsonify(make_json_safe(rings))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error building ring analysis: {str(e)}")
+        return jsonify({"error": "Failed to build ring analysis", "details": str(e)}), 500
+
+
 # -------- Get All Locations --------
 @app.route("/api/locations", methods=["GET"])
 def get_all_locations():
@@ -241,13 +557,43 @@ def get_all_locations():
 # -------- Get Cities & Pincodes from CSV --------
 @app.route("/api/cities", methods=["GET"])
 def get_cities():
-    city_pincode_data = (
-        df.groupby("City")["Pincode"]
-        .unique()
-        .apply(lambda x: [str(pin) for pin in x])
-        .to_dict()
-    )
-    return jsonify(city_pincode_data)
+    return jsonify(city_pincodes)
+
+# -------- Cache Stats --------
+@app.route("/api/admin/cache", methods=["GET"])
+def cache_stats():
+    # ?entries=1 also lists the most recently used POI cache keys
+    list_entries = request.args.get("entries") == "1"
+    return jsonify({
+        "rank_cache": rank_cache.stats(),
+        "poi_cache": poi_cache.stats(list_entries=list_entries) if poi_cache else None,
+        "insights": insight_queue.stats(),
+    })
+
+# -------- Inference Dispatcher Stats --------
+@app.route("/api/admin/inference", methods=["GET"])
+def inference_stats():
+    return jsonify({
+        "ranker": ranker_batcher.stats(),
+        "viability": viability_batcher.stats(),
+    })
+
+# -------- Background Job Stats --------
+@app.route("/api/admin/jobs", methods=["GET"])
+def job_stats():
+    return jsonify({"strategy": strategy_jobs.stats()})
+
+# -------- Upstream Client Stats --------
+@app.route("/api/admin/upstream", methods=["GET"])
+def upstream_client_stats():
+    return jsonify(upstream_stats())
+
+boot_timings = boot_report()
+
+# -------- Boot Timings --------
+@app.route("/api/admin/boot", methods=["GET"])
+def boot_stats():
+    return jsonify(boot_timings)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,87 @@
+"""
+Benchmark for the competitor-spacing metric (avg_nearest_neighbor_distance).
+
+Times the spatial.py engine against the original pairwise loop on random
+POIs inside a 2 km circle, from 10 to 10,000 points, and fails if the two
+means disagree. The pairwise loop is only run up to --legacy-max points
+(it needs n^2 scalar haversine calls).
+
+    python bench_nearest_neighbor.py [--legacy-max 2000] [--repeat 3]
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+from spatial import BRUTE_FORCE_MAX_POINTS, mean_nearest_neighbor_distance
+from utils import haversine
+
+SIZES = [10, 100, 1000, 10000]
+CENTER = (19.076, 72.8777)
+RADIUS_M = 2000
+
+
+def legacy_mean_nearest_neighbor_distance(points):
+    # The pre-spatial-index implementation, kept here as the reference
+    distances = []
+    for i, (lat1, lon1) in enumerate(points):
+        min_dist = float("inf")
+        for j, (lat2, lon2) in enumerate(points):
+            if i != j:
+                min_dist = min(min_dist, haversine(lat1, lon1, lat2, lon2))
+        distances.append(min_dist)
+    return sum(distances) / len(distances)
+
+
+def random_points(n, seed):
+    rng = random.Random(seed)
+    points = []
+    for _ in range(n):
+        # Uniform in the circle; ~1e-5 deg per metre is close enough here
+        r = RADIUS_M * math.sqrt(rng.random()) / 111_320
+        theta = rng.uniform(0, 2 * math.pi)
+        points.append((CENTER[0] + r * math.sin(theta), CENTER[1] + r * math.cos(theta)))
+    # Real feeds repeat coordinates (branches sharing a building)
+    points.extend(points[: n // 50])
+    return points[:n]
+
+
+def best_of(repeat, fn, *args):
+    best, value = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--legacy-max", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ok = True
+    print(f"brute-force threshold: {BRUTE_FORCE_MAX_POINTS} points")
+    print(f"{'points':>8} {'spatial ms':>11} {'pairwise ms':>12} {'speedup':>8}  mean m")
+    for n in SIZES:
+        points = random_points(n, seed=n)
+        fast_s, fast = best_of(args.repeat, mean_nearest_neighbor_distance, points)
+
+        if n <= args.legacy_max:
+            slow_s, slow = best_of(1 if n > 100 else args.repeat, legacy_mean_nearest_neighbor_distance, points)
+            same = math.isclose(fast, slow, rel_tol=1e-9, abs_tol=1e-6)
+            ok &= same
+            print(
+                f"{n:>8} {fast_s * 1e3:>11.2f} {slow_s * 1e3:>12.2f} {slow_s / fast_s:>7.0f}x"
+                f"  {fast:.4f}{'' if same else f' != {slow:.4f} (MISMATCH)'}"
+            )
+        else:
+            print(f"{n:>8} {fast_s * 1e3:>11.2f} {'-':>12} {'-':>8}  {fast:.4f}")
+
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,46 @@
+import time
+
+BOOT_STARTED = time.perf_counter()
+
+# (depth, stage name, elapsed ms), in the order the stages started
+boot_timings = []
+_depth = 0
+
+
+class boot_stage:
+    """Context manager that records how long one startup stage took."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        global _depth
+        self._slot = len(boot_timings)
+        boot_timings.append((_depth, self.name, None))
+        _depth += 1
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _depth
+        _depth -= 1
+        elapsed = (time.perf_counter() - self._start) * 1000
+        boot_timings[self._slot] = (_depth, self.name, elapsed)
+        return False
+
+
+def boot_report():
+    """Prints the import/load breakdown recorded so far and returns it."""
+    total = (time.perf_counter() - BOOT_STARTED) * 1000
+    lines = [f"Boot completed in {total:.0f} ms"]
+    for depth, name, elapsed in boot_timings:
+        label = "  " * (depth + 1) + name
+        lines.append(f"{label:<40} {elapsed or 0:8.1f} ms")
+    print("\n".join(lines))
+    return {
+        "total_ms": round(total, 1),
+        "stages": [
+            {"stage": name, "depth": depth, "ms": round(elapsed or 0, 1)}
+            for depth, name, elapsed in boot_timings
+        ],
+    }
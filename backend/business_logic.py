@@ -1,13 +1,18 @@
+import json
 import os
-from typing import List, Dict
-from pydantic import BaseModel, Field
+import re
+from typing import List, Dict, Iterator, Tuple
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.utils.json import parse_partial_json
 from dotenv import load_dotenv
 
 # 1. IMPORT DATA DYNAMICALLY FROM MEMBER A
 from market_gap import get_market_analysis_logic
+from per_process import PerProcess
 
 load_dotenv()
 
@@ -47,7 +52,32 @@ class BusinessPlan(BaseModel):
     implementation_plan: List[ImplementationPhase] = Field(description="4-phase roadmap for launch.")
 
 # --- STEP 2: Updated Generator Logic ---
+# Image-based prompting to follow the "Morning Harvest" template style
+PLAN_PROMPT = (
+    "You are a Senior Business Consultant. Create a detailed, professional business plan "
+    "template for {location} based on the niche '{niche}'.\n\n"
+    "STRICT CONTEXT:\n"
+    "- Market Gap Score: {gap_score} (Higher is better)\n"
+    "- Competitors found in area: {competitors_found}\n\n"
+    "INSTRUCTIONS:\n"
+    "Follow the structure of a professional business plan template. "
+    "Ensure the Financial Overview includes a realistic revenue forecast for the first year. "
+    "The Implementation Plan must be a phased roadmap.\n\n"
+    "{format_instructions}"
+)
+
+# Top-level BusinessPlan fields, in the order the model writes them
+PLAN_SECTIONS = tuple(BusinessPlan.model_fields)
+_SECTION_TYPES = {name: TypeAdapter(field.annotation) for name, field in BusinessPlan.model_fields.items()}
+
+
 class PlanGenerator:
+    """
+    One Gemini client, prompt and parser per process (see get_plan_generator):
+    the format instructions are rendered once and baked into the prompt, and
+    the chain stops at the raw LLM text so it can be parsed incrementally.
+    """
+
     def __init__(self, api_key: str):
         self.llm = ChatGoogleGenerativeAI(
             model="gemini-flash-latest", # Switch to 2.5 to avoid 2.0 quota exhaustion
@@ -56,32 +86,140 @@ class PlanGenerator:
             request_timeout=60
         )
         self.parser = PydanticOutputParser(pydantic_object=BusinessPlan)
-
-    def create_plan(self, data: dict):
-        # Image-based prompting to follow the "Morning Harvest" template style
-        system_msg = (
-            "You are a Senior Business Consultant. Create a detailed, professional business plan "
-            "template for {location} based on the niche '{niche}'.\n\n"
-            "STRICT CONTEXT:\n"
-            "- Market Gap Score: {gap_score} (Higher is better)\n"
-            "- Competitors found in area: {competitors_found}\n\n"
-            "INSTRUCTIONS:\n"
-            "Follow the structure of a professional business plan template. "
-            "Ensure the Financial Overview includes a realistic revenue forecast for the first year. "
-            "The Implementation Plan must be a phased roadmap.\n\n"
-            "{format_instructions}"
+        self.format_instructions = self.parser.get_format_instructions()
+        self.prompt = ChatPromptTemplate.from_template(PLAN_PROMPT).partial(
+            format_instructions=self.format_instructions
         )
+        self.chain = self.prompt | self.llm
 
-        prompt = ChatPromptTemplate.from_template(system_msg)
-        chain = prompt | self.llm | self.parser
-
-        return chain.invoke({
+    @staticmethod
+    def _inputs(data: dict):
+        return {
             "location": data["location"],
             "niche": data["niche"],
             "gap_score": data["gap_score"],
             "competitors_found": data["competitor_count"],
-            "format_instructions": self.parser.get_format_instructions()
-        })
+        }
+
+    def create_plan(self, data: dict) -> BusinessPlan:
+        message = self.chain.invoke(self._inputs(data))
+        return parse_plan(message_text(message))
+
+    def stream_plan(self, data: dict) -> Iterator[Tuple[str, object]]:
+        """
+        Streams the plan as it is written. Yields ("section", (name, value))
+        for each top-level BusinessPlan field once the model has moved past
+        it, then ("plan", BusinessPlan) when the answer is complete.
+        """
+        text = ""
+        sent = set()
+        for chunk in self.chain.stream(self._inputs(data)):
+            text += message_text(chunk)
+            partial = repair_plan_json(text)
+            if not partial:
+                continue
+            # Keys arrive in order: every key but the last one is finished
+            for name in list(partial)[:-1]:
+                section = _section(name, partial[name])
+                if name not in sent and section is not None:
+                    sent.add(name)
+                    yield "section", section
+
+        plan = parse_plan(text)
+        sections = plan.model_dump(mode="json")
+        for name in PLAN_SECTIONS:
+            if name not in sent:
+                yield "section", (name, sections[name])
+        yield "plan", plan
+
+
+def message_text(message) -> str:
+    """Text of an LLM message or chunk, whether its content is a string or a list of parts."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content
+        if isinstance(part, str) or part.get("type") == "text"
+    )
+
+
+def repair_plan_json(text: str):
+    """
+    Best-effort dict from (possibly truncated or slightly malformed) model
+    output: code fences and leading prose are dropped, trailing commas
+    removed, and open strings/brackets closed. None if nothing parses yet.
+    """
+    if "```" in text:
+        text = re.sub(r"^```[a-zA-Z]*\n?", "", text[text.index("```"):]).split("```")[0]
+    start = text.find("{")
+    if start < 0:
+        return None
+    candidate = _strip_trailing_commas(text[start:])
+    try:
+        parsed = parse_partial_json(candidate)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Drops commas that directly precede a closing bracket, leaving string contents untouched."""
+    out = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ",":
+            j = i + 1
+            while j < len(text) and text[j].isspace():
+                j += 1
+            if j < len(text) and text[j] in "}]":
+                continue
+        out.append(ch)
+    return "".join(out)
+
+
+def parse_plan(text: str) -> BusinessPlan:
+    """
+    Parses the complete answer into a BusinessPlan, repairing malformed JSON
+    instead of asking the model again. Raises OutputParserException if the
+    repaired output still does not describe a full plan.
+    """
+    try:
+        return BusinessPlan.model_validate_json(text.strip())
+    except ValidationError:
+        repaired = repair_plan_json(text)
+    try:
+        return BusinessPlan.model_validate(repaired or {})
+    except ValidationError as e:
+        raise OutputParserException(f"Could not parse business plan: {e}", llm_output=text) from e
+
+
+def _section(name, value):
+    adapter = _SECTION_TYPES.get(name)
+    if adapter is None:
+        return None
+    try:
+        return name, adapter.dump_python(adapter.validate_python(value), mode="json")
+    except ValidationError:
+        return None
+
+
+_generator = PerProcess(lambda: PlanGenerator(api_key=os.getenv("GEMINI_API_KEY")))
+
+
+def get_plan_generator() -> PlanGenerator:
+    """The process-wide PlanGenerator (rebuilt after a fork, like the upstream clients)."""
+    return _generator.get()
 
 # --- STEP 3: SEQUENTIAL EXECUTION ---
 if __name__ == "__main__":
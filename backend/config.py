@@ -1,6 +1,6 @@
 import os
+import threading
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 load_dotenv()
 
@@ -11,9 +11,165 @@ print(os.getenv("GEMINI_API_KEY"))
 
 # -------- Geoapify --------
 GEOAPIFY_API_KEY = os.getenv("GEOAPIFY_API_KEY")
-GEOAPIFY_PLACES_URL = "https://api.geoapify.com/v2/places"
-GEOAPIFY_GEOCODE_URL = "https://api.geoapify.com/v1/geocode/search"
-SERPAPI_URL = "https://serpapi.com/search"
+GEOAPIFY_PLACES_URL = os.getenv("GEOAPIFY_PLACES_URL", "https://api.geoapify.com/v2/places")
+GEOAPIFY_GEOCODE_URL = os.getenv("GEOAPIFY_GEOCODE_URL", "https://api.geoapify.com/v1/geocode/search")
+GEOAPIFY_TIMEOUT = float(os.getenv("GEOAPIFY_TIMEOUT", "30"))
+# Categories of a domain are fetched in parallel on one pool per process,
+# at most this many at once across all requests, and the whole fan-out must
+# finish within the deadline (seconds).
+GEOAPIFY_MAX_CONCURRENCY = int(os.getenv("GEOAPIFY_MAX_CONCURRENCY", "8"))
+GEOAPIFY_DOMAIN_DEADLINE = float(os.getenv("GEOAPIFY_DOMAIN_DEADLINE", "45"))
+# "sweep" pulls all categories of a domain (and their subcategories) in one
+# paginated query and splits them locally; "per_category" queries each one.
+GEOAPIFY_FETCH_MODE = os.getenv("GEOAPIFY_FETCH_MODE", "sweep")
+GEOAPIFY_SWEEP_PAGE_SIZE = int(os.getenv("GEOAPIFY_SWEEP_PAGE_SIZE", "500"))
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "10"))
+
+# -------- Upstream HTTP Client (upstream.py) --------
+# Retries apply to 429/5xx and connection errors, with full-jitter backoff
+# of at most UPSTREAM_BACKOFF_MAX seconds. A provider's circuit opens after
+# UPSTREAM_BREAKER_THRESHOLD consecutive failures for the cooldown (seconds).
+# *_HEDGE_AFTER_MS > 0 sends a duplicate request when the first is that slow.
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.25"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "4"))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "16"))
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5"))
+UPSTREAM_BREAKER_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+GEOAPIFY_HEDGE_AFTER_MS = float(os.getenv("GEOAPIFY_HEDGE_AFTER_MS", "0"))
+SERPAPI_HEDGE_AFTER_MS = float(os.getenv("SERPAPI_HEDGE_AFTER_MS", "0"))
+
+# -------- POI Provider --------
+# "geoapify" queries the API, "osm" serves everything (geocoding included)
+# from the bundled OpenStreetMap extracts, "fallback" uses Geoapify and
+# falls back to the extracts when a fetch fails or comes back incomplete.
+POI_PROVIDER = os.getenv("POI_PROVIDER", "geoapify")
+OSM_GEOJSON_PATHS = os.getenv(
+    "OSM_GEOJSON_PATHS", os.path.join("..", "frontend", "public", "businesses.geojson")
+).split(os.pathsep)
+
+# -------- Data Files --------
+RANKER_PATH = "data/ranker_full.pkl"
+LOCATION_MODEL_PATH = "data/xgboost.pkl"
+DATASET_PATH = "data/business_data_final.csv"
+CACHE_DIR = "data/cache"
+# "auto" memory-maps the columnar store written by `python dataset_store.py`
+# when it is present and current, "store" requires it, "csv" always parses.
+DATASET_FORMAT = os.getenv("DATASET_FORMAT", "auto")
+
+# -------- Persistent POI / Geocode / Shop Cache --------
+# Upstream Geoapify results are kept in SQLite. Entries are fresh for the
+# TTL, then served stale (while refreshing in the background) for
+# POI_CACHE_STALE_TTL more seconds. Centers are rounded to
+# POI_CACHE_CENTER_DECIMALS decimal places when building keys.
+POI_CACHE_ENABLED = os.getenv("POI_CACHE_ENABLED", "1") == "1"
+POI_CACHE_PATH = os.getenv("POI_CACHE_PATH", os.path.join(CACHE_DIR, "poi_cache.sqlite3"))
+POI_CACHE_MAX_ENTRIES = int(os.getenv("POI_CACHE_MAX_ENTRIES", "5000"))
+POI_CACHE_TTL = float(os.getenv("POI_CACHE_TTL", str(7 * 24 * 3600)))
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+POI_CACHE_STALE_TTL = float(os.getenv("POI_CACHE_STALE_TTL", str(14 * 24 * 3600)))
+POI_CACHE_CENTER_DECIMALS = int(os.getenv("POI_CACHE_CENTER_DECIMALS", "4"))
+# SerpApi competitor shops per (city, category) share the same store
+SHOP_CACHE_TTL = float(os.getenv("SHOP_CACHE_TTL", str(24 * 3600)))
+SHOP_CACHE_STALE_TTL = float(os.getenv("SHOP_CACHE_STALE_TTL", str(6 * 24 * 3600)))
+
+# -------- AI Insights (insights.py) --------
+# Insight texts are generated off the request path by INSIGHT_WORKERS
+# threads and cached per input row for INSIGHT_CACHE_TTL seconds. A job not
+# finished within INSIGHT_JOB_TIMEOUT seconds is considered lost and may be
+# resubmitted; failures are remembered for INSIGHT_ERROR_TTL seconds.
+INSIGHT_WORKERS = int(os.getenv("INSIGHT_WORKERS", "4"))
+INSIGHT_CACHE_TTL = float(os.getenv("INSIGHT_CACHE_TTL", str(7 * 24 * 3600)))
+INSIGHT_JOB_TIMEOUT = float(os.getenv("INSIGHT_JOB_TIMEOUT", "120"))
+INSIGHT_ERROR_TTL = float(os.getenv("INSIGHT_ERROR_TTL", "30"))
+INSIGHT_STREAM_TIMEOUT = float(os.getenv("INSIGHT_STREAM_TIMEOUT", "60"))
+# Long-polls (?wait=) and SSE streams each hold a request thread while they
+# wait, and serve.py gives a worker only SERVER_THREADS of them. At most
+# INSIGHT_MAX_WAITERS requests per worker may wait at once (keep it well
+# below SERVER_THREADS); beyond that long-polls answer immediately and
+# streams get 503 + Retry-After. A long-poll waits at most
+# INSIGHT_POLL_MAX_WAIT seconds.
+INSIGHT_MAX_WAITERS = int(os.getenv("INSIGHT_MAX_WAITERS", "2"))
+INSIGHT_POLL_MAX_WAIT = float(os.getenv("INSIGHT_POLL_MAX_WAIT", "5"))
+
+# -------- Background Jobs (jobs.py, /api/strategy_jobs) --------
+# Each process runs at most JOB_WORKERS jobs at once with JOB_MAX_QUEUED
+# more waiting. Finished results are reused for identical requests and kept
+# for JOB_RESULT_TTL seconds; a job silent for JOB_STALE_AFTER seconds is
+# assumed lost with its worker.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "32"))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+
+# -------- Strategy Plan Streams (/api/generate_strategy/stream) --------
+# A plan stream runs the market analysis and Gemini generation on its
+# request thread for tens of seconds. At most PLAN_STREAM_MAX_OPEN streams
+# per worker run at once, so together with INSIGHT_MAX_WAITERS they leave
+# most of SERVER_THREADS free; beyond that the stream answers 503 +
+# Retry-After (clients can use /api/strategy_jobs instead).
+PLAN_STREAM_MAX_OPEN = int(os.getenv("PLAN_STREAM_MAX_OPEN", "2"))
+
+# -------- Market-Gap Heatmap (/api/market_gap/heatmap) --------
+HEATMAP_MAX_CELLS = int(os.getenv("HEATMAP_MAX_CELLS", "20000"))
+HEATMAP_MIN_CELL_M = float(os.getenv("HEATMAP_MIN_CELL_M", "100"))
+# Longest side of the box in km; the whole box is one POI download
+HEATMAP_MAX_SPAN_KM = float(os.getenv("HEATMAP_MAX_SPAN_KM", "50"))
+
+# -------- Ring Analysis (/api/market_gap/rings) --------
+RING_MAX_RADII = int(os.getenv("RING_MAX_RADII", "8"))
+# Largest ring in metres; the whole analysis is one fetch at this radius
+RING_MAX_RADIUS_M = float(os.getenv("RING_MAX_RADIUS_M", "5000"))
+
+# -------- Rank Score Cache (/api/predict_location) --------
+# Investment amounts are quantized into buckets of this many lakhs before
+# ranking; set to 0 to cache on the exact amount.
+RANK_CACHE_BUCKET_LAKHS = float(os.getenv("RANK_CACHE_BUCKET_LAKHS", "0.5"))
+RANK_CACHE_SIZE = int(os.getenv("RANK_CACHE_SIZE", "512"))
+RANK_CACHE_TTL = float(os.getenv("RANK_CACHE_TTL", "3600"))
+
+# -------- City Prediction Pipeline (/api/predict_city) --------
+# The prediction runs on the request thread. Competitor shops and insights
+# then run concurrently; each must finish within its deadline (ms from the
+# start of the stages) or the response goes out without it, and the shop
+# search itself is abandoned at its deadline. PIPELINE_WORKERS bounds the
+# stage threads per process.
+PREDICT_CITY_SHOPS_DEADLINE_MS = float(os.getenv("PREDICT_CITY_SHOPS_DEADLINE_MS", "3000"))
+PREDICT_CITY_INSIGHTS_DEADLINE_MS = float(os.getenv("PREDICT_CITY_INSIGHTS_DEADLINE_MS", "500"))
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "32"))
+
+# -------- Batch City Prediction (/api/predict_city/batch) --------
+PREDICT_CITY_BATCH_MAX = int(os.getenv("PREDICT_CITY_BATCH_MAX", "200"))
+# Shop searches for the batch's distinct (city, category) pairs run
+# concurrently on the pipeline pool and share this one deadline; items whose
+# search is still pending come back without shops.
+PREDICT_CITY_BATCH_SHOPS_DEADLINE_MS = float(os.getenv("PREDICT_CITY_BATCH_SHOPS_DEADLINE_MS", "5000"))
+
+# -------- Inference Micro-Batching --------
+# Concurrent ranker / city-model calls are coalesced for up to this many
+# milliseconds and run as one vectorized prediction.
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "1") == "1"
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "2"))
+INFERENCE_MAX_BATCH_ROWS = int(os.getenv("INFERENCE_MAX_BATCH_ROWS", "4096"))
+# Feed the boosters NumPy matrices directly instead of building DataFrames.
+FAST_INFERENCE = os.getenv("FAST_INFERENCE", "1") == "1"
+
+# -------- Production Server (serve.py) --------
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "5000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "8"))
+# OpenMP threads each worker's boosters may use per prediction; workers x
+# this should not exceed the core count.
+SERVER_MODEL_THREADS = int(os.getenv("SERVER_MODEL_THREADS", "1"))
+SERVER_KEEPALIVE_TIMEOUT = float(os.getenv("SERVER_KEEPALIVE_TIMEOUT", "5"))
+
+# -------- Model Format --------
+# "auto" loads the native models written by `python model_store.py` when
+# present and intact, "native" requires them, "pickle" always unpickles.
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "auto")
 
 # -------- Business Domains --------
 BUSINESS_DOMAINS = {
@@ -147,8 +303,19 @@ SUBCATEGORY_MAPPING = {
     ]
 }
 
-# -------- Gemini (unused for now) --------
-gemini_model = None
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+# -------- Gemini --------
+# Configured on first use so importing config does not pull in the
+# google.generativeai stack at boot.
+_gemini_model = None
+_gemini_lock = threading.Lock()
+
+
+def get_gemini_model():
+    global _gemini_model
+    if _gemini_model is None and GEMINI_API_KEY:
+        with _gemini_lock:
+            if _gemini_model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+    return _gemini_model
@@ -0,0 +1,141 @@
+"""
+Columnar binary store for the business dataset.
+
+`python dataset_store.py` converts data/business_data_final.csv once into
+one .npy file per column plus a schema.json, with cleaning already applied
+and compact dtypes:
+
+- text columns (City, Business_Category) become categorical codes,
+- integer columns become int32 (Pincode included),
+- float columns become float32 wherever that round-trips every value
+  exactly, float64 otherwise.
+
+load_store() memory-maps the columns read-only, so workers forked from one
+master share the same pages. It refuses a store built from a different CSV,
+and models.py then falls back to parsing the CSV.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from model_store import file_sha256
+
+STORE_DIR = "data/store"
+SCHEMA_NAME = "schema.json"
+FORMAT_VERSION = 1
+
+
+class StaleStoreError(Exception):
+    """The store is missing, unreadable, or was built from a different CSV."""
+
+
+def clean_dataset(data):
+    """Cleaning applied to the raw CSV (Avg_Income arrives with thousands separators)."""
+    if "Avg_Income" in data.columns:
+        data["Avg_Income"] = (
+            data["Avg_Income"].astype(str)  
+            .str.replace(",", "", regex=False)
+            .astype(float)
+        )
+    return data
+
+
+def read_csv_dataset(csv_path):
+    return clean_dataset(pd.read_csv(csv_path))
+
+
+def _compact(series):
+    """Returns (kind, array, categories) for one column."""
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        categories = sorted(series.dropna().unique())
+        codes = pd.Categorical(series, categories=categories).codes
+        dtype = np.int8 if len(categories) < 128 else np.int16 if len(categories) < 32768 else np.int32
+        return "category", codes.astype(dtype), [str(c) for c in categories]
+
+    if pd.api.types.is_integer_dtype(series):
+        values = series.to_numpy()
+        info = np.iinfo(np.int32)
+        if values.min() >= info.min and values.max() <= info.max:
+            return "numeric", values.astype(np.int32), None
+        return "numeric", values, None
+
+    values = series.to_numpy(dtype=np.float64)
+    as_float32 = values.astype(np.float32)
+    if np.array_equal(as_float32.astype(np.float64), values, equal_nan=True):
+        return "numeric", as_float32, None
+    return "numeric", values, None
+
+
+def build_store(csv_path, store_dir=STORE_DIR):
+    """Writes the columnar store for `csv_path` and returns its schema."""
+    data = read_csv_dataset(csv_path)
+    os.makedirs(store_dir, exist_ok=True)
+
+    columns = []
+    for col in data.columns:
+        kind, array, categories = _compact(data[col])
+        filename = f"{len(columns):02d}.npy"
+        np.save(os.path.join(store_dir, filename), np.ascontiguousarray(array))
+        columns.append({
+            "name": col,
+            "file": filename,
+            "kind": kind,
+            "dtype": str(array.dtype),
+            "categories": categories,
+        })
+
+    schema = {
+        "format_version": FORMAT_VERSION,
+        "source": os.path.basename(csv_path),
+        "source_sha256": file_sha256(csv_path),
+        "rows": len(data),
+        "columns": columns,
+    }
+    with open(os.path.join(store_dir, SCHEMA_NAME), "w") as f:
+        json.dump(schema, f, indent=2)
+    return schema
+
+
+def store_available(store_dir=STORE_DIR):
+    return os.path.exists(os.path.join(store_dir, SCHEMA_NAME))
+
+
+def load_store(csv_path, store_dir=STORE_DIR):
+    """Memory-maps the store into a DataFrame; raises StaleStoreError if unusable."""
+    try:
+        with open(os.path.join(store_dir, SCHEMA_NAME)) as f:
+            schema = json.load(f)
+    except (OSError, ValueError) as e:
+        raise StaleStoreError(f"unreadable schema: {e}")
+
+    if schema.get("format_version") != FORMAT_VERSION:
+        raise StaleStoreError(f"unsupported format version {schema.get('format_version')}")
+    if os.path.exists(csv_path) and file_sha256(csv_path) != schema["source_sha256"]:
+        raise StaleStoreError(f"{os.path.basename(csv_path)} changed since the store was built")
+
+    columns = {}
+    for col in schema["columns"]:
+        try:
+            array = np.load(os.path.join(store_dir, col["file"]), mmap_mode="r")
+        except (OSError, ValueError) as e:
+            raise StaleStoreError(f"unreadable column {col['name']}: {e}")
+        if len(array) != schema["rows"]:
+            raise StaleStoreError(f"column {col['name']} has {len(array)} rows, expected {schema['rows']}")
+
+        if col["kind"] == "category":
+            columns[col["name"]] = pd.Categorical.from_codes(array, categories=col["categories"])
+        else:
+            columns[col["name"]] = array
+
+    return pd.DataFrame(columns, copy=False)
+
+
+if __name__ == "__main__":
+    from config import DATASET_PATH
+
+    schema = build_store(DATASET_PATH)
+    print(f"Wrote {schema['rows']} rows to {STORE_DIR}/")
+    for col in schema["columns"]:
+        print(f"  {col['name']:<20} {col['kind']:<9} {col['dtype']}")
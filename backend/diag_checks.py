@@ -0,0 +1,27 @@
+"""
+Shared scaffolding for the diag_* scripts: check() prints one OK/FAIL line
+and records the outcome, run() exits non-zero if any check failed.
+
+    from diag_checks import check, run
+
+    def main():
+        check("cache hit", hits == 1, f"{hits} hit(s)")
+
+    if __name__ == "__main__":
+        run(main)
+"""
+import sys
+
+results = []
+
+
+def check(name, ok, detail=""):
+    results.append(ok)
+    print(f"{'OK  ' if ok else 'FAIL'} {name}{f': {detail}' if detail else ''}")
+    return ok
+
+
+def run(main):
+    """Calls main() and exits with 1 if any check failed, else 0."""
+    main()
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,142 @@
+"""
+Checks the staged /api/predict_city pipeline (pipeline.py) against
+stub_upstream.py: a slow or failing SerpApi search no longer delays or
+fails the response, each stage reports ok/timeout/error with its elapsed
+time, concurrent requests stuck on a slow search still get their
+prediction, the batch endpoint searches each distinct city/category once
+under one deadline, and a healthy request carries the same fields as before.
+
+    python diag_city_pipeline.py
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from diag_checks import check, run
+from stub_upstream import StubUpstream
+
+SHOPS_DEADLINE_MS = 300
+PIPELINE_WORKERS = 2
+stub = StubUpstream().start()
+os.environ["SERPAPI_URL"] = stub.url + "/search"
+os.environ["SERP_API_KEY"] = "stub"
+os.environ["GEMINI_API_KEY"] = ""  # insights answer "unavailable" without calling Gemini
+os.environ["POI_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "poi_cache.sqlite3")
+os.environ["PREDICT_CITY_SHOPS_DEADLINE_MS"] = str(SHOPS_DEADLINE_MS)
+os.environ["PREDICT_CITY_BATCH_SHOPS_DEADLINE_MS"] = str(SHOPS_DEADLINE_MS)
+os.environ["UPSTREAM_MAX_RETRIES"] = "0"
+os.environ["UPSTREAM_BREAKER_THRESHOLD"] = "0"  # keep SerpApi reachable after the slow searches
+os.environ["PIPELINE_WORKERS"] = str(PIPELINE_WORKERS)
+
+import app as api  # noqa: E402  (must see the stub URL and deadlines)
+from upstream import serpapi  # noqa: E402
+
+SEARCH = "/search"
+client = api.app.test_client()
+
+
+def predict(pincode, category="Cafe"):
+    start = time.perf_counter()
+    resp = client.post("/api/predict_city", json={"pincode": str(pincode), "business_category": category})
+    return resp.status_code, resp.get_json(), (time.perf_counter() - start) * 1000
+
+
+def main():
+    pincodes = iter(api.pincode_records)
+
+    status, body, ms = predict(next(pincodes))
+    stages = body["stages"]
+    check("healthy request", status == 200 and all(s["status"] == "ok" for s in stages.values())
+          and body["predicted_category"] and body["shops"], f"{ms:.0f} ms, {stages}")
+    check("payload fields kept", {"city", "predicted_category", "confidence_distribution", "insights",
+                                  "market_analysis", "shops"} <= set(body))
+
+    stub.delays[SEARCH] = [2.0]
+    city_pin = next(p for p in pincodes if api.pincode_records[p]["City"] != body["city"])
+    status, slow, ms = predict(city_pin)
+    check("slow shop search cut at its deadline", status == 200 and slow["stages"]["shops"]["status"] == "timeout"
+          and slow["shops"] == [] and slow["predicted_category"] and ms < SHOPS_DEADLINE_MS + 500, f"{ms:.0f} ms")
+
+    # A request timeout inside the deadline comes back wrapped in an UpstreamError
+    timeout = serpapi.timeout
+    serpapi.timeout = SHOPS_DEADLINE_MS / 3000
+    stub.delays[SEARCH] = [2.0]
+    try:
+        status, timed_out, ms = predict(city_pin, "Gym")
+    finally:
+        serpapi.timeout = timeout
+    check("request timeout reported as timeout", status == 200
+          and timed_out["stages"]["shops"]["status"] == "timeout" and ms < SHOPS_DEADLINE_MS + 500,
+          f"{ms:.0f} ms, {timed_out['stages']['shops']}")
+
+    stub.fail[SEARCH] = [500]
+    status, failed, ms = predict(city_pin, "Bakery")
+    check("failing shop search reported, not a 500", status == 200 and failed["stages"]["shops"]["status"] == "error"
+          and "error" in failed["stages"]["shops"], failed["stages"]["shops"].get("error", ""))
+
+    # More concurrent slow searches than pipeline threads: the prediction
+    # must not queue behind them, and each search must give up at its deadline
+    busy = [p for p in api.pincode_records if api.pincode_records[p]["City"] not in (body["city"], slow["city"])]
+    categories = ["Gym", "Salon", "Pharmacy", "Bookstore", "Clothing", "Bakery"]
+    stub.delays[SEARCH] = [2.0] * len(categories)
+    with ThreadPoolExecutor(len(categories)) as pool:
+        crowd = list(pool.map(predict, busy[:len(categories)], categories))
+    check("prediction arrives while searches are slow", all(
+        status == 200 and resp["predicted_category"] and resp["stages"]["prediction"]["status"] == "ok"
+        for status, resp, _ in crowd
+    ), f"{len(crowd)} requests, {PIPELINE_WORKERS} pipeline threads")
+    stub.delays[SEARCH] = []
+    status, after, ms = predict(busy[len(categories)])
+    check("abandoned searches free the pipeline threads", after["stages"]["shops"]["status"] == "ok" and after["shops"],
+          f"{ms:.0f} ms")
+
+    # Batch: 6 items over 2 distinct (city, category) pairs, one search slow
+    city_pins = [p for p in api.pincode_records if api.pincode_records[p]["City"] == body["city"]]
+    items = [{"pincode": str(p), "business_category": category, "include_shops": True}
+             for p in city_pins[:3] for category in ("Florist", " florist ", "Optician")]
+    before = len(stub.calls_to(SEARCH))
+    stub.delays[SEARCH] = [2.0]
+    start = time.perf_counter()
+    batch = client.post("/api/predict_city/batch", json={"items": items}).get_json()["results"]
+    ms = (time.perf_counter() - start) * 1000
+    stub.delays[SEARCH] = []
+    by_status = {}
+    for item, result in zip(items, batch):
+        by_status.setdefault(result["shops_status"], set()).add(item["business_category"].strip().lower())
+    check("batch searches each distinct pair once", len(stub.calls_to(SEARCH)) - before == 2,
+          f"{len(stub.calls_to(SEARCH)) - before} searches for {len(items)} items")
+    check("batch returns pending pairs without shops", sorted(by_status) == ["ok", "timeout"]
+          and all(len(v) == 1 for v in by_status.values())
+          and all(("shops" in r) == (r["shops_status"] == "ok") and r["predicted_category"] for r in batch)
+          and ms < SHOPS_DEADLINE_MS + 500, f"{ms:.0f} ms, {by_status}")
+
+    invalid = client.post("/api/predict_city/batch", json={"items": [
+        {"pincode": "inf", "business_category": "Cafe"},
+        {"pincode": 1e400, "business_category": "Cafe"},
+        {"pincode": str(city_pins[0]), "business_category": "Cafe"},
+    ]})
+    results = invalid.get_json()["results"]
+    check("non-finite pincodes fail only their item", invalid.status_code == 200
+          and all(r.get("error", "").startswith("Invalid pincode") for r in results[:2])
+          and results[2]["predicted_category"], f"HTTP {invalid.status_code}")
+
+    lookup = api.lookup_viability
+
+    def broken(*args):
+        raise RuntimeError("model unavailable")
+
+    api.lookup_viability = broken
+    try:
+        status, partial, ms = predict(city_pin)
+    finally:
+        api.lookup_viability = lookup
+    check("failed prediction still returns the rest", status == 200 and partial["stages"]["prediction"]["status"] == "error"
+          and partial["predicted_category"] is None and partial["population"] is not None)
+
+    check("unknown pincode still 404", predict(1)[0] == 404)
+    stub.stop()
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,93 @@
+"""
+Parity check for the DataFrame-free inference fast paths in inference.py.
+
+For every row of business_data_final.csv this scores the row with the
+pandas path (location_model.predict_proba / ranked_model.predict on a
+DataFrame) and with the NumPy fast path, and fails if any output differs.
+If native models exist (python model_store.py), they are checked too.
+
+    python diag_fast_path_parity.py
+"""
+import pickle
+import numpy as np
+import pandas as pd
+
+from diag_checks import check, run
+from config import RANKER_PATH, LOCATION_MODEL_PATH
+from models import df, viability_feature_row, TARGET_CUSTOMER_COLUMNS
+from inference import RankerFastPath, ViabilityFastPath
+from model_store import load_native, native_available
+
+# The pandas reference path always comes from the pickles, whatever
+# MODEL_FORMAT the app itself loaded.
+with open(RANKER_PATH, "rb") as f:
+    bundle = pickle.load(f)
+ranked_model = bundle["ranker"]
+feature_names = bundle["features"]
+categorical_columns = bundle["cat_cols"]
+
+with open(LOCATION_MODEL_PATH, "rb") as f:
+    location_model = pickle.load(f)
+
+RTOL = 1e-6
+ATOL = 1e-7
+
+
+def check_close(name, expected, actual):
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    max_diff = float(np.max(np.abs(expected - actual))) if expected.size else 0.0
+    ok = expected.shape == actual.shape and np.allclose(expected, actual, rtol=RTOL, atol=ATOL)
+    check(name, ok, f"{len(expected)} rows, max abs diff {max_diff:.3g}")
+
+
+def viability_parity(fast, source):
+    if fast is None:
+        check(f"viability [{source}]", False, "pipeline layout not supported by the fast path")
+        return
+
+    records = df.to_dict(orient="records")
+    # Each row with its own category, then every row against every known
+    # category plus one the encoder has never seen.
+    for label, categories in [("own category", None), ("all categories", sorted(df["Business_Category"].unique()) + ["Unseen"])]:
+        if categories is None:
+            rows = [viability_feature_row(r, r["Business_Category"]) for r in records]
+        else:
+            rows = [viability_feature_row(r, c) for r in records for c in categories]
+
+        input_df = pd.DataFrame(rows)
+        if "Business_Category" in categorical_columns:
+            input_df["Business_Category"] = input_df["Business_Category"].astype("category")
+        expected = location_model.predict_proba(input_df)
+        check_close(f"viability [{source}] ({label})", expected, fast.predict_rows(rows))
+
+
+def ranker_parity(ranker, source):
+    fast = RankerFastPath.from_ranker(ranker, feature_names, categorical_columns)
+    if fast is None:
+        check(f"ranker [{source}]", False, "booster carries no training categories")
+        return
+
+    for target, ratio_col in TARGET_CUSTOMER_COLUMNS.items():
+        frame = df.copy()
+        frame["target_ratio"] = frame[ratio_col]
+        frame["Residential_density"] = frame["Population"] / frame["Total_Area"]
+        frame["Market_Saturation_Index"] = frame["Population"] / (frame["Competitor_Count"] + 1)
+        for col in categorical_columns:
+            frame[col] = frame[col].astype("category")
+
+        features = frame[feature_names]
+        check_close(f"ranker [{source}] ({target})", ranked_model.predict(features), fast.predict(fast.encode(features)))
+
+
+def main():
+    viability_parity(ViabilityFastPath.from_pipeline(location_model), "pickle")
+    ranker_parity(ranked_model, "pickle")
+    if native_available():
+        native_ranker, _, _, native_city = load_native(RANKER_PATH, LOCATION_MODEL_PATH)
+        viability_parity(native_city, "native")
+        ranker_parity(native_ranker, "native")
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,111 @@
+"""
+Checks the asynchronous insight queue (insights.py) with a slow stand-in
+for the Gemini call: submitting never waits for generation, concurrent and
+repeated submits of one row cost a single call, a second worker sharing the
+cache file joins the running job, and failures are reported but not cached.
+
+    python diag_insights.py
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from diag_checks import check, run
+
+os.environ["POI_CACHE_ENABLED"] = "0"
+
+from insights import InsightQueue, insight_token  # noqa: E402
+from poi_cache import PersistentCache  # noqa: E402
+
+GENERATE_SECONDS = 0.5
+calls = []
+calls_lock = threading.Lock()
+failing = set()
+
+
+def slow_generate(row):
+    with calls_lock:
+        calls.append(row["City"])
+    time.sleep(GENERATE_SECONDS)
+    if row["City"] in failing:
+        raise RuntimeError("quota exceeded")
+    return f"{row['City']} looks promising."
+
+
+class SlowReadCache(PersistentCache):
+    """A shared cache file that answers reads slowly, as under load."""
+
+    def get(self, *args, **kwargs):
+        value = super().get(*args, **kwargs)
+        time.sleep(0.05)
+        return value
+
+
+def row(city, population=100000):
+    return {"City": city, "Population": population, "Rent": 25000.0}
+
+
+def main():
+    cache = PersistentCache(os.path.join(tempfile.mkdtemp(), "insights.sqlite3"))
+    queue = InsightQueue(slow_generate, cache, workers=4, error_ttl=0.5)
+
+    start = time.perf_counter()
+    first = queue.submit(row("Pune"))
+    elapsed = (time.perf_counter() - start) * 1000
+    check("submit returns before generation", first["status"] == "pending" and elapsed < 100,
+          f"{elapsed:.1f} ms")
+
+    with ThreadPoolExecutor(20) as pool:
+        joined = list(pool.map(lambda _: queue.submit(row("Pune")), range(20)))
+    check("concurrent submits join one job", {s["token"] for s in joined} == {first["token"]}
+          and all(s["status"] in ("pending", "ready") for s in joined))
+
+    other_worker = InsightQueue(slow_generate, cache, workers=1)
+    check("another worker joins via the shared cache", other_worker.submit(row("Pune"))["status"] == "pending")
+
+    done = queue.wait(first["token"], 5)
+    check("wait delivers the text", done == {"token": first["token"], "status": "ready", "insights": "Pune looks promising."})
+    check("one generation for 22 submits", calls == ["Pune"], f"{len(calls)} call(s)")
+    check("other worker reads the shared result", other_worker.status(first["token"])["status"] == "ready")
+
+    del calls[:]
+    again = queue.submit(row("Pune"))
+    check("identical row is a cache hit", again["status"] == "ready" and not calls)
+    check("different row, different token",
+          insight_token(row("Pune", 100001)) != first["token"] and insight_token(row("Pune")) == first["token"])
+
+    # Several workers, each with its own connection to a slow shared file,
+    # race on one new row: exactly one of them claims it
+    workers = [InsightQueue(slow_generate, SlowReadCache(cache.path), workers=1) for _ in range(8)]
+    barrier = threading.Barrier(len(workers))
+
+    def race(worker):
+        barrier.wait()
+        return worker.submit(row("Mumbai"))
+
+    del calls[:]
+    with ThreadPoolExecutor(len(workers)) as pool:
+        raced = list(pool.map(race, workers))
+    workers[0].wait(raced[0]["token"], 5)
+    check("racing workers claim a row once", calls == ["Mumbai"]
+          and sum(w.stats()["submitted"] for w in workers) == 1, f"{len(calls)} call(s)")
+
+    del calls[:]
+    failing.add("Nagpur")
+    token = queue.submit(row("Nagpur"))["token"]
+    failed = queue.wait(token, 5)
+    check("failure reported", failed["status"] == "error" and "quota" in failed["error"])
+    check("failure remembered, not retried", queue.submit(row("Nagpur"))["status"] == "error" and calls == ["Nagpur"])
+    time.sleep(0.6)
+    failing.clear()
+    queue.submit(row("Nagpur"))
+    check("retried after the error TTL", queue.wait(token, 5)["status"] == "ready", f"{len(calls)} call(s)")
+
+    check("unknown token", queue.status("0" * 64)["status"] == "unknown")
+    print(f"stats: {queue.stats()}")
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,111 @@
+"""
+Checks the background job queue (jobs.py) with a scripted multi-stage job:
+submit never waits for the work, identical in-flight jobs are joined (also
+from a second queue sharing the store, as another worker would), finished
+results are reused, failures are not, the pool is bounded, and a job whose
+worker went silent is reported lost.
+
+    python diag_jobs.py
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from diag_checks import check, run
+from jobs import JobQueue, JobQueueFull
+
+STAGE_SECONDS = 0.2
+runs = []
+runs_lock = threading.Lock()
+release = threading.Event()
+
+
+def scripted(params, progress):
+    with runs_lock:
+        runs.append(params["location"])
+    for stage in ("fetch", "score", "write"):
+        progress.stage(stage)
+        time.sleep(STAGE_SECONDS)
+    if params["location"] == "fail":
+        raise RuntimeError("upstream down")
+    return {"location": params["location"], "score": 0.8}
+
+
+def blocked(params, progress):
+    progress.stage("fetch")
+    release.wait(10)
+    return {}
+
+
+def wait_done(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.02)
+    return queue.get(job_id)
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+    queue = JobQueue(path, workers=2, max_queued=2, result_ttl=60, stale_after=30)
+    stages = ("fetch", "score", "write")
+
+    start = time.perf_counter()
+    job, created = queue.submit("diag", {"location": "Pune"}, scripted, stages=stages)
+    elapsed = (time.perf_counter() - start) * 1000
+    check("submit returns before the work", created and job["status"] in ("queued", "running") and elapsed < 100,
+          f"{elapsed:.1f} ms")
+
+    with ThreadPoolExecutor(10) as pool:
+        joined = list(pool.map(lambda _: queue.submit("diag", {"location": "Pune"}, scripted, stages=stages), range(10)))
+    check("identical in-flight jobs joined", {j["id"] for j, _ in joined} == {job["id"]} and not any(c for _, c in joined))
+
+    other_worker = JobQueue(path, workers=1)
+    check("another worker joins through the store",
+          other_worker.submit("diag", {"location": "Pune"}, scripted, stages=stages)[0]["id"] == job["id"])
+
+    time.sleep(STAGE_SECONDS * 1.5)
+    running = queue.get(job["id"])
+    check("per-stage progress visible", running["status"] == "running"
+          and [s["status"] for s in running["stages"]][:2] == ["done", "running"], str(running["stages"]))
+
+    done = wait_done(queue, job["id"])
+    check("result stored", done["status"] == "done" and done["result"] == {"location": "Pune", "score": 0.8}
+          and all(s["elapsed_ms"] >= STAGE_SECONDS * 900 for s in done["stages"]))
+    check("one run for 12 submits", runs == ["Pune"], f"{len(runs)} run(s)")
+
+    reused, created = other_worker.submit("diag", {"location": "Pune"}, scripted)
+    check("finished result reused", not created and reused["id"] == job["id"] and runs == ["Pune"])
+
+    failed = wait_done(queue, queue.submit("diag", {"location": "fail"}, scripted, stages=stages)[0]["id"])
+    check("failure recorded", failed["status"] == "error" and failed["error"] == "upstream down"
+          and failed["stages"][-1]["status"] == "error")
+    retried, created = queue.submit("diag", {"location": "fail"}, scripted, stages=stages)
+    check("failed job not reused", created and retried["id"] != failed["id"])
+    wait_done(queue, retried["id"])
+
+    small = JobQueue(path, workers=1, max_queued=1)
+    small.submit("diag", {"n": 1}, blocked)
+    small.submit("diag", {"n": 2}, blocked)
+    try:
+        small.submit("diag", {"n": 3}, blocked)
+        check("pool bounded", False)
+    except JobQueueFull as e:
+        check("pool bounded", True, str(e))
+
+    watcher = JobQueue(path, stale_after=0.3)
+    lost, _ = small.submit("diag", {"n": 1}, blocked)
+    time.sleep(0.4)
+    check("silent job reported lost", watcher.get(lost["id"])["status"] == "error")
+    release.set()
+
+    check("unknown job", queue.get("missing") is None)
+    print(f"stats: {queue.stats()}")
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,93 @@
+"""
+Checks business_logic.PlanGenerator's streaming and JSON repair with a
+scripted stand-in for Gemini that writes a known plan a few characters at
+a time: sections are emitted in order, well before the answer completes,
+and fenced / trailing-comma / prose-wrapped output is repaired instead of
+regenerated.
+
+    python diag_plan_stream.py
+"""
+import json
+import os
+import time
+
+from diag_checks import check, run
+
+os.environ.setdefault("GEMINI_API_KEY", "diag")
+
+from langchain_core.exceptions import OutputParserException  # noqa: E402
+from langchain_core.messages import AIMessageChunk  # noqa: E402
+from langchain_core.runnables import RunnableGenerator  # noqa: E402
+
+from business_logic import PLAN_SECTIONS, PlanGenerator, get_plan_generator  # noqa: E402
+
+CHUNK_CHARS = 40
+CHUNK_SECONDS = 0.01
+MARKET = {"location": "Pune", "niche": "catering.cafe", "gap_score": 0.72, "competitor_count": 14}
+PLAN = {
+    "business_name": "Bean Street",
+    "executive_summary": "A neighbourhood cafe for students and young professionals.",
+    "business_overview": "Warm, minimal design; beans from two local roasters.",
+    "target_market": "18-35 year olds within 2 km.",
+    "location_analysis": "Few cafes near the college gate, heavy evening footfall.",
+    "offerings_and_pricing": "Coffee Rs 120-220, snacks Rs 80-180.",
+    "marketing_and_sales_strategy": "Instagram, campus tie-ups, a stamp card.",
+    "operations_overview": {"Staffing": "6 staff over two shifts", "Suppliers": "Two roasters, one bakery"},
+    "financial_overview": {"Startup Costs": "Rs 18 lakh", "Revenue Forecast": "Rs 60 lakh in year one",
+                           "Profit Margin": "18%"},
+    "implementation_plan": [
+        {"phase": f"Phase {i}", "timeframe": f"Month {i}", "key_activities": [f"Step {i}.1", f"Step {i}.2"]}
+        for i in range(1, 5)
+    ],
+}
+
+
+def scripted(answer):
+    """A generator whose chain writes `answer` like a streaming LLM."""
+    def llm(_prompts):
+        for start in range(0, len(answer), CHUNK_CHARS):
+            time.sleep(CHUNK_SECONDS)
+            yield AIMessageChunk(content=answer[start:start + CHUNK_CHARS])
+
+    generator = PlanGenerator(api_key="diag")
+    generator.chain = generator.prompt | RunnableGenerator(llm)
+    return generator
+
+
+def main():
+    answer = json.dumps(PLAN, indent=2)
+    generator = scripted(answer)
+
+    start = time.perf_counter()
+    events = []
+    for kind, value in generator.stream_plan(MARKET):
+        events.append((time.perf_counter() - start, kind, value))
+    total = events[-1][0]
+    sections = [value for _, kind, value in events if kind == "section"]
+    first = events[0][0]
+
+    check("every section, in order", [name for name, _ in sections] == list(PLAN_SECTIONS))
+    check("sections match the plan", dict(sections) == PLAN)
+    check("first section well before the end", first < total / 4, f"{first * 1000:.0f} ms of {total * 1000:.0f} ms")
+    check("final plan parsed", events[-1][1] == "plan" and events[-1][2].model_dump() == PLAN)
+
+    wrapped = "Here is the plan:\n```json\n" + answer.replace("\n  }", ",\n  }") + "\n```\nGood luck!"
+    check("fenced, prose-wrapped, trailing commas repaired", scripted(wrapped).create_plan(MARKET).model_dump() == PLAN)
+
+    quoted = {**PLAN, "target_market": 'Students, "night owls", ] and }, commuters.'}
+    broken = json.dumps(quoted, indent=2).replace("\n  }", ",\n  }")
+    check("commas inside strings kept", scripted(broken).create_plan(MARKET).model_dump() == quoted)
+
+    truncated = answer[: answer.index('"implementation_plan"')]
+    try:
+        scripted(truncated).create_plan(MARKET)
+        check("truncated plan rejected", False)
+    except OutputParserException:
+        check("truncated plan rejected", True)
+
+    check("instructions rendered once", generator.format_instructions in generator.prompt.partial_variables.values())
+    check("one generator per process", get_plan_generator() is get_plan_generator())
+
+
+if __name__ == "__main__":
+    run(main)
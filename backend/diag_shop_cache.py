@@ -0,0 +1,83 @@
+"""
+Checks the SerpApi competitor-shop cache in services.top_shops
+against stub_upstream.py: concurrent requests for one (city, category),
+whatever their casing, cost a single upstream search, later requests
+cost none, and failed searches are not cached.
+
+    python diag_shop_cache.py
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from diag_checks import check, run
+from stub_upstream import StubUpstream
+
+stub = StubUpstream(latency=0.2).start()
+os.environ["SERPAPI_URL"] = stub.url + "/search"
+os.environ["SERP_API_KEY"] = "stub"
+os.environ["POI_CACHE_ENABLED"] = "1"
+os.environ["POI_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "poi_cache.sqlite3")
+
+from services import _search_shops, top_shops  # noqa: E402  (must see the stub URL)
+from utils import normalize_query, poi_cache  # noqa: E402
+
+SEARCH = "/search"
+
+
+def burst(requests_):
+    """Runs top_shops for every (city, category) at once; returns (results, p99 ms)."""
+    timings = []
+
+    def one(args):
+        start = time.perf_counter()
+        shops = top_shops(*args)
+        timings.append(time.perf_counter() - start)
+        return shops
+
+    with ThreadPoolExecutor(len(requests_)) as pool:
+        shops = list(pool.map(one, requests_))
+    timings.sort()
+    return shops, timings[min(len(timings) - 1, int(0.99 * len(timings)))] * 1000
+
+
+def main():
+    cities = ["Pune", "pune", "  PUNE ", "Pune"] * 5
+    cold, cold_p99 = burst([(city, "Cafe") for city in cities])
+    searches = len(stub.calls_to(SEARCH))
+    check("concurrent misses coalesced", searches == 1, f"{len(cities)} requests, {searches} search(es), p99 {cold_p99:.0f} ms")
+    check("search sent as the normalized query", [c["q"] for c in stub.calls_to(SEARCH)] == ["cafe in pune"])
+    check("same result for every caller", all(shops == cold[0] for shops in cold) and cold[0]["markers"])
+
+    stub.reset()
+    warm, warm_p99 = burst([(city, "Cafe") for city in cities])
+    check("warm requests served from cache", not stub.calls and warm == cold, f"p99 {warm_p99:.1f} ms")
+
+    # Every spelling searches the normalized text, whichever caller ran first
+    direct = _search_shops(normalize_query("Pune"), normalize_query("Cafe"))
+    check("cached payload matches a search for the normalized query", warm[0]["markers"] == direct["markers"][:20]
+          and warm[0]["brand_counts"] == direct["brand_counts"])
+    check("top_n applied on read", len(top_shops("Pune", "Cafe", top_n=3)["markers"]) == 3)
+
+    stub.reset()
+    top_shops("Pune", "Bakery")
+    check("other category is its own entry", len(stub.calls_to(SEARCH)) == 1)
+
+    stub.reset()
+    stub.fail[SEARCH] = [500] * 3
+    try:
+        top_shops("Nagpur", "Cafe")
+        failed = False
+    except Exception:
+        failed = True
+    retried = top_shops("Nagpur", "Cafe")
+    check("failures are not cached", failed and retried["markers"]
+          and len(stub.calls_to(SEARCH)) == 4, f"{len(stub.calls_to(SEARCH))} calls")
+
+    print(f"cache: {poi_cache.stats()['namespaces'].get('shops')}, coalesced {poi_cache.stats()['coalesced']}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,70 @@
+"""
+Counts the upstream requests one market-gap analysis makes.
+
+Runs get_market_analysis_logic for every business domain, in both
+GEOAPIFY_FETCH_MODEs, against stub_upstream.py with the persistent POI
+cache disabled, and fails unless each analysis makes exactly one geocode
+call plus one call per results page it needs, with no request repeated.
+
+    python diag_upstream_calls.py
+"""
+import os
+
+from diag_checks import check, run
+from stub_upstream import StubUpstream
+
+stub = StubUpstream().start()
+os.environ["GEOAPIFY_PLACES_URL"] = stub.url + "/v2/places"
+os.environ["GEOAPIFY_GEOCODE_URL"] = stub.url + "/v1/geocode/search"
+os.environ["POI_CACHE_ENABLED"] = "0"
+
+import utils  # noqa: E402  (must see the stub URLs)
+from config import BUSINESS_DOMAINS, SUBCATEGORY_MAPPING, GEOAPIFY_SWEEP_PAGE_SIZE  # noqa: E402
+from market_gap import get_market_analysis_logic  # noqa: E402
+
+LOCATION = "Colaba, Mumbai"
+RADIUS = 2000
+PLACES = "/v2/places"
+GEOCODE = "/v1/geocode/search"
+
+
+def pages(query, limit):
+    # iter_places stops on a short page, so an exact multiple costs one more
+    lat, lon = stub.center
+    return len(stub.matching(query, lat, lon, RADIUS)) // limit + 1
+
+
+def expected_places_calls(domain, mode, top_cat):
+    categories = BUSINESS_DOMAINS[domain]["categories"]
+    if mode == "sweep":
+        subcategories = [sub for c in categories for sub in SUBCATEGORY_MAPPING.get(c, [])]
+        query = ",".join(dict.fromkeys(categories + subcategories))
+        return pages(query, GEOAPIFY_SWEEP_PAGE_SIZE)
+
+    queries = categories + SUBCATEGORY_MAPPING.get(top_cat, [])
+    return sum(pages(q, 100) for q in queries)
+
+
+def main():
+    for mode in ("sweep", "per_category"):
+        utils.GEOAPIFY_FETCH_MODE = mode
+        for domain in BUSINESS_DOMAINS:
+            stub.reset()
+            package = get_market_analysis_logic(domain, LOCATION)
+
+            geocodes = len(stub.calls_to(GEOCODE))
+            places = len(stub.calls_to(PLACES))
+            want = expected_places_calls(domain, mode, package["major_sector"])
+            keys = [(path, tuple(sorted(params.items()))) for path, params in stub.calls]
+            repeats = len(keys) - len(set(keys))
+
+            check(
+                f"{mode} {domain}", geocodes == 1 and places == want and repeats == 0,
+                f"geocode {geocodes}/1, places {places}/{want}, repeated {repeats}"
+            )
+
+    stub.stop()
+
+
+if __name__ == "__main__":
+    run(main)
@@ -0,0 +1,140 @@
+"""
+Behaviour checks for the shared upstream client (upstream.py) against
+stub_upstream.py: connection reuse, retries with backoff, Retry-After,
+non-retryable errors, the circuit breaker, hedging, deadlines, and that a
+failing Geoapify page now surfaces as an error instead of an under-count.
+
+    python diag_upstream_client.py
+"""
+import os
+import time
+
+from diag_checks import check, run
+from stub_upstream import StubUpstream
+
+stub = StubUpstream().start()
+os.environ["GEOAPIFY_PLACES_URL"] = stub.url + "/v2/places"
+os.environ["GEOAPIFY_GEOCODE_URL"] = stub.url + "/v1/geocode/search"
+os.environ["POI_CACHE_ENABLED"] = "0"
+
+import utils  # noqa: E402  (must see the stub URLs)
+from upstream import CircuitOpenError, UpstreamClient, UpstreamError, geoapify  # noqa: E402
+
+PATH = "/v1/geocode/search"
+
+
+def client(**kwargs):
+    options = dict(max_retries=2, backoff_base=0.01, backoff_max=0.5, breaker_threshold=0)
+    options.update(kwargs)
+    return UpstreamClient("diag", 5, **options)
+
+
+def raises(exc_type, fn):
+    try:
+        fn()
+    except exc_type as e:
+        return e
+    return None
+
+
+def main():
+    url = stub.url + PATH
+
+    stub.reset()
+    c = client()
+    for _ in range(50):
+        c.get(url, params={"text": "x"})
+    check("keep-alive", stub.connections == 1, f"50 requests over {stub.connections} connection(s)")
+
+    stub.reset()
+    stub.fail[PATH] = [503, 502]
+    c = client()
+    c.get(url)
+    s = c.stats()
+    check("retry 5xx", s["retries"] == 2 and s["successes"] == 1, f"{len(stub.calls)} calls, {s['retries']} retries")
+
+    stub.reset()
+    stub.fail[PATH] = [(429, {"Retry-After": "0.3"})]
+    start = time.monotonic()
+    client().get(url)
+    waited = time.monotonic() - start
+    check("429 Retry-After", waited >= 0.3, f"waited {waited:.2f}s")
+
+    stub.reset()
+    stub.fail[PATH] = [503] * 5
+    error = raises(UpstreamError, lambda: client().get(url))
+    check("retries bounded", error is not None and error.status == 503 and len(stub.calls) == 3,
+          f"{len(stub.calls)} calls, then {error!r}")
+
+    stub.reset()
+    stub.fail[PATH] = [401]
+    error = raises(UpstreamError, lambda: client().get(url))
+    check("4xx not retried", error is not None and len(stub.calls) == 1, f"{len(stub.calls)} call(s)")
+
+    stub.reset()
+    stub.fail[PATH] = [500] * 100
+    c = client(max_retries=0, breaker_threshold=3, breaker_cooldown=0.3)
+    for _ in range(3):
+        raises(UpstreamError, lambda: c.get(url))
+    hits = len(stub.calls)
+    refused = raises(CircuitOpenError, lambda: c.get(url))
+    check("breaker opens", hits == 3 and refused is not None and len(stub.calls) == 3,
+          f"state {c.breaker.state}, {c.stats()['short_circuited']} short-circuited")
+    time.sleep(0.35)
+    stub.fail[PATH] = []
+    c.get(url)
+    check("breaker half-open trial closes it", c.breaker.state == "closed", f"{len(stub.calls) - hits} trial call(s)")
+
+    stub.reset()
+    c = client(max_retries=0, breaker_threshold=1, breaker_cooldown=0.05)
+    stub.fail[PATH] = [500]
+    raises(UpstreamError, lambda: c.get(url))
+    time.sleep(0.06)
+    send = c._send
+
+    def broken_send(*args):
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+    c._send = broken_send
+    raises(RuntimeError, lambda: c.get(url))
+    c._send = send
+    time.sleep(0.06)
+    recovered = raises(UpstreamError, lambda: c.get(url)) is None
+    check("unexpected error releases the half-open trial", recovered and c.breaker.state == "closed",
+          f"state {c.breaker.state}")
+
+    stub.reset()
+    stub.delays[PATH] = [1.0]
+    c = client(hedge_after=0.05)
+    start = time.monotonic()
+    c.get(url)
+    elapsed = time.monotonic() - start
+    s = c.stats()
+    check("hedged request", elapsed < 0.5 and s["hedge_wins"] == 1, f"{elapsed * 1000:.0f} ms, {s['hedged']} hedged")
+
+    stub.reset()
+    stub.delays[PATH] = [1.0]
+    start = time.monotonic()
+    error = raises((UpstreamError, TimeoutError), lambda: client(max_retries=5).get(url, deadline=time.monotonic() + 0.2))
+    elapsed = time.monotonic() - start
+    check("deadline respected", error is not None and elapsed < 0.6, f"gave up after {elapsed * 1000:.0f} ms")
+
+    # End to end: a transient page failure no longer truncates pagination...
+    stub.reset()
+    expected = utils.fetch_business_counts("food", "x")
+    stub.reset()
+    stub.fail["/v2/places"] = [503]
+    recovered = utils.fetch_business_counts("food", "x")
+    check("transient page failure recovered", recovered == expected, f"retries {geoapify.stats()['retries']}")
+
+    # ...and a persistent one is raised instead of returning an under-count
+    stub.reset()
+    stub.fail["/v2/places"] = [503] * 10
+    error = raises(UpstreamError, lambda: utils.fetch_business_counts("food", "x"))
+    check("persistent page failure raised", error is not None, repr(error))
+
+    stub.stop()
+
+
+if __name__ == "__main__":
+    run(main)
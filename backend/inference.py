@@ -0,0 +1,268 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from per_process import PerProcess
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent prediction calls for one model into micro-batches.
+
+    Callers hand in a block of rows (a DataFrame or a list of feature dicts)
+    and block until their slice of the result is ready. A single dispatcher
+    thread waits up to `max_wait_ms` after the first queued block for more
+    work, combines everything into one input, runs one vectorized prediction
+    and scatters the rows back to the callers in order.
+    """
+
+    def __init__(self, name, predict_fn, combine, max_batch_rows=4096, max_wait_ms=2.0, enabled=True):
+        self.name = name
+        self.predict_fn = predict_fn
+        self.combine = combine
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        # The queue feeding this process's dispatcher thread
+        self._queue = PerProcess(self._start_worker)
+
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.max_batch_requests = 0
+        self._recent_sizes = deque(maxlen=1000)
+        self._recent_delays = deque(maxlen=1000)
+
+    def predict(self, block):
+        if not self.enabled:
+            return self.predict_fn(self.combine([block]))
+
+        future = Future()
+        self._queue.get().put((block, len(block), time.perf_counter(), future))
+        return future.result()
+
+    def _start_worker(self):
+        q = queue.Queue()
+        threading.Thread(target=self._run, args=(q,), name=f"microbatch-{self.name}", daemon=True).start()
+        return q
+
+    def _run(self, q):
+        while True:
+            batch = [q.get()]
+            rows = batch[0][1]
+            deadline = time.perf_counter() + self.max_wait
+
+            while rows < self.max_batch_rows:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += item[1]
+
+            self._dispatch(batch, rows)
+
+    def _dispatch(self, batch, rows):
+        started = time.perf_counter()
+        try:
+            output = np.asarray(self.predict_fn(self.combine([item[0] for item in batch])))
+            bounds = np.cumsum([item[1] for item in batch])[:-1]
+            parts = np.split(output, bounds)
+        except Exception as e:
+            for item in batch:
+                item[3].set_exception(e)
+            parts = None
+        else:
+            for item, part in zip(batch, parts):
+                item[3].set_result(part)
+
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += rows
+            self.max_batch_requests = max(self.max_batch_requests, len(batch))
+            self._recent_sizes.append(len(batch))
+            self._recent_delays.extend((started - item[2]) * 1000 for item in batch)
+
+    def stats(self):
+        with self._lock:
+            sizes = np.array(self._recent_sizes, dtype=float)
+            delays = np.array(self._recent_delays, dtype=float)
+            return {
+                "enabled": self.enabled,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_batch_rows": self.max_batch_rows,
+                "batches": self.batches,
+                "requests": self.requests,
+                "rows": self.rows,
+                "max_batch_requests": self.max_batch_requests,
+                "mean_batch_requests": round(float(sizes.mean()), 2) if sizes.size else 0.0,
+                "queue_delay_ms": {
+                    "mean": round(float(delays.mean()), 3) if delays.size else 0.0,
+                    "p95": round(float(np.percentile(delays, 95)), 3) if delays.size else 0.0,
+                    "max": round(float(delays.max()), 3) if delays.size else 0.0,
+                },
+            }
+
+
+def concat_lists(blocks):
+    return [row for block in blocks for row in block]
+
+
+# -------------------------------
+# DataFrame-free model fast paths
+# -------------------------------
+def softmax(x):
+    """Row-wise softmax, same arithmetic as scipy.special.softmax(x, axis=1)."""
+    shifted = np.exp(x - np.amax(x, axis=1, keepdims=True))
+    return shifted / np.sum(shifted, axis=1, keepdims=True)
+
+
+class ViabilityFastPath:
+    """
+    Equivalent of location_model.predict_proba that skips pandas entirely.
+
+    The pipeline's StandardScaler and OneHotEncoder are replayed on a
+    preallocated float64 matrix, and the XGBoost booster is called directly
+    through inplace_predict. Use from_pipeline(), which returns None for a
+    pipeline layout this class does not know how to replay.
+    """
+
+    def __init__(self, numeric_columns, mean, scale, categorical_column, categories, booster, softmax_output):
+        self.numeric_columns = numeric_columns
+        self.mean = mean
+        self.scale = scale
+        self.categorical_column = categorical_column
+        self.category_slots = {cat: i for i, cat in enumerate(categories)}
+        self.n_numeric = len(numeric_columns)
+        self.n_features = self.n_numeric + len(categories)
+        self.booster = booster
+        self.softmax_output = softmax_output
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        try:
+            pre = pipeline.named_steps["preprocessor"]
+            clf = pipeline.named_steps["classifier"]
+            transformers = {name: (step, cols) for name, step, cols in pre.transformers_}
+            scaler, numeric_columns = transformers["num"]
+            encoder, cat_columns = transformers["cat"]
+        except (AttributeError, KeyError, ValueError):
+            return None
+
+        if (type(scaler).__name__ != "StandardScaler" or type(encoder).__name__ != "OneHotEncoder"
+                or len(cat_columns) != 1 or encoder.handle_unknown != "ignore"
+                or getattr(encoder, "drop_idx_", None) is not None
+                or getattr(pre, "sparse_output_", False)
+                or set(transformers) - {"num", "cat", "remainder"}):
+            return None
+
+        return cls(
+            numeric_columns=list(numeric_columns),
+            mean=scaler.mean_ if scaler.with_mean else 0.0,
+            scale=scaler.scale_ if scaler.with_std else 1.0,
+            categorical_column=list(cat_columns)[0],
+            categories=list(encoder.categories_[0]),
+            booster=clf.get_booster(),
+            softmax_output=clf.objective == "multi:softmax",
+        )
+
+    def to_params(self):
+        """Preprocessing parameters as plain JSON types (the booster is stored separately)."""
+        return {
+            "numeric_columns": self.numeric_columns,
+            "mean": np.broadcast_to(self.mean, self.n_numeric).tolist(),
+            "scale": np.broadcast_to(self.scale, self.n_numeric).tolist(),
+            "categorical_column": self.categorical_column,
+            "categories": list(self.category_slots),
+            "softmax_output": self.softmax_output,
+        }
+
+    @classmethod
+    def from_params(cls, params, booster):
+        return cls(
+            numeric_columns=params["numeric_columns"],
+            mean=np.array(params["mean"], dtype=np.float64),
+            scale=np.array(params["scale"], dtype=np.float64),
+            categorical_column=params["categorical_column"],
+            categories=params["categories"],
+            booster=booster,
+            softmax_output=params["softmax_output"],
+        )
+
+    def encode(self, feature_rows):
+        X = np.zeros((len(feature_rows), self.n_features), dtype=np.float64)
+        numeric = X[:, :self.n_numeric]
+        for i, row in enumerate(feature_rows):
+            numeric[i] = [row[col] for col in self.numeric_columns]
+            slot = self.category_slots.get(row[self.categorical_column])
+            if slot is not None:
+                X[i, self.n_numeric + slot] = 1.0
+        numeric -= self.mean
+        numeric /= self.scale
+        return X
+
+    def predict_proba(self, X):
+        if self.softmax_output:
+            return softmax(self.booster.inplace_predict(X, predict_type="margin"))
+        return self.booster.inplace_predict(X)
+
+    def predict_rows(self, feature_rows):
+        return self.predict_proba(self.encode(feature_rows))
+
+
+class RankerFastPath:
+    """
+    Equivalent of ranked_model.predict on a float64 matrix.
+
+    Categorical columns are mapped to the codes LightGBM saw in training (the
+    booster's stored pandas categories); unknown values become NaN exactly as
+    in LightGBM's own pandas conversion. Use from_ranker(), which returns None
+    if the booster does not carry its training categories.
+    """
+
+    def __init__(self, booster, feature_names, category_codes):
+        self.booster = booster
+        self.feature_names = list(feature_names)
+        self.category_codes = category_codes
+        self.num_threads = None
+
+    @classmethod
+    def from_ranker(cls, ranker, feature_names, categorical_columns):
+        # Accepts the sklearn LGBMRanker or a bare lightgbm.Booster
+        booster = getattr(ranker, "booster_", ranker)
+        if not hasattr(booster, "pandas_categorical"):
+            return None
+        categorical = [col for col in feature_names if col in categorical_columns]
+        stored = booster.pandas_categorical or []
+        if len(stored) != len(categorical):
+            return None
+        category_codes = {
+            col: {value: code for code, value in enumerate(values)}
+            for col, values in zip(categorical, stored)
+        }
+        return cls(booster, feature_names, category_codes)
+
+    def encode(self, frame):
+        X = np.empty((len(frame), len(self.feature_names)), dtype=np.float64)
+        for j, col in enumerate(self.feature_names):
+            codes = self.category_codes.get(col)
+            if codes is None:
+                X[:, j] = frame[col].to_numpy(dtype=np.float64)
+            else:
+                X[:, j] = [codes.get(value, np.nan) for value in frame[col].astype(object)]
+        return X
+
+    def predict(self, X):
+        if self.num_threads:
+            return self.booster.predict(X, num_threads=self.num_threads)
+        return self.booster.predict(X)
@@ -0,0 +1,204 @@
+"""
+Asynchronous, cached Gemini insights for the city prediction endpoints.
+
+An insight is identified by a token: the SHA-256 of its input row. Asking
+for the insight of a row returns at once with
+
+- the text, when it is cached (persistent cache namespace "insights",
+  shared by every worker, live for INSIGHT_CACHE_TTL seconds),
+- otherwise the token, while a bounded background pool calls Gemini; the
+  text is then picked up from GET /api/insights/<token> or streamed from
+  GET /api/insights/<token>/stream.
+
+A row whose insight is already being generated joins that job instead of
+starting another one: directly within a process, and through a short-lived
+"insights_pending" marker across workers. Failures are not cached as
+insights; they are remembered for INSIGHT_ERROR_TTL seconds so a failing
+Gemini is not called once per request.
+
+Without the persistent cache (POI_CACHE_ENABLED=0) all of this lives in the
+memory of the worker that submitted the row, so only a single worker can
+serve GET /api/insights/<token>; serve.py refuses to fork more than one.
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from cache import TTLCache
+from config import (
+    GEMINI_API_KEY,
+    INSIGHT_WORKERS,
+    INSIGHT_CACHE_TTL,
+    INSIGHT_JOB_TIMEOUT,
+    INSIGHT_ERROR_TTL,
+    get_gemini_model
+)
+from per_process import PerProcess
+from services import insight_text
+from utils import make_json_safe, poi_cache
+
+NAMESPACE = "insights"
+PENDING_NAMESPACE = "insights_pending"
+ERROR_NAMESPACE = "insights_error"
+POLL_INTERVAL = 0.25
+
+
+def insight_token(row):
+    """Stable hash of an input row; equal rows give equal tokens."""
+    payload = json.dumps(make_json_safe(dict(row)), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InsightQueue:
+    """
+    Generates `generate(row)` texts on a worker pool and keeps them by token,
+    in `cache` (a PersistentCache) when given, else in process memory.
+    """
+
+    def __init__(self, generate, cache=None, workers=INSIGHT_WORKERS, ttl=INSIGHT_CACHE_TTL,
+                 job_timeout=INSIGHT_JOB_TIMEOUT, error_ttl=INSIGHT_ERROR_TTL, memory_size=2048):
+        self.generate = generate
+        self.cache = cache
+        self.workers = workers
+        self.ttl = ttl
+        self.job_timeout = job_timeout
+        self.error_ttl = error_ttl
+        self._memory = {
+            NAMESPACE: TTLCache(memory_size, ttl),
+            ERROR_NAMESPACE: TTLCache(memory_size, error_ttl),
+        }
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pool = PerProcess(self._start_pool)
+        self._counters = {"submitted": 0, "cache_hits": 0, "joined": 0, "generated": 0, "failures": 0}
+
+    # ---------- storage ----------
+    def _get(self, namespace, token):
+        if self.cache is not None:
+            return self.cache.get(namespace, token)
+        return self._memory[namespace].get(token)
+
+    def _set(self, namespace, token, value, ttl):
+        if self.cache is not None:
+            self.cache.set(namespace, token, value, ttl)
+        else:
+            self._memory[namespace].set(token, value, ttl)
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _start_pool(self):
+        # Jobs started by the parent process are not running here
+        with self._lock:
+            self._jobs = {}
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="insights")
+
+    # ---------- jobs ----------
+    def submit(self, row):
+        """Status of the insight for `row` (see status()), queueing its generation if needed."""
+        token = insight_token(row)
+        text = self._get(NAMESPACE, token)
+        if text is not None:
+            self._count("cache_hits")
+            return {"token": token, "status": "ready", "insights": text}
+
+        error = self._get(ERROR_NAMESPACE, token)
+        if error is not None:
+            return {"token": token, "status": "error", "insights": None, "error": error}
+
+        pool = self._pool.get()
+        with self._lock:
+            joined = token in self._jobs
+        if not joined and self.cache is not None:
+            # Claims the row across workers in one conditional insert; kept
+            # outside self._lock so a slow cache file stalls only this caller
+            joined = not self.cache.add(PENDING_NAMESPACE, token, {"started": time.time()}, self.job_timeout)
+        if not joined:
+            with self._lock:
+                joined = token in self._jobs
+                if not joined:
+                    self._jobs[token] = pool.submit(self._run, token, row)
+        self._count("joined" if joined else "submitted")
+        return {"token": token, "status": "pending", "insights": None}
+
+    def _run(self, token, row):
+        try:
+            text = self.generate(row)
+        except Exception as e:
+            print(f"Insight generation failed for {token[:12]}: {e}")
+            self._count("failures")
+            self._set(ERROR_NAMESPACE, token, str(e), self.error_ttl)
+            raise
+        else:
+            self._count("generated")
+            self._set(NAMESPACE, token, text, self.ttl)
+            return text
+        finally:
+            # The result is stored before the job disappears, so a poll in
+            # between never sees neither
+            if self.cache is not None:
+                self.cache.delete(PENDING_NAMESPACE, token)
+            with self._lock:
+                self._jobs.pop(token, None)
+
+    def status(self, token):
+        """
+        {"token", "status", "insights"} where status is "ready", "pending",
+        "error" (with "error") or "unknown" (never submitted, or expired).
+        """
+        text = self._get(NAMESPACE, token)
+        if text is not None:
+            return {"token": token, "status": "ready", "insights": text}
+        with self._lock:
+            running = token in self._jobs and self._pool.current() is not None
+        if running or (self.cache is not None and self.cache.get(PENDING_NAMESPACE, token) is not None):
+            return {"token": token, "status": "pending", "insights": None}
+        error = self._get(ERROR_NAMESPACE, token)
+        if error is not None:
+            return {"token": token, "status": "error", "insights": None, "error": error}
+        return {"token": token, "status": "unknown", "insights": None}
+
+    def wait(self, token, timeout):
+        """status(token), once it is no longer pending or `timeout` seconds have passed."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            job = self._jobs.get(token) if self._pool.current() is not None else None
+        if job is not None:
+            try:
+                job.result(timeout=timeout)
+            except FutureTimeoutError:
+                pass
+            except Exception:
+                pass  # reported by status()
+
+        status = self.status(token)
+        # Generated by another worker: only the shared cache shows progress
+        while status["status"] == "pending" and time.monotonic() < deadline:
+            time.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            status = self.status(token)
+        return status
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "running": len(self._jobs), "workers": self.workers}
+
+
+def _generate(row):
+    return insight_text(get_gemini_model(), row)
+
+
+insight_queue = InsightQueue(_generate, poi_cache)
+
+
+def insight_fields(row):
+    """
+    Insight fields for a city payload: 'insights' (the text, or None while
+    it is generated), 'insights_token' and 'insights_status'.
+    """
+    if not GEMINI_API_KEY:
+        return {"insights": "AI insights unavailable.", "insights_token": None, "insights_status": "unavailable"}
+    status = insight_queue.submit(row)
+    return {"insights": status["insights"], "insights_token": status["token"], "insights_status": status["status"]}
@@ -0,0 +1,253 @@
+"""
+Background jobs for long analyses (/api/strategy_jobs).
+
+Submitting a job returns at once with its id; a bounded pool (JOB_WORKERS
+threads per process, at most JOB_MAX_QUEUED more waiting) runs it outside
+the request threads and records progress stage by stage. Jobs live in a
+local SQLite file, so any worker can answer a status poll, and:
+
+- a job whose dedupe key matches one that is queued or running is joined
+  instead of started again,
+- a finished result is reused for the same key for JOB_RESULT_TTL seconds,
+  after which the record is deleted,
+- a job that has not reported progress for JOB_STALE_AFTER seconds (its
+  worker died) is marked failed and no longer joined. Queued jobs are
+  touched whenever a job of their process finishes, so waiting in a busy
+  queue does not count as silence.
+
+Failed jobs are never reused; submitting again starts a new run.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JOB_WORKERS, JOB_MAX_QUEUED, JOB_STORE_PATH, JOB_RESULT_TTL, JOB_STALE_AFTER
+from per_process import PerProcess
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id         TEXT PRIMARY KEY,
+    dedupe_key TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    params     TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    stages     TEXT NOT NULL,
+    result     TEXT,
+    error      TEXT,
+    created    REAL NOT NULL,
+    updated    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status);
+"""
+_COLUMNS = "id, dedupe_key, kind, params, status, stages, result, error, created, updated"
+ACTIVE = ("queued", "running")
+
+
+class JobQueueFull(RuntimeError):
+    """Every worker is busy and the wait queue is full."""
+
+
+class JobProgress:
+    """Handed to a job's runner; stage(name) closes the running stage and starts `name`."""
+
+    def __init__(self, queue, job_id, stages):
+        self.queue = queue
+        self.job_id = job_id
+        self.stages = [{"name": name, "status": "pending", "elapsed_ms": None} for name in stages]
+        self._current = None
+        self._started = None
+
+    def _close(self, status):
+        if self._current is not None:
+            self._current["status"] = status
+            self._current["elapsed_ms"] = round((time.perf_counter() - self._started) * 1000, 1)
+            self._current = None
+
+    def stage(self, name):
+        self._close("done")
+        self._current = next((s for s in self.stages if s["name"] == name), None)
+        if self._current is None:
+            self._current = {"name": name, "status": "pending", "elapsed_ms": None}
+            self.stages.append(self._current)
+        self._current["status"] = "running"
+        self._started = time.perf_counter()
+        self.queue._update(self.job_id, status="running", stages=self.stages)
+
+
+class JobQueue:
+
+    def __init__(self, path=JOB_STORE_PATH, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED,
+                 result_ttl=JOB_RESULT_TTL, stale_after=JOB_STALE_AFTER):
+        self.path = path
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        self._local = PerProcess(threading.local)
+        self._lock = threading.Lock()
+        self._pool = PerProcess(self._start_pool)
+        self._outstanding = 0
+        self._waiting = set()
+        self._counters = {"submitted": 0, "joined": 0, "reused": 0, "rejected": 0, "done": 0, "failed": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        local = self._local.get()
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            # Autocommit; check-and-insert runs in an explicit IMMEDIATE transaction
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn = conn
+        return conn
+
+    def _start_pool(self):
+        # Jobs counted by the parent process are not running here
+        with self._lock:
+            self._outstanding = 0
+            self._waiting = set()
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="jobs")
+
+    @staticmethod
+    def _record(row):
+        record = dict(zip(_COLUMNS.split(", "), row))
+        for field in ("params", "stages", "result"):
+            record[field] = json.loads(record[field]) if record[field] is not None else None
+        del record["dedupe_key"]
+        return record
+
+    def _update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        for field in ("stages", "result"):
+            if field in fields:
+                fields[field] = json.dumps(fields[field])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _expire(self, conn, now):
+        conn.execute(
+            "UPDATE jobs SET status = 'error', error = 'Job lost (worker stopped)', updated = ? "
+            "WHERE status IN ('queued', 'running') AND updated < ?",
+            (now, now - self.stale_after),
+        )
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND updated < ?", (now - self.result_ttl,))
+
+    # ---------- public ----------
+    def submit(self, kind, params, run, stages=(), key=None):
+        """
+        Starts run(params, progress) in the background unless a job with the
+        same key is queued, running, or finished recently. Returns
+        (record, created). Raises JobQueueFull when this process is saturated.
+        """
+        key = key if key is not None else json.dumps(params, sort_keys=True)
+        dedupe_key = f"{kind}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+        pool = self._pool.get()
+        now = time.time()
+        conn = self._connect()
+        job_id = None
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._expire(conn, now)
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running', 'done') "
+                "ORDER BY created DESC LIMIT 1",
+                (dedupe_key,),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                record = self._record(row)
+                with self._lock:
+                    self._counters["reused" if record["status"] == "done" else "joined"] += 1
+                return record, False
+
+            with self._lock:
+                if self._outstanding >= self.workers + self.max_queued:
+                    self._counters["rejected"] += 1
+                    conn.execute("ROLLBACK")
+                    raise JobQueueFull(f"{self._outstanding} jobs already queued or running")
+                self._outstanding += 1
+                self._counters["submitted"] += 1
+
+                job_id = uuid.uuid4().hex
+                self._waiting.add(job_id)
+            progress = JobProgress(self, job_id, stages)
+            conn.execute(
+                f"INSERT INTO jobs ({_COLUMNS}) VALUES (?, ?, ?, ?, 'queued', ?, NULL, NULL, ?, ?)",
+                (job_id, dedupe_key, kind, json.dumps(params), json.dumps(progress.stages), now, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if job_id is not None:
+                with self._lock:
+                    self._outstanding -= 1
+                    self._waiting.discard(job_id)
+            raise
+
+        pool.submit(self._run, progress, run, params)
+        return self.get(job_id), True
+
+    def _run(self, progress, run, params):
+        with self._lock:
+            self._waiting.discard(progress.job_id)
+        try:
+            result = run(params, progress)
+        except Exception as e:
+            print(f"Job {progress.job_id} failed: {e}")
+            progress._close("error")
+            self._update(progress.job_id, status="error", stages=progress.stages, error=str(e))
+            with self._lock:
+                self._counters["failed"] += 1
+        else:
+            progress._close("done")
+            for stage in progress.stages:
+                if stage["status"] == "pending":
+                    stage["status"] = "skipped"
+            self._update(progress.job_id, status="done", stages=progress.stages, result=result)
+            with self._lock:
+                self._counters["done"] += 1
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+                waiting = list(self._waiting)
+            if waiting:
+                self._connect().execute(
+                    f"UPDATE jobs SET updated = ? WHERE status = 'queued' AND id IN ({', '.join('?' * len(waiting))})",
+                    (time.time(), *waiting),
+                )
+
+    def get(self, job_id):
+        """The job record (id, kind, params, status, stages, result, error, created, updated) or None."""
+        conn = self._connect()
+        row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = self._record(row)
+        if record["status"] in ACTIVE and time.time() - record["updated"] > self.stale_after:
+            self._expire(conn, time.time())
+            return self.get(job_id)
+        return record
+
+    def stats(self):
+        conn = self._connect()
+        by_status = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        with self._lock:
+            return {
+                **self._counters,
+                "outstanding": self._outstanding if self._pool.current() is not None else 0,
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "stored": by_status,
+            }
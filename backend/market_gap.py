@@ -1,42 +1,139 @@
-from utils import fetch_business_counts, fetch_subcategory_counts, geocode_location
-from config import BUSINESS_DOMAINS, SUBCATEGORY_MAPPING
+import threading
+from concurrent.futures import Future
+
+import time
+
+from utils import (
+    fetch_business_counts, fetch_business_rings, fetch_subcategory_counts,
+    fetch_places_sweep_box, geocode_location, normalize_query
+)
+from spatial import box_span_m, grid_cells, grid_shape, nearest_neighbor_distances
+from config import (
+    BUSINESS_DOMAINS, SUBCATEGORY_MAPPING, GEOAPIFY_DOMAIN_DEADLINE,
+    HEATMAP_MAX_CELLS, HEATMAP_MAX_SPAN_KM, HEATMAP_MIN_CELL_M, RING_MAX_RADII, RING_MAX_RADIUS_M
+)
 import numpy as np
 
+
+class AnalysisContext:
+    """
+    One market-gap analysis: the location geocoded exactly once, plus a
+    request-scoped memo so no upstream call repeats between stages.
+    Concurrent lookups of the same key share one in-flight fetch.
+    """
+
+    def __init__(self, location: str, radius=2000):
+        self.location = location
+        self.radius = radius
+        self._memo = {}
+        self._lock = threading.Lock()
+        self.lat, self.lon = self.memo(
+            ("geocode", normalize_query(location)), lambda: geocode_location(location)
+        )
+
+    @property
+    def center(self):
+        return self.lat, self.lon
+
+    def memo(self, key, fetch):
+        with self._lock:
+            entry = self._memo.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._memo[key] = Future()
+
+        if owner:
+            try:
+                entry.set_result(fetch())
+            except Exception as e:
+                entry.set_exception(e)
+        return entry.result()
+
+
+# Competitor features in the order the gap formula weighs them. Inverted
+# features count against a gap (more competitors means a smaller gap).
+GAP_FEATURES = (
+    ("avg_nearest_neighbor_distance_m", 0.30, False),
+    ("density_per_sq_km", 0.25, True),
+    ("count", 0.20, True),
+    ("saturation_index", 0.15, True),
+    ("category_share", 0.10, True),
+)
+
+
+def gap_feature_array(locations):
+    """
+    Stacks per-location `categories` dicts (as returned by
+    fetch_business_counts, same categories in each) into a
+    (locations x categories x features) array ordered like GAP_FEATURES.
+    Returns (category names, array).
+    """
+    names = list(locations[0])
+    features = np.array(
+        [[[cats[cat][f] for f, _, _ in GAP_FEATURES] for cat in names] for cats in locations],
+        dtype=float
+    ).reshape(len(locations), len(names), len(GAP_FEATURES))
+    return names, features
+
+
+def score_gap_array(features, degenerate=None):
+    """
+    Scores every (location, category) cell of a gap_feature_array in one
+    pass. Each feature is robustly normalized against the 1st/99th
+    percentile of its location's categories, then weighted per GAP_FEATURES.
+    A feature that is constant across a location's categories normalizes to
+    `degenerate` (None keeps the single-location behaviour: NaN).
+    Returns (scores, ranking): both (locations x categories), ranking holds
+    category indices from best to worst gap per location.
+    """
+    features = np.asarray(features, dtype=float)
+    n_locations, n_categories, _ = features.shape
+
+    # Robust normaliztion technique
+    # To reduce the influence of outliers
+    if n_categories < 2:
+        normalized = np.ones_like(features)
+    else:
+        low, high = np.percentile(features, [1, 99], axis=1, keepdims=True)
+        if degenerate is None:
+            normalized = np.clip((features - low) / (high - low), 0, 1)
+        else:
+            spread = high - low
+            scaled = (features - low) / np.where(spread > 0, spread, 1)
+            normalized = np.where(spread > 0, np.clip(scaled, 0, 1), degenerate)
+
+    scores = np.zeros((n_locations, n_categories))
+    for f, (_, weight, inverted) in enumerate(GAP_FEATURES):
+        scores += weight * (1 - normalized[..., f] if inverted else normalized[..., f])
+
+    ranking = np.argsort(-scores, axis=1, kind="stable")
+    return scores, ranking
+
+
 def calculate_market_gap_scores(categories):
     """Calculates gap scores using percentile normalization."""
     if not categories: return {}
-    
-    counts = np.array([v["count"] for v in categories.values()], dtype=float)
-    densities = np.array([v["density_per_sq_km"] for v in categories.values()], dtype=float)
-    distances = np.array([v["avg_nearest_neighbor_distance_m"] for v in categories.values()], dtype=float)
-    saturations = np.array([v["saturation_index"] for v in categories.values()], dtype=float)
-    shares = np.array([v["category_share"] for v in categories.values()], dtype=float)
-    
-    # Robust normaliztion technique
-    # To reduce the influence of outliers
-    def pnorm(arr, val):
-        if len(arr) < 2: return 1.0
-        p = np.percentile(arr, [1, 99])
-        return np.clip((val - p[0]) / (p[1] - p[0]), 0, 1)
-
-    scores = {}
-    for cat, d in categories.items():
-        n_count = 1 - pnorm(counts, d["count"])
-        n_density = 1 - pnorm(densities, d["density_per_sq_km"])
-        n_distance = pnorm(distances, d["avg_nearest_neighbor_distance_m"])
-        n_saturation = 1 - pnorm(saturations, d["saturation_index"])
-        n_share = 1 - pnorm(shares, d["category_share"])
-
-        gap_score = (0.30 * n_distance + 0.25 * n_density + 0.20 * n_count + 
-                     0.15 * n_saturation + 0.10 * n_share)
-        scores[cat] = round(gap_score, 3)
-    return scores
+
+    names, features = gap_feature_array([categories])
+    scores, _ = score_gap_array(features)
+    return {cat: round(score, 3) for cat, score in zip(names, scores[0])}
 
 # market_gap.py additions
-def get_market_analysis_logic(domain: str, location: str):
-    """Programmatic version of market analysis for API use."""
+def get_market_analysis_logic(domain: str, location: str, context=None, progress=None):
+    """
+    Programmatic version of market analysis for API use. `progress(stage)`,
+    if given, is called as the "geocode", "categories" and "subcategories"
+    stages start.
+    """
+    progress = progress or (lambda stage: None)
+    progress("geocode")
+    context = context or AnalysisContext(location)
+
     # 1. Fetch and Score Major Categories
-    result = fetch_business_counts(domain, location)
+    progress("categories")
+    result = fetch_business_counts(
+        domain, location, radius=context.radius, center=context.center, memo=context.memo
+    )
     gap_scores = calculate_market_gap_scores(result["categories"])
     ranked = sorted(gap_scores.items(), key=lambda x: x[1], reverse=True)
     
@@ -44,12 +141,20 @@ def get_market_analysis_logic(domain: str, location: str):
     top_score = ranked[0][1]
 
     # 2. Subcategory Deep Dive
+    progress("subcategories")
     niche_name = top_cat
     comp_count = result["categories"][top_cat]["count"]
 
     if top_cat in SUBCATEGORY_MAPPING:
-        lat, lon = geocode_location(location)
-        sub_results = fetch_subcategory_counts(SUBCATEGORY_MAPPING[top_cat], lat, lon)
+        swept = result.get("subcategory_counts")
+        if swept is not None:
+            # Already counted by the single-sweep fetch
+            sub_results = {sub: swept[sub] for sub in SUBCATEGORY_MAPPING[top_cat]}
+        else:
+            sub_results = fetch_subcategory_counts(
+                SUBCATEGORY_MAPPING[top_cat], context.lat, context.lon,
+                radius=context.radius, memo=context.memo
+            )
         if sub_results:
             recommended_sub = min(sub_results, key=sub_results.get)
             niche_name = recommended_sub.split('.')[-1].replace('_', ' ').title()
@@ -65,6 +170,131 @@ def get_market_analysis_logic(domain: str, location: str):
         "status": "High Opportunity" if top_score >= 0.75 else "Moderate"
     }
 
+def get_ring_analysis(domain: str, location: str, radii=(500, 1000, 2000), context=None):
+    """
+    Market-gap metrics and scores for concentric rings around `location`,
+    all derived from one fetch at the largest radius. `gradient` lists each
+    category's saturation index from the innermost ring outwards.
+    """
+    try:
+        radii = sorted({float(r) for r in radii})
+    except (TypeError, ValueError):
+        raise ValueError("'radii' must be a list of numbers")
+    if not radii or radii[0] <= 0:
+        raise ValueError("'radii' must be positive")
+    if len(radii) > RING_MAX_RADII:
+        raise ValueError(f"At most {RING_MAX_RADII} radii per request")
+    if radii[-1] > RING_MAX_RADIUS_M:
+        raise ValueError(f"'radii' must be at most {RING_MAX_RADIUS_M:g} m")
+    radii = [int(r) if r.is_integer() else r for r in radii]
+
+    context = context or AnalysisContext(location, radius=radii[-1])
+    rings = fetch_business_rings(domain, location, radii, center=context.center, memo=context.memo)
+
+    names, features = gap_feature_array([ring["categories"] for ring in rings])
+    scores, _ = score_gap_array(features)
+
+    for ring, ring_scores in zip(rings, scores):
+        ring["gap_scores"] = {cat: round(score, 3) for cat, score in zip(names, ring_scores)}
+        top_cat, top_score = sorted(ring["gap_scores"].items(), key=lambda x: x[1], reverse=True)[0]
+        ring["top_category"] = top_cat
+        ring["top_gap_score"] = top_score
+
+    return {
+        "domain": domain,
+        "location": location,
+        "radii": radii,
+        "rings": rings,
+        "gradient": {
+            cat: [ring["categories"][cat]["saturation_index"] for ring in rings] for cat in names
+        }
+    }
+
+def get_market_gap_heatmap(domain: str, bbox, cell_size_m=500, include_categories=False):
+    """
+    Market-gap scores over a grid covering bbox = (west, south, east, north).
+    The domain's POIs for the whole box are downloaded once and binned into
+    cells; each cell gets the usual per-category features (a POI's
+    nearest-neighbour distance is measured to any competitor of its category
+    in the box, not just inside its cell) and is scored like one location.
+    Grids are row-major from the south-west corner; cells with no POIs of
+    the domain score None.
+    """
+    if domain not in BUSINESS_DOMAINS:
+        raise ValueError("Invalid business domain")
+    try:
+        west, south, east, north = (float(v) for v in bbox)
+        cell_size_m = float(cell_size_m)
+    except (TypeError, ValueError):
+        raise ValueError("'bbox' must be [west, south, east, north] and 'cell_size_m' a number")
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise ValueError("'bbox' must be [west, south, east, north] with west < east and south < north")
+    if cell_size_m < HEATMAP_MIN_CELL_M:
+        raise ValueError(f"'cell_size_m' must be at least {HEATMAP_MIN_CELL_M}")
+
+    bbox = (west, south, east, north)
+    span_km = max(box_span_m(bbox)) / 1000
+    if span_km > HEATMAP_MAX_SPAN_KM:
+        raise ValueError(f"'bbox' spans {span_km:.0f} km, at most {HEATMAP_MAX_SPAN_KM:g} km allowed")
+    rows, cols, dlat, dlon = grid_shape(bbox, cell_size_m)
+    if rows * cols > HEATMAP_MAX_CELLS:
+        raise ValueError(f"{rows} x {cols} cells requested, at most {HEATMAP_MAX_CELLS} allowed")
+
+    categories = BUSINESS_DOMAINS[domain]["categories"]
+    swept = fetch_places_sweep_box(categories, bbox, time.monotonic() + GEOAPIFY_DOMAIN_DEADLINE)
+
+    n_cells = rows * cols
+    counts = np.zeros((n_cells, len(categories)))
+    nn_sums = np.zeros((n_cells, len(categories)))
+    for k, category in enumerate(categories):
+        points = np.array(list(swept[category].values()), dtype=float).reshape(-1, 2)
+        cells = grid_cells(points, bbox, rows, cols, dlat, dlon)
+        inside = cells >= 0
+        counts[:, k] = np.bincount(cells[inside], minlength=n_cells)
+        nn_sums[:, k] = np.bincount(
+            cells[inside], weights=nearest_neighbor_distances(points)[inside], minlength=n_cells
+        )
+
+    area_sq_km = (cell_size_m / 1000) ** 2
+    totals = counts.sum(axis=1)
+    density = counts / area_sq_km
+    nn_distance = np.divide(nn_sums, counts, out=np.zeros_like(nn_sums), where=counts > 0)
+    by_feature = {
+        "count": counts,
+        "density_per_sq_km": density,
+        "avg_nearest_neighbor_distance_m": nn_distance,
+        "saturation_index": density / (nn_distance + 1),
+        "category_share": counts / np.maximum(totals, 1)[:, None],
+    }
+    features = np.stack([by_feature[f] for f, _, _ in GAP_FEATURES], axis=-1)
+
+    # Sparse cells often tie on a feature; treat that feature as neutral
+    scores, ranking = score_gap_array(features, degenerate=0.5)
+    occupied = totals > 0
+    best = ranking[:, 0]
+    best_score = scores[np.arange(n_cells), best]
+
+    def grid(values, empty=None):
+        values = [v if ok else empty for v, ok in zip(values, occupied)]
+        return [values[r * cols:(r + 1) * cols] for r in range(rows)]
+
+    heatmap = {
+        "domain": domain,
+        "bbox": [west, south, east, north],
+        "cell_size_m": cell_size_m,
+        "cell_deg": [dlat, dlon],
+        "rows": rows,
+        "cols": cols,
+        "categories": categories,
+        "poi_count": int(sum(len(swept[c]) for c in categories)),
+        "gap_score": grid(np.round(best_score, 3).tolist()),
+        "best_category": grid(best.tolist()),
+        "count": grid(totals.astype(int).tolist(), empty=0),
+    }
+    if include_categories:
+        heatmap["category_scores"] = grid(np.round(scores, 3).tolist())
+    return heatmap
+
 def run_app():
     # Phase 1: Member A's task
     market_data = get_market_analysis_logic()
@@ -0,0 +1,125 @@
+"""
+Native model artifacts for fast worker start-up.
+
+The pickled models in data/ are converted once into the boosters' own
+formats (LightGBM text model, XGBoost UBJSON) plus the city pipeline's
+preprocessing parameters as JSON. A manifest records the SHA-256 of every
+artifact and of the source pickles, and load_native() refuses artifacts
+that were modified or converted from different pickles.
+
+    python model_store.py        # (re)convert data/*.pkl into data/native/
+"""
+import hashlib
+import json
+import os
+import pickle
+
+from boot import boot_stage
+from inference import ViabilityFastPath
+
+NATIVE_DIR = "data/native"
+MANIFEST_NAME = "manifest.json"
+RANKER_FILE = "ranker.txt"
+CITY_MODEL_FILE = "city_model.ubj"
+CITY_PREPROCESS_FILE = "city_preprocess.json"
+FORMAT_VERSION = 1
+
+
+class ModelIntegrityError(Exception):
+    """Native artifacts are missing, modified, or stale relative to the pickles."""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def native_available(native_dir=NATIVE_DIR):
+    return os.path.exists(os.path.join(native_dir, MANIFEST_NAME))
+
+
+def convert(ranker_path, location_model_path, native_dir=NATIVE_DIR):
+    """Writes native artifacts for the given pickles and returns the manifest."""
+    with open(ranker_path, "rb") as f:
+        bundle = pickle.load(f)
+    with open(location_model_path, "rb") as f:
+        pipeline = pickle.load(f)
+
+    city = ViabilityFastPath.from_pipeline(pipeline)
+    if city is None:
+        raise ValueError("City model pipeline layout cannot be exported to native format")
+
+    os.makedirs(native_dir, exist_ok=True)
+    bundle["ranker"].booster_.save_model(os.path.join(native_dir, RANKER_FILE))
+    city.booster.save_model(os.path.join(native_dir, CITY_MODEL_FILE))
+    with open(os.path.join(native_dir, CITY_PREPROCESS_FILE), "w") as f:
+        json.dump(city.to_params(), f, indent=2)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "features": list(bundle["features"]),
+        "cat_cols": list(bundle["cat_cols"]),
+        "sources": {
+            os.path.basename(ranker_path): file_sha256(ranker_path),
+            os.path.basename(location_model_path): file_sha256(location_model_path),
+        },
+        "files": {
+            name: file_sha256(os.path.join(native_dir, name))
+            for name in (RANKER_FILE, CITY_MODEL_FILE, CITY_PREPROCESS_FILE)
+        },
+    }
+    with open(os.path.join(native_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_native(ranker_path, location_model_path, native_dir=NATIVE_DIR):
+    """
+    Returns (ranker booster, feature names, categorical columns, city fast path)
+    after verifying every artifact hash. Raises ModelIntegrityError otherwise.
+    """
+    try:
+        with open(os.path.join(native_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ModelIntegrityError(f"unreadable manifest: {e}")
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ModelIntegrityError(f"unsupported format version {manifest.get('format_version')}")
+
+    for name, digest in manifest["files"].items():
+        path = os.path.join(native_dir, name)
+        if not os.path.exists(path) or file_sha256(path) != digest:
+            raise ModelIntegrityError(f"{name} is missing or does not match its manifest hash")
+
+    # The pickles stay the source of truth: refuse artifacts converted from
+    # a different version of them.
+    for source in (ranker_path, location_model_path):
+        expected = manifest["sources"].get(os.path.basename(source))
+        if os.path.exists(source) and expected and file_sha256(source) != expected:
+            raise ModelIntegrityError(f"{os.path.basename(source)} changed since conversion; re-run model_store.py")
+
+    with boot_stage("import lightgbm + xgboost"):
+        import lightgbm
+        import xgboost
+
+    with boot_stage("read native artifacts"):
+        ranker = lightgbm.Booster(model_file=os.path.join(native_dir, RANKER_FILE))
+        booster = xgboost.Booster()
+        booster.load_model(os.path.join(native_dir, CITY_MODEL_FILE))
+        with open(os.path.join(native_dir, CITY_PREPROCESS_FILE)) as f:
+            city = ViabilityFastPath.from_params(json.load(f), booster)
+
+    return ranker, manifest["features"], manifest["cat_cols"], city
+
+
+if __name__ == "__main__":
+    from config import RANKER_PATH, LOCATION_MODEL_PATH
+
+    manifest = convert(RANKER_PATH, LOCATION_MODEL_PATH)
+    print(f"Wrote native models to {NATIVE_DIR}/")
+    for name, digest in manifest["files"].items():
+        print(f"  {name:<24} sha256 {digest[:16]}…")
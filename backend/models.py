@@ -1,21 +1,337 @@
+import hashlib
+import os
 import pickle
+import numpy as np
 import pandas as pd
 
-with open("data/ranker_full.pkl", "rb") as f:
-    bundle = pickle.load(f)
-    
-ranked_model = bundle["ranker"]
-feature_names = bundle["features"]
-categorical_columns = bundle["cat_cols"]
+from boot import boot_stage
+from cache import TTLCache
+from config import (
+    RANKER_PATH, LOCATION_MODEL_PATH, DATASET_PATH, CACHE_DIR, MODEL_FORMAT, DATASET_FORMAT,
+    RANK_CACHE_BUCKET_LAKHS, RANK_CACHE_SIZE, RANK_CACHE_TTL,
+    INFERENCE_BATCHING, INFERENCE_MAX_WAIT_MS, INFERENCE_MAX_BATCH_ROWS,
+    FAST_INFERENCE,
+)
+from inference import MicroBatcher, concat_lists, RankerFastPath, ViabilityFastPath
+from model_store import ModelIntegrityError, file_sha256, load_native, native_available
+from dataset_store import StaleStoreError, load_store, read_csv_dataset, store_available
 
-with open("data/xgboost.pkl", "rb") as f:
-    location_model = pickle.load(f)
+ranked_model = None
+# The sklearn pipeline is only unpickled in pickle mode; native mode serves
+# the city model exclusively through viability_fast_path.
+location_model = None
+viability_fast_path = None
 
-df = pd.read_csv("data/business_data_final.csv")
+if MODEL_FORMAT != "pickle" and FAST_INFERENCE and native_available():
+    try:
+        with boot_stage("load native models"):
+            ranked_model, feature_names, categorical_columns, viability_fast_path = load_native(
+                RANKER_PATH, LOCATION_MODEL_PATH
+            )
+    except ModelIntegrityError as e:
+        if MODEL_FORMAT == "native":
+            raise
+        print(f"Native models rejected ({e}); loading pickles instead")
+elif MODEL_FORMAT == "native":
+    raise ModelIntegrityError("MODEL_FORMAT=native needs FAST_INFERENCE=1 and `python model_store.py` output")
 
-if "Avg_Income" in df.columns:
-    df["Avg_Income"] = (
-        df["Avg_Income"].astype(str)  
-        .str.replace(",", "", regex=False)
-        .astype(float)
+if ranked_model is None:
+    with boot_stage("unpickle ranker"):
+        with open(RANKER_PATH, "rb") as f:
+            bundle = pickle.load(f)
+
+    ranked_model = bundle["ranker"]
+    feature_names = bundle["features"]
+    categorical_columns = bundle["cat_cols"]
+
+    with boot_stage("unpickle city model"):
+        with open(LOCATION_MODEL_PATH, "rb") as f:
+            location_model = pickle.load(f)
+
+    # DataFrame-free inference path; None when disabled or when the model
+    # layout is not one the fast path can replay (the pandas path is used then).
+    viability_fast_path = ViabilityFastPath.from_pipeline(location_model) if FAST_INFERENCE else None
+
+ranker_fast_path = (
+    RankerFastPath.from_ranker(ranked_model, feature_names, categorical_columns)
+    if FAST_INFERENCE else None
+)
+
+
+def set_inference_threads(n):
+    """
+    Caps the OpenMP threads each booster uses per prediction call, so N
+    preforked workers do not oversubscribe the cores between them.
+    """
+    if viability_fast_path is not None:
+        viability_fast_path.booster.set_param({"nthread": n})
+    if location_model is not None:
+        location_model.set_params(classifier__n_jobs=n)
+    if ranker_fast_path is not None:
+        ranker_fast_path.num_threads = n
+    if hasattr(ranked_model, "set_params"):
+        ranked_model.set_params(n_jobs=n)
+
+df = None
+if DATASET_FORMAT != "csv" and store_available():
+    try:
+        with boot_stage("map dataset store"):
+            df = load_store(DATASET_PATH)
+    except StaleStoreError as e:
+        if DATASET_FORMAT == "store":
+            raise
+        print(f"Dataset store rejected ({e}); parsing CSV instead")
+elif DATASET_FORMAT == "store":
+    raise StaleStoreError("DATASET_FORMAT=store needs `python dataset_store.py` output")
+
+if df is None:
+    with boot_stage("read dataset csv"):
+        df = read_csv_dataset(DATASET_PATH)
+
+# -------------------------------
+# Pincode index for /api/predict_city and /api/cities
+# -------------------------------
+def build_pincode_index(data):
+    """
+    Maps each pincode to the position of its first row, and keeps a plain-dict
+    record of that row plus the city -> pincodes listing, so lookups are
+    constant-time instead of a boolean scan over the whole frame.
+    """
+    positions = {}
+    for pos, pin in enumerate(data["Pincode"].to_numpy()):
+        positions.setdefault(int(pin), pos)
+
+    records = {pin: data.iloc[pos].to_dict() for pin, pos in positions.items()}
+
+    city_pincodes = {}
+    for pin, record in records.items():
+        city_pincodes.setdefault(record["City"], []).append(str(pin))
+
+    return positions, records, city_pincodes
+
+
+with boot_stage("build pincode index"):
+    pincode_positions, pincode_records, city_pincodes = build_pincode_index(df)
+
+
+# -------------------------------
+# Viability matrix for /api/predict_city
+# -------------------------------
+def viability_feature_row(record, category):
+    """Feature dict the XGBoost city model expects for one pincode record."""
+    return {
+        "Competitor_Count": record.get("Competitor_Count", 0),
+        "Mall_Proximity": record.get("Mall_Proximity", 0),
+        "Footfall_Proxy": record.get("Footfall_Proxy", 0),
+        "Rent": record.get("Rent", 0),
+        "Avg_Income": record.get("Avg_Income", 0),
+        "Residential_density": record["Population"] / max(record["Total_Area"], 1),
+        "Youth_Pop_%": record.get("Youth_Pop_%", 0),
+        "Business_Category": category
+    }
+
+
+def _predict_viability_frame(feature_rows):
+    input_df = pd.DataFrame(feature_rows)
+    if "Business_Category" in categorical_columns:
+        input_df["Business_Category"] = input_df["Business_Category"].astype("category")
+    return location_model.predict_proba(input_df)
+
+
+def _predict_viability_rows(feature_rows):
+    if viability_fast_path is not None:
+        return viability_fast_path.predict_rows(feature_rows)
+    return _predict_viability_frame(feature_rows)
+
+
+viability_batcher = MicroBatcher(
+    "viability", _predict_viability_rows, concat_lists,
+    max_batch_rows=INFERENCE_MAX_BATCH_ROWS, max_wait_ms=INFERENCE_MAX_WAIT_MS,
+    enabled=INFERENCE_BATCHING,
+)
+
+
+def predict_viability(feature_rows):
+    """
+    Low/Medium/High probabilities for a list of feature dicts. Concurrent
+    callers are coalesced into one predict_proba call by viability_batcher.
+    """
+    return viability_batcher.predict(feature_rows)
+
+
+def build_viability_matrix(records, categories):
+    """
+    Scores every (pincode, category) pair in one batched call and returns a
+    dense (n_pincodes, n_categories, 3) array of Low/Medium/High probabilities.
+    The result is cached on disk keyed by the model and dataset hashes.
+    """
+    pincodes = np.array(list(records), dtype=np.int64)
+    categories = np.array(categories, dtype=str)
+
+    key = hashlib.sha256(
+        (file_sha256(LOCATION_MODEL_PATH) + file_sha256(DATASET_PATH)).encode()
+    ).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f"viability_{key}.npz")
+
+    if os.path.exists(cache_path):
+        try:
+            cached = np.load(cache_path)
+            if (np.array_equal(cached["pincodes"], pincodes)
+                    and np.array_equal(cached["categories"], categories)):
+                return cached["proba"]
+        except Exception as e:
+            print(f"Ignoring unreadable viability cache {cache_path}: {e}")
+
+    rows = [
+        viability_feature_row(record, category)
+        for record in records.values()
+        for category in categories
+    ]
+    proba = _predict_viability_rows(rows).reshape(len(pincodes), len(categories), -1)
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        np.savez(cache_path, pincodes=pincodes, categories=categories, proba=proba)
+    except OSError as e:
+        print(f"Could not write viability cache {cache_path}: {e}")
+
+    return proba
+
+
+viability_categories = sorted(df["Business_Category"].unique())
+viability_category_index = {cat: j for j, cat in enumerate(viability_categories)}
+viability_pincode_index = {pin: i for i, pin in enumerate(pincode_records)}
+with boot_stage("build viability matrix"):
+    viability_matrix = build_viability_matrix(pincode_records, viability_categories)
+
+
+def lookup_viability(pincode, category):
+    """Precomputed Low/Medium/High probabilities, or None for unseen combinations."""
+    i = viability_pincode_index.get(pincode)
+    j = viability_category_index.get(category)
+    if i is None or j is None:
+        return None
+    return viability_matrix[i, j]
+
+
+# -------------------------------
+# Candidate index for /api/predict_location
+# -------------------------------
+TARGET_CUSTOMER_COLUMNS = {
+    "youth": "Youth_Pop_%",
+    "female": "Female_Pop_%",
+    "male": "Male_Pop_%",
+}
+
+
+def build_candidate_index(data):
+    """
+    Partitions the dataset by (Business_Category, target_customer) once,
+    with the ranker's derived features and categorical dtypes already in place.
+    """
+    # One shared categorical dtype per column, so partitions can be
+    # concatenated into a single micro-batch for the ranker.
+    dtypes = {
+        col: pd.CategoricalDtype(sorted(data[col].unique()))
+        for col in categorical_columns if col in data.columns
+    }
+
+    index = {}
+    for category, rows in data.groupby("Business_Category", sort=False, observed=True):
+        for target, ratio_col in TARGET_CUSTOMER_COLUMNS.items():
+            part = rows.reset_index(drop=True)
+            part["target_ratio"] = part[ratio_col]
+            part["target_type"] = target
+            part["Residential_density"] = part["Population"] / part["Total_Area"]
+            part["Market_Saturation_Index"] = part["Population"] / (part["Competitor_Count"] + 1)
+
+            for col, dtype in dtypes.items():
+                part[col] = part[col].astype(dtype)
+
+            index[(category, target)] = part
+    return index
+
+
+def build_candidate_features(index):
+    """Ranker input matrices per partition, for the DataFrame-free fast path."""
+    if ranker_fast_path is None:
+        return {}
+    return {key: ranker_fast_path.encode(part[feature_names]) for key, part in index.items()}
+
+
+with boot_stage("build candidate index"):
+    candidate_index = build_candidate_index(df)
+    candidate_features = build_candidate_features(candidate_index)
+INVESTMENT_FEATURE = feature_names.index("Investment_Lakhs")
+
+if ranker_fast_path is not None:
+    ranker_batcher = MicroBatcher(
+        "ranker", ranker_fast_path.predict, np.vstack,
+        max_batch_rows=INFERENCE_MAX_BATCH_ROWS, max_wait_ms=INFERENCE_MAX_WAIT_MS,
+        enabled=INFERENCE_BATCHING,
     )
+else:
+    ranker_batcher = MicroBatcher(
+        "ranker", ranked_model.predict, lambda frames: pd.concat(frames, ignore_index=True),
+        max_batch_rows=INFERENCE_MAX_BATCH_ROWS, max_wait_ms=INFERENCE_MAX_WAIT_MS,
+        enabled=INFERENCE_BATCHING,
+    )
+
+# Rank results are a pure function of (partition, investment), so they are
+# cached per quantized investment bucket. Models and dataset are loaded once
+# per process and never reloaded, so the cache lives exactly as long as the
+# artifacts it was computed from: restarting the server (after replacing the
+# pickles, the CSV, or the native/store exports) is the invalidation boundary.
+rank_cache = TTLCache(maxsize=RANK_CACHE_SIZE, ttl=RANK_CACHE_TTL)
+
+
+def investment_bucket(investment_lakhs):
+    """Returns (bucket_key, representative investment) for the rank cache."""
+    if RANK_CACHE_BUCKET_LAKHS <= 0:
+        return investment_lakhs, investment_lakhs
+    bucket = int(round(investment_lakhs / RANK_CACHE_BUCKET_LAKHS))
+    return bucket, bucket * RANK_CACHE_BUCKET_LAKHS
+
+
+def _partition_features(key, investment_lakhs):
+    if ranker_fast_path is not None:
+        features = candidate_features[key].copy()
+        features[:, INVESTMENT_FEATURE] = investment_lakhs
+        return features
+    features = candidate_index[key][feature_names].copy()
+    features["Investment_Lakhs"] = investment_lakhs
+    return features
+
+
+def _rank_partition(key, investment_lakhs, k):
+    scores = np.asarray(ranker_batcher.predict(_partition_features(key, investment_lakhs)))
+
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return top, scores[top]
+
+
+def top_candidates(category, target_customer, investment_lakhs, k=3):
+    """
+    Ranks one partition of the candidate index for the given investment and
+    returns its top-k rows (highest rank_score first), or None if the
+    (category, target_customer) pair has no candidates.
+    """
+    partition_key = (category, target_customer)
+    part = candidate_index.get(partition_key)
+    if part is None or part.empty:
+        return None
+
+    bucket, bucket_investment = investment_bucket(investment_lakhs)
+    key = (category, target_customer, k, bucket)
+    ranked = rank_cache.get(key)
+    if ranked is None:
+        ranked = _rank_partition(partition_key, bucket_investment, k)
+        rank_cache.set(key, ranked)
+    top, scores = ranked
+
+    result = part.iloc[top].copy()
+    result["Investment_Lakhs"] = investment_lakhs
+    result["rank_score"] = scores
+    return result
@@ -0,0 +1,285 @@
+"""
+Offline POI provider backed by OpenStreetMap GeoJSON extracts.
+
+OsmPoiStore loads one or more extracts (by default the frontend's
+public/businesses.geojson) into flat arrays: one coordinate pair per
+feature (polygons are reduced to their outer-ring centroid), a boolean
+feature x category matrix over the Geoapify category strings used in
+config.BUSINESS_DOMAINS / SUBCATEGORY_MAPPING, and a BallTree on radians
+for radius queries. Its iter_places / iter_places_in_box yield the same
+(props, lat, lon) tuples as the Geoapify iterators in utils.py, so every
+fetch above them works unchanged; POI_PROVIDER picks the source.
+
+    python osm_store.py    # per-category counts and query timings
+"""
+import json
+import threading
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from spatial import EARTH_RADIUS_M, within_box, within_radius
+
+# (OSM key, OSM value) -> Geoapify category. A feature gets every matching
+# category plus all of their parent levels, as Geoapify's `categories` does.
+OSM_TAG_CATEGORIES = {
+    # --- Food & Beverage ---
+    ("amenity", "restaurant"): "catering.restaurant",
+    ("amenity", "cafe"): "catering.cafe",
+    ("amenity", "fast_food"): "catering.fast_food",
+    ("amenity", "food_court"): "catering.food_court",
+    ("amenity", "ice_cream"): "catering.ice_cream",
+    ("shop", "bakery"): "catering.fast_food.bakery",
+    ("shop", "coffee"): "catering.cafe.coffee_shop",
+    ("shop", "tea"): "catering.cafe.tea_house",
+    # --- Retail & Shopping ---
+    ("shop", "supermarket"): "commercial.supermarket",
+    ("shop", "convenience"): "commercial.supermarket.convenience",
+    ("shop", "kiosk"): "commercial.supermarket.kiosk",
+    ("shop", "clothes"): "commercial.clothing.clothes",
+    ("shop", "shoes"): "commercial.clothing.shoes",
+    ("shop", "fashion_accessories"): "commercial.clothing.accessories",
+    ("shop", "bag"): "commercial.clothing.accessories",
+    ("shop", "mall"): "commercial.shopping_mall",
+    ("shop", "department_store"): "commercial.shopping_mall.department_store",
+    ("shop", "boutique"): "commercial.shopping_mall.boutique",
+    ("shop", "books"): "commercial.books",
+    ("shop", "newsagent"): "commercial.books.newsagent",
+    ("shop", "stationery"): "commercial.books.stationery",
+    ("shop", "electronics"): "commercial.elektronics",
+    ("shop", "mobile_phone"): "commercial.elektronics.mobile_phones",
+    ("shop", "computer"): "commercial.elektronics.computers",
+    ("shop", "video_games"): "commercial.elektronics.video_games",
+    ("shop", "chemist"): "commercial.health_and_beauty",
+    ("shop", "cosmetics"): "commercial.health_and_beauty.cosmetics",
+    ("shop", "perfumery"): "commercial.health_and_beauty.cosmetics",
+    ("shop", "optician"): "commercial.health_and_beauty.optician",
+    ("shop", "hairdresser_supply"): "commercial.health_and_beauty.hairdresser_supplies",
+    ("shop", "jewelry"): "commercial.jewelry",
+    ("shop", "watches"): "commercial.jewelry.watch",
+    ("shop", "antiques"): "commercial.jewelry.antiques",
+    # --- Healthcare ---
+    ("amenity", "pharmacy"): "healthcare.pharmacy",
+    ("healthcare", "pharmacy"): "healthcare.pharmacy",
+    ("amenity", "hospital"): "healthcare.hospital",
+    ("healthcare", "hospital"): "healthcare.hospital",
+    ("amenity", "clinic"): "healthcare.clinic",
+    ("amenity", "doctors"): "healthcare.clinic",
+    ("healthcare", "clinic"): "healthcare.clinic",
+    ("amenity", "dentist"): "healthcare.dentist",
+    ("healthcare", "dentist"): "healthcare.dentist",
+    # --- Education ---
+    ("amenity", "school"): "education.school",
+    ("amenity", "college"): "education.college",
+    ("amenity", "university"): "education.university",
+    ("amenity", "library"): "education.library",
+    # --- Professional Services ---
+    ("office", "company"): "office.company",
+    ("office", "coworking"): "office.coworking",
+    ("amenity", "coworking_space"): "office.coworking",
+    ("amenity", "bank"): "service.bank",
+    # --- Personal Services ---
+    ("shop", "hairdresser"): "service.hairdresser",
+    ("shop", "beauty"): "service.beauty",
+    ("shop", "laundry"): "service.laundry",
+    ("shop", "dry_cleaning"): "service.laundry",
+    ("shop", "car_repair"): "service.vehicle",
+    ("amenity", "car_wash"): "service.vehicle",
+    ("shop", "travel_agency"): "service.travel_agency",
+    ("shop", "tailor"): "service.tailor",
+    ("craft", "tailor"): "service.tailor",
+    ("office", "estate_agent"): "service.estate_agent",
+    ("amenity", "social_facility"): "service.social_facility",
+    # --- Hospitality & Stay ---
+    ("tourism", "hotel"): "accommodation.hotel",
+    ("tourism", "hostel"): "accommodation.hostel",
+    ("tourism", "guest_house"): "accommodation.guest_house",
+}
+
+# `cuisine` values (semicolon-separated in OSM) refine a catering category
+CUISINE_SUBCATEGORIES = {
+    "catering.restaurant": {
+        "pizza": "catering.restaurant.pizza",
+        "burger": "catering.restaurant.burger",
+        "italian": "catering.restaurant.italian",
+        "indian": "catering.restaurant.indian",
+        "north_indian": "catering.restaurant.indian",
+        "south_indian": "catering.restaurant.indian",
+        "seafood": "catering.restaurant.seafood",
+        "fish": "catering.restaurant.seafood",
+    },
+    "catering.cafe": {
+        "coffee_shop": "catering.cafe.coffee_shop",
+        "coffee": "catering.cafe.coffee_shop",
+        "tea": "catering.cafe.tea_house",
+    },
+    "catering.fast_food": {
+        "sandwich": "catering.fast_food.sandwich",
+        "chicken": "catering.fast_food.chicken",
+        "bakery": "catering.fast_food.bakery",
+    },
+}
+
+ADDRESS_TAGS = ("name", "name:en", "addr:street", "addr:suburb", "addr:district", "addr:city", "addr:postcode")
+
+
+def osm_categories(tags):
+    """Geoapify category strings (every level) for one feature's OSM tags."""
+    leaves = {OSM_TAG_CATEGORIES[(key, tags[key])] for key in ("amenity", "shop", "tourism", "office", "healthcare", "craft")
+              if (key, tags.get(key)) in OSM_TAG_CATEGORIES}
+
+    for parent, cuisines in CUISINE_SUBCATEGORIES.items():
+        if parent in leaves:
+            for cuisine in str(tags.get("cuisine", "")).split(";"):
+                sub = cuisines.get(cuisine.strip().lower())
+                if sub:
+                    leaves.add(sub)
+
+    levels = set()
+    for leaf in leaves:
+        parts = leaf.split(".")
+        levels.update(".".join(parts[:k]) for k in range(1, len(parts) + 1))
+    return sorted(levels)
+
+
+def _point(geometry):
+    """(lat, lon) of a Point, or the vertex mean of a (Multi)Polygon's first outer ring."""
+    kind, coords = geometry.get("type"), geometry.get("coordinates")
+    if not coords:
+        return None
+    if kind == "Point":
+        ring = [coords]
+    elif kind == "Polygon":
+        ring = coords[0]
+    elif kind == "MultiPolygon":
+        ring = coords[0][0]
+    else:
+        return None
+    lons, lats = zip(*(c[:2] for c in ring))
+    return sum(lats) / len(lats), sum(lons) / len(lons)
+
+
+class OsmPoiStore:
+    """Array-backed, spatially indexed POIs from OSM GeoJSON extracts."""
+
+    def __init__(self, paths):
+        ids, names, points, tag_sets, address = [], [], [], [], []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                collection = json.load(f)
+            for feature in collection.get("features", []):
+                tags = feature.get("properties") or {}
+                categories = osm_categories(tags)
+                point = _point(feature.get("geometry") or {})
+                if not categories or point is None:
+                    continue
+                ids.append(str(tags.get("@id") or feature.get("id") or f"osm{len(ids)}"))
+                names.append(tags.get("name") or tags.get("name:en") or "unknown")
+                points.append(point)
+                tag_sets.append(categories)
+                address.append(" ".join(str(tags[t]) for t in ADDRESS_TAGS if tags.get(t)).lower())
+
+        self.categories = sorted({c for tags in tag_sets for c in tags})
+        column = {c: j for j, c in enumerate(self.categories)}
+        self.membership = np.zeros((len(ids), len(self.categories)), dtype=bool)
+        for i, tags in enumerate(tag_sets):
+            self.membership[i, [column[c] for c in tags]] = True
+
+        self.place_ids = np.array(ids, dtype=object)
+        self.names = np.array(names, dtype=object)
+        self.points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        self.address = address
+        self._column = column
+        self._tree = BallTree(np.radians(self.points), metric="haversine") if len(ids) else None
+
+    def __len__(self):
+        return len(self.place_ids)
+
+    def _props(self, i):
+        return {
+            "place_id": self.place_ids[i],
+            "name": self.names[i],
+            "categories": [self.categories[j] for j in np.flatnonzero(self.membership[i])],
+        }
+
+    def _matching(self, categories, idx):
+        columns = [self._column[c] for c in categories.split(",") if c in self._column]
+        if not columns or not len(idx):
+            return idx[:0]
+        return idx[self.membership[np.ix_(idx, columns)].any(axis=1)]
+
+    def iter_places(self, categories, lat, lon, radius):
+        """(props, lat, lon) for POIs of `categories` (comma-separated) strictly inside the circle."""
+        if self._tree is None:
+            return
+        # The tree prefilters on a slightly larger radius; within_radius
+        # applies the same strict test as the Geoapify path.
+        idx = self._tree.query_radius(np.radians([[lat, lon]]), r=radius * 1.0001 / EARTH_RADIUS_M)[0]
+        idx = self._matching(categories, np.sort(idx))
+        idx = idx[within_radius(lat, lon, self.points[idx], radius)]
+        for i in idx:
+            yield self._props(i), float(self.points[i, 0]), float(self.points[i, 1])
+
+    def iter_places_in_box(self, categories, bbox):
+        """(props, lat, lon) for POIs of `categories` inside bbox = (west, south, east, north)."""
+        idx = self._matching(categories, np.flatnonzero(within_box(self.points, bbox)))
+        for i in idx:
+            yield self._props(i), float(self.points[i, 0]), float(self.points[i, 1])
+
+    def geocode(self, location: str):
+        """
+        Offline geocoding: "lat, lon" is taken as-is, otherwise the median
+        position of POIs whose name/address mentions the most specific part
+        of `location` that matches anything.
+        """
+        parts = [p.strip() for p in str(location).split(",") if p.strip()]
+        try:
+            lat, lon = (float(p) for p in parts)
+            return lat, lon
+        except ValueError:
+            pass
+
+        for part in parts:
+            needle = part.lower()
+            hits = [i for i, text in enumerate(self.address) if needle in text]
+            if hits:
+                lat, lon = np.median(self.points[hits], axis=0)
+                return float(lat), float(lon)
+        raise ValueError("Location not found")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_osm_store():
+    """The process-wide store, loaded from OSM_GEOJSON_PATHS on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from config import OSM_GEOJSON_PATHS
+                _store = OsmPoiStore(OSM_GEOJSON_PATHS)
+    return _store
+
+
+if __name__ == "__main__":
+    import time
+    from config import BUSINESS_DOMAINS, OSM_GEOJSON_PATHS
+
+    start = time.perf_counter()
+    store = get_osm_store()
+    print(f"Loaded {len(store)} POIs from {', '.join(OSM_GEOJSON_PATHS)} in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    lat, lon = store.points.mean(axis=0)
+    for domain, spec in BUSINESS_DOMAINS.items():
+        counts = {c: int(store.membership[:, store._column[c]].sum()) if c in store._column else 0 for c in spec["categories"]}
+        print(f"  {domain:<22} {counts}")
+
+    query = ",".join(c for spec in BUSINESS_DOMAINS.values() for c in spec["categories"])
+    runs = 200
+    start = time.perf_counter()
+    for _ in range(runs):
+        found = sum(1 for _ in store.iter_places(query, lat, lon, 2000))
+    per_query = (time.perf_counter() - start) / runs
+    print(f"2 km query around the centroid: {found} POIs in {per_query * 1e3:.3f} ms")
@@ -0,0 +1,36 @@
+"""
+Process-local lazy state.
+
+serve.py forks its workers after the app is imported, and threads, thread
+pools, sockets and SQLite connections do not survive fork(). Anything of
+that kind is held in a PerProcess: built on first use, and built again the
+first time it is used in a new process.
+
+    _pool = PerProcess(lambda: ThreadPoolExecutor(4))
+    _pool.get().submit(...)
+"""
+import os
+import threading
+
+
+class PerProcess:
+    """factory()'s result, built once per process."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._value = None
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._value = self.factory()
+                    self._pid = pid
+        return self._value
+
+    def current(self, default=None):
+        """The value built in this process, or `default` if there is none yet; never builds."""
+        return self._value if self._pid == os.getpid() else default
@@ -0,0 +1,84 @@
+"""
+Concurrent request stages with per-stage deadlines.
+
+run_stages() starts every stage of a request on a shared bounded pool and
+waits for each one only until its own deadline (seconds from the start of
+the call), so a request takes at most as long as its longest deadline
+rather than the sum of its slowest dependencies. A stage that overruns
+keeps running in the background; its result is dropped, though anything
+it caches still serves the next request. Stages that call third parties
+should also stop at their deadline (the shop search does), so they free
+their pool thread.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import requests
+
+from config import PIPELINE_WORKERS
+from per_process import PerProcess
+
+_pool = PerProcess(lambda: ThreadPoolExecutor(PIPELINE_WORKERS, thread_name_prefix="pipeline"))
+
+
+def _timed_out(error):
+    """True if `error` is, or was caused by, a deadline or request timeout."""
+    while error is not None:
+        if isinstance(error, (TimeoutError, requests.Timeout)):
+            return True
+        error = error.__cause__
+    return False
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    try:
+        return True, fn(), time.perf_counter() - start
+    except Exception as e:
+        return False, e, time.perf_counter() - start
+
+
+def run_inline(name, fn):
+    """
+    Runs fn() on the calling thread, for stages that must not queue behind
+    third-party calls on the shared pool. Returns (value, status) with the
+    same status shape as run_stages(); value is None on error.
+    """
+    ok, value, elapsed = _timed(fn)
+    if ok:
+        return value, {"status": "ok", "elapsed_ms": round(elapsed * 1000, 1)}
+    print(f"Stage '{name}' failed: {value}")
+    return None, {"status": "error", "elapsed_ms": round(elapsed * 1000, 1), "error": str(value)}
+
+
+def run_stages(stages):
+    """
+    Runs `stages`, a list of (name, fn, deadline_seconds), concurrently.
+    Returns (values, status): values maps the name of every stage that
+    finished in time to fn()'s result; status maps every name to
+    {"status": "ok" | "timeout" | "error", "elapsed_ms"[, "error"]}.
+    """
+    pool = _pool.get()
+    start = time.perf_counter()
+    futures = {name: pool.submit(_timed, fn) for name, fn, _ in stages}
+    values, status = {}, {}
+
+    for name, _, deadline in sorted(stages, key=lambda stage: stage[2]):
+        try:
+            ok, value, elapsed = futures[name].result(timeout=max(0.0, start + deadline - time.perf_counter()))
+        except FutureTimeoutError:
+            futures[name].cancel()  # only succeeds if it never started
+            status[name] = {"status": "timeout", "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+            continue
+        if ok:
+            values[name] = value
+            status[name] = {"status": "ok", "elapsed_ms": round(elapsed * 1000, 1)}
+        elif _timed_out(value):
+            # The stage gave up at its own deadline (e.g. UpstreamClient.get),
+            # or its request timed out (wrapped in an UpstreamError)
+            status[name] = {"status": "timeout", "elapsed_ms": round(elapsed * 1000, 1)}
+        else:
+            print(f"Stage '{name}' failed: {value}")
+            status[name] = {"status": "error", "elapsed_ms": round(elapsed * 1000, 1), "error": str(value)}
+
+    return values, {name: status[name] for name, _, _ in stages}
@@ -0,0 +1,303 @@
+"""
+Persistent SQLite cache for upstream POI and geocode lookups.
+
+Entries are JSON values stored under (namespace, key). Each entry has a
+fresh-until time and a stale-until time:
+
+- before fresh-until the cached value is returned as-is,
+- between the two the stale value is returned immediately and one
+  background refresh is started for that key (stale-while-revalidate),
+- after stale-until the entry counts as a miss and is fetched inline.
+
+Concurrent misses for the same key within a process are coalesced: one
+caller fetches and the others wait for its result (single-flight).
+
+The table is bounded to `max_entries` rows, evicting least recently used
+entries first. Every worker shares the one file, so reads stay reads: an
+entry's last-access time is only rewritten once it is `access_resolution`
+seconds old, and the row count is only taken again every `count_every`
+inserts (or once the estimate passes the bound), not on every insert.
+Connections are per thread and per process, so the cache
+is safe to use from request threads and preforked workers.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from per_process import PerProcess
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace   TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    value       TEXT NOT NULL,
+    created     REAL NOT NULL,
+    fresh_until REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+"""
+
+
+class PersistentCache:
+
+    def __init__(self, path, max_entries=5000, refresh_workers=2, access_resolution=60, count_every=64):
+        self.path = path
+        self.max_entries = max_entries
+        self.refresh_workers = refresh_workers
+        self.access_resolution = access_resolution
+        self.count_every = count_every
+        # Rows at the last COUNT(*) plus inserts since; replacements and other
+        # workers' inserts make it approximate, the periodic recount corrects it
+        self._counted = None
+        self._inserts_since_count = 0
+        self._local = PerProcess(threading.local)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._pool = PerProcess(self._start_refresh_pool)
+        self._inflight = PerProcess(dict)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        local = self._local.get()
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn = conn
+        return conn
+
+    def _touch(self, conn, namespace, key, last_access, now):
+        # Eviction only needs LRU order to the nearest access_resolution
+        if now - last_access < self.access_resolution:
+            return
+        with conn:
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+
+    def _start_refresh_pool(self):
+        # Refreshes scheduled by the parent process are not running here
+        with self._lock:
+            self._refreshing = set()
+        return ThreadPoolExecutor(self.refresh_workers, thread_name_prefix="poi-cache-refresh")
+
+    def get_or_fetch(self, namespace, key, fetch, ttl, stale_ttl=0, refresh=None):
+        """
+        Returns the cached value for (namespace, key), calling fetch() on a miss.
+        `refresh` is used instead of `fetch` for background revalidation.
+        """
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, fresh_until, stale_until, last_access FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+
+        if row is not None and now < row[2]:
+            self._touch(conn, namespace, key, row[3], now)
+            if now < row[1]:
+                with self._lock:
+                    self.hits += 1
+            else:
+                with self._lock:
+                    self.stale_hits += 1
+                self._schedule_refresh(namespace, key, refresh or fetch, ttl, stale_ttl)
+            return json.loads(row[0])
+
+        inflight = self._inflight.get()
+        with self._lock:
+            pending = inflight.get((namespace, key))
+            if pending is None:
+                self.misses += 1
+                leader = inflight[(namespace, key)] = Future()
+            else:
+                self.coalesced += 1
+        if pending is not None:
+            return pending.result()
+
+        try:
+            value = fetch()
+            self.set(namespace, key, value, ttl, stale_ttl)
+        except BaseException as e:
+            leader.set_exception(e)
+            raise
+        else:
+            leader.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                inflight.pop((namespace, key), None)
+
+    def _schedule_refresh(self, namespace, key, fetch, ttl, stale_ttl):
+        pool = self._pool.get()
+        with self._lock:
+            if (namespace, key) in self._refreshing:
+                return
+            self._refreshing.add((namespace, key))
+
+        def refresh():
+            try:
+                value = fetch()
+                self.set(namespace, key, value, ttl, stale_ttl)
+                with self._lock:
+                    self.refreshes += 1
+            except Exception as e:
+                print(f"POI cache refresh failed for {namespace}:{key}: {e}")
+                with self._lock:
+                    self.refresh_errors += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard((namespace, key))
+
+        pool.submit(refresh)
+
+    def get(self, namespace, key, default=None):
+        """The stored value for (namespace, key) until its stale-until time, without fetching."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, last_access FROM entries WHERE namespace = ? AND key = ? AND stale_until > ?",
+            (namespace, key, now),
+        ).fetchone()
+        if row is None:
+            return default
+        self._touch(conn, namespace, key, row[1], now)
+        return json.loads(row[0])
+
+    def delete(self, namespace, key):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def set(self, namespace, key, value, ttl, stale_ttl=0):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now, now + ttl, now + ttl + stale_ttl, now),
+            )
+            self._bound_entries(conn)
+
+    def add(self, namespace, key, value, ttl):
+        """
+        Stores value only if (namespace, key) holds no live entry, atomically
+        across threads and processes. Returns True if this call stored it.
+        """
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            # An expired entry does not count; the write lock taken here is
+            # held until the insert commits, so only one caller can win
+            conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ? AND stale_until <= ?",
+                (namespace, key, now),
+            )
+            added = conn.execute(
+                "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now, now + ttl, now + ttl, now),
+            ).rowcount == 1
+            if added:
+                self._bound_entries(conn)
+        return added
+
+    def _bound_entries(self, conn):
+        # Called inside the inserting transaction
+        with self._lock:
+            self._inserts_since_count += 1
+            recount = (
+                self._counted is None
+                or self._inserts_since_count >= self.count_every
+                or self._counted + self._inserts_since_count > self.max_entries
+            )
+            if recount:
+                self._inserts_since_count = 0
+        if not recount:
+            return
+        count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+            count = self.max_entries
+        with self._lock:
+            self._counted = count
+
+    def purge(self, namespace=None):
+        conn = self._connect()
+        with conn:
+            if namespace is None:
+                conn.execute("DELETE FROM entries")
+            else:
+                conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        with self._lock:
+            self._counted = None
+
+    def stats(self, list_entries=False, limit=100):
+        now = time.time()
+        conn = self._connect()
+        namespaces = {}
+        for namespace, fresh, stale, total in conn.execute(
+            "SELECT namespace, SUM(fresh_until > ?), SUM(fresh_until <= ? AND stale_until > ?), COUNT(*) "
+            "FROM entries GROUP BY namespace",
+            (now, now, now),
+        ):
+            namespaces[namespace] = {
+                "entries": total,
+                "fresh": fresh,
+                "stale": stale,
+                "expired": total - fresh - stale,
+            }
+
+        with self._lock:
+            result = {
+                "path": self.path,
+                "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "refreshing": len(self._refreshing),
+                "namespaces": namespaces,
+            }
+
+        if list_entries:
+            result["recent"] = [
+                {
+                    "namespace": namespace,
+                    "key": key,
+                    "age_s": round(now - created, 1),
+                    "fresh_for_s": round(fresh_until - now, 1),
+                    "stale_for_s": round(stale_until - now, 1),
+                }
+                for namespace, key, created, fresh_until, stale_until in conn.execute(
+                    "SELECT namespace, key, created, fresh_until, stale_until FROM entries "
+                    "ORDER BY last_access DESC LIMIT ?",
+                    (limit,),
+                )
+            ]
+        return result
@@ -0,0 +1,150 @@
+"""
+Preforking production entry point.
+
+The master process loads app.py (and with it models.py: dataset, ranker and
+city model) once, binds the listening socket, and forks SERVER_WORKERS
+workers. The workers share the loaded models copy-on-write. Each worker
+serves requests from a bounded pool of SERVER_THREADS threads. The master
+runs its boot-time predictions (the viability matrix, when its cache is
+missing) single-threaded, so no OpenMP pool exists when it forks; each
+worker then raises its boosters to SERVER_MODEL_THREADS, so workers do not
+oversubscribe the cores. The master restarts
+workers that die and forwards SIGTERM/SIGINT to all of them.
+
+    python serve.py --workers 4 --threads 8 --port 5000
+"""
+import argparse
+import gc
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    POI_CACHE_ENABLED, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_THREADS,
+    SERVER_MODEL_THREADS, SERVER_KEEPALIVE_TIMEOUT,
+)
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the LocalInsight API with preforked workers.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="worker processes")
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="request threads per worker")
+    parser.add_argument("--model-threads", type=int, default=SERVER_MODEL_THREADS,
+                        help="OpenMP threads per worker for model inference")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.workers > 1 and not POI_CACHE_ENABLED:
+        # Without the shared cache, insight tokens and texts live only in the
+        # worker that issued them, and a poll landing elsewhere gets "unknown"
+        sys.exit("POI_CACHE_ENABLED=0 keeps AI insights in one worker's memory; run with --workers 1")
+
+    # Must happen before numpy/xgboost/lightgbm are imported: OpenMP reads
+    # these once. Importing models.py may run a full predict_proba (when the
+    # viability matrix is not cached yet), and libgomp does not survive fork()
+    # once it has started worker threads, so the master stays single-threaded.
+    # The workers raise their thread count after fork, in spawn().
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = "1"
+
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class RequestHandler(WSGIRequestHandler):
+        # Idle keep-alive connections release their pool thread after this long
+        timeout = SERVER_KEEPALIVE_TIMEOUT
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """WSGI server that handles connections on a fixed-size thread pool."""
+
+        multithread = True
+
+        def __init__(self, *a, threads, **kw):
+            super().__init__(*a, **kw)
+            self.threads = threads
+            self._pool = None
+
+        def serve_forever(self, poll_interval=0.5):
+            # Created after fork: threads never survive into a child
+            self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix="http")
+            super().serve_forever(poll_interval)
+
+        def process_request(self, request, client_address):
+            self._pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    from app import app
+    from models import set_inference_threads
+
+    server = PooledWSGIServer(args.host, args.port, app, handler=RequestHandler, threads=args.threads)
+
+    # Move everything loaded so far out of the GC's reach, so collections in
+    # the workers do not touch (and un-share) the model pages.
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            set_inference_threads(args.model_threads)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        workers[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(args.workers):
+        spawn(slot)
+    print(f"Serving on http://{args.host}:{server.port} with {args.workers} workers x "
+          f"{args.threads} threads ({args.model_threads} model threads each), master pid {os.getpid()}")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = workers.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"Worker {pid} exited with status {status}; restarting")
+            time.sleep(0.5)
+            spawn(slot)
+
+    server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,36 @@
-import requests
-from config import SERPAPI_KEY, SERPAPI_URL, gemini_model
+from config import SERPAPI_KEY, SERPAPI_URL, SHOP_CACHE_TTL, SHOP_CACHE_STALE_TTL
+from upstream import serpapi
+from utils import normalize_query, poi_cache
 
-def fetch_top_shops(city, category, top_n=20):
+def top_shops(city, category, top_n=20, deadline=None):
+    """
+    Competitor shops for (city, category) from SerpApi Google Maps. Results
+    are the same for every pincode of a city, so they are cached per
+    normalized (city, category), with brand_counts precomputed. The search
+    itself uses the normalized text too, so the cached entry does not
+    depend on which caller's spelling reached SerpApi first. Concurrent
+    misses share one upstream search. The search gives up at `deadline`
+    (time.monotonic()); background refreshes are not bound by it. Raises on
+    failure.
+    """
     if not SERPAPI_KEY:
         return {"markers": [], "brand_counts": {}}
 
+    city, category = normalize_query(city), normalize_query(category)
+    if poi_cache is None:
+        shops = _search_shops(city, category, deadline)
+    else:
+        shops = poi_cache.get_or_fetch(
+            "shops", f"{city}|{category}",
+            lambda: _search_shops(city, category, deadline),
+            SHOP_CACHE_TTL, SHOP_CACHE_STALE_TTL,
+            refresh=lambda: _search_shops(city, category)
+        )
+    return {"markers": shops["markers"][:top_n], "brand_counts": shops["brand_counts"]}
+
+
+def _search_shops(city, category, deadline=None):
+    """One SerpApi search: every marker plus brand counts over all results. Raises on failure."""
     params = {
         "engine": "google_maps",
         "q": f"{category} in {city}",
@@ -12,63 +38,54 @@ def fetch_top_shops(city, category, top_n=20):
         "api_key": SERPAPI_KEY,
     }
 
-    try:
-        resp = requests.get(SERPAPI_URL, params=params, timeout=10)
-        data = resp.json()
-        
-        markers = []
-        brand_counts = {}
+    data = serpapi.get(SERPAPI_URL, params=params, deadline=deadline).json()
 
-        for item in data.get("local_results", []):
-            title = item.get("title", "Unknown Shop")
-            
-            # 1. Existing Brand Extraction
-            brand_name = title.split(' ')[0].capitalize() 
-            brand_counts[brand_name] = brand_counts.get(brand_name, 0) + 1
-            
-            # 2. Existing Coordinate Extraction
-            coords = item.get("gps_coordinates", {})
-            
-            # --- NEW/REFINED IMAGE AND LINK LOGIC ---
-            # Extract the actual shop image provided by SerpApi
-            shop_image = item.get("thumbnail") or "https://via.placeholder.com/400x300?text=No+Image"
-            
-            # Extract the direct Google Maps link
-            place_id = item.get("place_id")
-            # Priority: Direct link -> Maps link -> Fallback search via Place ID
-            shop_link = item.get("link") or item.get("maps_link") or \
-                        (f"https://www.google.com/maps/search/?api=1&query=Google&query_place_id={place_id}" if place_id else "#")
+    markers = []
+    brand_counts = {}
 
-            markers.append({
-                "title": title,
-                "brand": brand_name,
-                "lat": coords.get("latitude"),
-                "lng": coords.get("longitude"),
-                "address": item.get("address"),
-                "rating": item.get("rating"),
-                "reviews_count": item.get("reviews"),
-                "thumbnail": shop_image, # Use this in your frontend <img> tag
-                "link": shop_link,       # Use this in your frontend <a> tag
-            })
+    for item in data.get("local_results", []):
+        title = item.get("title", "Unknown Shop")
 
-        return {
-            "markers": markers[:top_n],
-            "brand_counts": dict(sorted(brand_counts.items(), key=lambda x: x[1], reverse=True))
-        }
+        # 1. Existing Brand Extraction
+        brand_name = title.split(' ')[0].capitalize()
+        brand_counts[brand_name] = brand_counts.get(brand_name, 0) + 1
 
-    except Exception as e:
-        print(f"Error fetching shops: {e}")
-        return {"markers": [], "brand_counts": {}}
-    
-# -------- Gemini AI (Stays same) --------
-def generate_ai_insights(data):
-    if not gemini_model:
-        return "AI insights unavailable."
+        # 2. Existing Coordinate Extraction
+        coords = item.get("gps_coordinates", {})
+
+        # --- NEW/REFINED IMAGE AND LINK LOGIC ---
+        # Extract the actual shop image provided by SerpApi
+        shop_image = item.get("thumbnail") or "https://via.placeholder.com/400x300?text=No+Image"
+
+        # Extract the direct Google Maps link
+        place_id = item.get("place_id")
+        # Priority: Direct link -> Maps link -> Fallback search via Place ID
+        shop_link = item.get("link") or item.get("maps_link") or \
+                    (f"https://www.google.com/maps/search/?api=1&query=Google&query_place_id={place_id}" if place_id else "#")
+
+        markers.append({
+            "title": title,
+            "brand": brand_name,
+            "lat": coords.get("latitude"),
+            "lng": coords.get("longitude"),
+            "address": item.get("address"),
+            "rating": item.get("rating"),
+            "reviews_count": item.get("reviews"),
+            "thumbnail": shop_image, # Use this in your frontend <img> tag
+            "link": shop_link,       # Use this in your frontend <a> tag
+        })
+
+    return {
+        "markers": markers,
+        "brand_counts": dict(sorted(brand_counts.items(), key=lambda x: x[1], reverse=True))
+    }
 
-    try:
-        prompt = f"Analyze business potential using this data: {data}. Respond in 4–5 concise sentences."
-        response = gemini_model.generate_content(prompt)
-        return getattr(response, "text", "AI response unavailable.")
-    except Exception as e:
-        print(f"Gemini Error: {e}")
-        return "AI strategic insight is currently being calculated. Please check back shortly."
\ No newline at end of file
+# -------- Gemini AI --------
+def insight_text(gemini_model, data):
+    """One Gemini call for the insight paragraph. Raises on failure or an empty answer."""
+    prompt = f"Analyze business potential using this data: {data}. Respond in 4–5 concise sentences."
+    response = gemini_model.generate_content(prompt)
+    text = getattr(response, "text", None)
+    if not text:
+        raise ValueError("Gemini returned no text")
+    return text
@@ -0,0 +1,107 @@
+"""
+Vectorized great-circle geometry for POI metrics.
+
+Distances use the same haversine formula as utils.haversine, evaluated on
+NumPy arrays. Nearest-neighbour search builds a scikit-learn BallTree
+(haversine metric on radians) once a point set is large enough for that to
+beat a dense pairwise matrix; either way the reported distance for each
+pair is recomputed with haversine_m, so results match the scalar version.
+"""
+import math
+import numpy as np
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_M = 6371000
+# Up to this many points a dense n x n matrix is cheaper than a tree
+BRUTE_FORCE_MAX_POINTS = 128
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between (broadcastable) arrays of degrees."""
+    lat1, lon1, lat2, lon2 = (np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2))
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlambda = np.radians(lon2 - lon1)
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def as_points(points):
+    """(n, 2) float64 array of (lat, lon) rows."""
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+def within_radius(lat, lon, points, radius):
+    """Boolean mask of the points no farther than `radius` metres from (lat, lon)."""
+    points = as_points(points)
+    return haversine_m(lat, lon, points[:, 0], points[:, 1]) <= radius
+
+
+def within_box(points, bbox):
+    """Boolean mask of the points inside bbox = (west, south, east, north), edges included."""
+    points = as_points(points)
+    west, south, east, north = bbox
+    return (
+        (points[:, 0] >= south) & (points[:, 0] <= north)
+        & (points[:, 1] >= west) & (points[:, 1] <= east)
+    )
+
+
+def nearest_neighbor_distances(points):
+    """Distance in metres from every point to its nearest other point."""
+    points = as_points(points)
+    n = len(points)
+    if n < 2:
+        return np.zeros(n)
+
+    lat, lon = points[:, 0], points[:, 1]
+    if n <= BRUTE_FORCE_MAX_POINTS:
+        pairwise = haversine_m(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+        np.fill_diagonal(pairwise, np.inf)
+        return pairwise.min(axis=1)
+
+    # k=2 returns the point itself plus its neighbour, except when duplicates
+    # tie at distance 0 and the duplicate comes back first.
+    tree = BallTree(np.radians(points), metric="haversine")
+    _, idx = tree.query(np.radians(points), k=2)
+    own = np.arange(n)
+    neighbor = np.where(idx[:, 0] == own, idx[:, 1], idx[:, 0])
+    return haversine_m(lat, lon, lat[neighbor], lon[neighbor])
+
+
+def mean_nearest_neighbor_distance(points):
+    """Average nearest-neighbour distance in metres (0 for fewer than two points)."""
+    distances = nearest_neighbor_distances(points)
+    return float(distances.mean()) if len(distances) >= 2 else 0.0
+
+
+def box_span_m(bbox):
+    """(height, width) in metres of bbox = (west, south, east, north), width at the mid-latitude."""
+    west, south, east, north = bbox
+    height = math.radians(north - south) * EARTH_RADIUS_M
+    width = math.radians(east - west) * EARTH_RADIUS_M * math.cos(math.radians((south + north) / 2))
+    return height, width
+
+
+def grid_shape(bbox, cell_size_m):
+    """
+    Cuts bbox = (west, south, east, north) into roughly cell_size_m square
+    cells (longitude span scaled at the box's mid-latitude). Returns
+    (rows, cols, cell height in degrees, cell width in degrees).
+    """
+    west, south, east, north = bbox
+    dlat = math.degrees(cell_size_m / EARTH_RADIUS_M)
+    dlon = dlat / math.cos(math.radians((south + north) / 2))
+    rows = max(1, math.ceil((north - south) / dlat))
+    cols = max(1, math.ceil((east - west) / dlon))
+    return rows, cols, dlat, dlon
+
+
+def grid_cells(points, bbox, rows, cols, dlat, dlon):
+    """Row-major cell index of every point (row 0 on the southern edge), -1 outside bbox."""
+    points = as_points(points)
+    west, south = bbox[0], bbox[1]
+    row = np.minimum(np.floor((points[:, 0] - south) / dlat), rows - 1).astype(np.int64)
+    col = np.minimum(np.floor((points[:, 1] - west) / dlon), cols - 1).astype(np.int64)
+    return np.where(within_box(points, bbox), row * cols + col, -1)
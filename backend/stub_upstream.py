@@ -0,0 +1,220 @@
+"""
+Local stand-in for the Geoapify geocode / places and SerpApi search
+endpoints, used by the diag_* scripts. It serves a deterministic world of
+POIs carrying Geoapify's hierarchical `categories` property, honours the
+categories / circle / rect / limit / offset parameters, answers SerpApi
+Google Maps searches with a fixed list of shops, supports HTTP/1.1
+keep-alive, and records every request and TCP connection it receives.
+
+    stub = StubUpstream().start()
+    os.environ["GEOAPIFY_PLACES_URL"] = stub.url + "/v2/places"
+    os.environ["GEOAPIFY_GEOCODE_URL"] = stub.url + "/v1/geocode/search"
+    os.environ["SERPAPI_URL"] = stub.url + "/search"
+
+Point the URLs at the stub before importing config / utils; the world is
+built on first use so that importing this module does not load config.
+"""
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+CENTER = (18.94, 72.83)
+
+
+def _distance_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin(math.radians(lat2 - lat1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371000 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def build_world(size=3000, seed=7, center=CENTER, spread=0.03):
+    """POI features spread around `center`, each tagged with every level of its category path."""
+    from config import BUSINESS_DOMAINS, SUBCATEGORY_MAPPING
+
+    rng = random.Random(seed)
+    leaves = []
+    for domain in BUSINESS_DOMAINS.values():
+        for category in domain["categories"]:
+            leaves.append(category)
+            leaves.extend(SUBCATEGORY_MAPPING.get(category, []))
+
+    def path(leaf):
+        parts = leaf.split(".")
+        return [".".join(parts[:k]) for k in range(1, len(parts) + 1)]
+
+    world = []
+    for i in range(size):
+        tags = path(rng.choice(leaves))
+        if rng.random() < 0.1:  # some places carry a second category
+            tags += path(rng.choice(leaves))
+        lat = center[0] + rng.uniform(-spread, spread)
+        lon = center[1] + rng.uniform(-spread, spread)
+        props = {"name": f"shop{i % 700}", "categories": sorted(set(tags))}
+        if i % 5:
+            props["place_id"] = f"pid{i}"
+        world.append({
+            "type": "Feature",
+            "properties": props,
+            "geometry": {"type": "Point", "coordinates": [lon, lat]}
+        })
+    return world
+
+
+class StubUpstream:
+    """
+    Threaded HTTP server on 127.0.0.1 (ephemeral port). `calls` holds
+    (path, params) for every request in arrival order and `connections`
+    counts accepted TCP connections. `fail` maps a path to a list of HTTP
+    status codes, or (status, headers) pairs, returned (and consumed) before
+    normal responses resume. `delays` maps a path to a list of per-request
+    delays consumed the same way; otherwise every response waits `latency`
+    seconds.
+    """
+
+    def __init__(self, world=None, center=CENTER, latency=0.0):
+        self._world = world
+        self.center = center
+        self.latency = latency
+        self.fail = {}
+        self.delays = {}
+        self.calls = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def world(self):
+        if self._world is None:
+            self._world = build_world(center=self.center)
+        return self._world
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                status, body, headers = stub.handle(parsed.path, dict(parse_qsl(parsed.query)))
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout / lost hedge)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.fail.clear()
+            self.delays.clear()
+            self.connections = 0
+
+    def calls_to(self, path):
+        return [params for p, params in self.calls if p == path]
+
+    def matching(self, categories, lat, lon, radius):
+        """Features a circle query returns, in served order."""
+        return [
+            f for f in self._tagged(categories)
+            if _distance_m(lat, lon, *reversed(f["geometry"]["coordinates"])) <= radius
+        ]
+
+    def matching_box(self, categories, bbox):
+        """Features a rect query over bbox = (west, south, east, north) returns, in served order."""
+        west, south, east, north = bbox
+        return [
+            f for f in self._tagged(categories)
+            if west <= f["geometry"]["coordinates"][0] <= east
+            and south <= f["geometry"]["coordinates"][1] <= north
+        ]
+
+    def _tagged(self, categories):
+        wanted = set(categories.split(","))
+        return [f for f in self.world if wanted & set(f["properties"]["categories"])]
+
+    def handle(self, path, params):
+        with self._lock:
+            self.calls.append((path, params))
+            pending = self.fail.get(path)
+            failure = pending.pop(0) if pending else None
+            delays = self.delays.get(path)
+            delay = delays.pop(0) if delays else self.latency
+        if delay:
+            time.sleep(delay)
+        if failure is not None:
+            status, headers = failure if isinstance(failure, tuple) else (failure, {})
+            return status, {"error": f"stub failure {status}"}, headers
+
+        status, body = self._respond(path, params)
+        return status, body, {}
+
+    def _respond(self, path, params):
+        if path.endswith("/geocode/search"):
+            lat, lon = self.center
+            return 200, {"features": [{"geometry": {"type": "Point", "coordinates": [lon, lat]}}]}
+
+        if path.endswith("/search"):
+            # SerpApi google_maps: a few shops per query, stable per query text
+            rng = random.Random(params.get("q", ""))
+            lat, lon = self.center
+            return 200, {"local_results": [
+                {
+                    "title": f"{rng.choice(['Alpha', 'Beta', 'Gamma', 'Delta'])} Store {i}",
+                    "place_id": f"serp{i}",
+                    "address": f"{i} Stub Road",
+                    "rating": round(rng.uniform(3, 5), 1),
+                    "reviews": rng.randint(1, 500),
+                    "gps_coordinates": {"latitude": lat + rng.uniform(-0.01, 0.01), "longitude": lon + rng.uniform(-0.01, 0.01)},
+                }
+                for i in range(8)
+            ]}
+
+        if path.endswith("/places"):
+            kind, args = params["filter"].split(":", 1)
+            args = [float(v) for v in args.split(",")]
+            if kind == "rect":
+                hits = self.matching_box(params["categories"], args)
+            else:
+                lon, lat, radius = args
+                hits = self.matching(params["categories"], lat, lon, radius)
+            offset, limit = int(params.get("offset", 0)), int(params.get("limit", 20))
+            return 200, {"type": "FeatureCollection", "features": hits[offset:offset + limit]}
+
+        return 404, {"error": "unknown endpoint"}
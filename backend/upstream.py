@@ -0,0 +1,291 @@
+"""
+Shared HTTP client for the upstream APIs (Geoapify, SerpApi).
+
+Each provider gets one UpstreamClient:
+
+- a pooled requests.Session per process (keep-alive, one connection pool
+  per host, rebuilt after a fork),
+- bounded retries of 429/5xx responses and connection errors with full-jitter
+  exponential backoff (Retry-After is honoured), never past the caller's
+  deadline,
+- a circuit breaker that fails fast after repeated upstream failures and
+  lets a single trial request through once the cooldown has passed,
+- optional hedging: if a request has not answered after `hedge_after`
+  seconds a duplicate is sent and the first good response wins,
+- counters and latency percentiles, served at /api/admin/upstream.
+
+Non-2xx results are raised as UpstreamError (a requests.RequestException)
+instead of being handed back, so callers cannot mistake a failed page for
+an empty one.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    GEOAPIFY_TIMEOUT,
+    GEOAPIFY_HEDGE_AFTER_MS,
+    SERPAPI_TIMEOUT,
+    SERPAPI_HEDGE_AFTER_MS,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_MAX,
+    UPSTREAM_POOL_SIZE,
+    UPSTREAM_BREAKER_THRESHOLD,
+    UPSTREAM_BREAKER_COOLDOWN
+)
+from per_process import PerProcess
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+LATENCY_WINDOW = 2048
+
+
+class UpstreamError(requests.RequestException):
+    """An upstream call failed for good: a non-retryable status, or retries exhausted."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(UpstreamError):
+    """The provider's circuit breaker is open, so the call was not attempted."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. While open every call is
+    refused; after `cooldown` seconds one trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opens = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            self._trial_running = False
+            if ok:
+                self.state, self.failures = "closed", 0
+                return
+            self.failures += 1
+            if self.state == "half_open" or (self.threshold > 0 and self.failures >= self.threshold):
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens}
+
+
+class UpstreamClient:
+    """Pooled, retrying, circuit-broken GETs against one provider."""
+
+    def __init__(self, name, timeout, max_retries=UPSTREAM_MAX_RETRIES,
+                 backoff_base=UPSTREAM_BACKOFF_BASE, backoff_max=UPSTREAM_BACKOFF_MAX,
+                 pool_size=UPSTREAM_POOL_SIZE, breaker_threshold=UPSTREAM_BREAKER_THRESHOLD,
+                 breaker_cooldown=UPSTREAM_BREAKER_COOLDOWN, hedge_after=0.0):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+
+        self._lock = threading.Lock()
+        self._resources = PerProcess(self._build_resources)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {
+            "requests": 0, "attempts": 0, "retries": 0, "successes": 0, "failures": 0,
+            "connection_errors": 0, "short_circuited": 0, "hedged": 0, "hedge_wins": 0,
+        }
+        self._statuses = {}
+
+    # ---------- plumbing ----------
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counters[key] += n
+
+    def _build_resources(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        hedge_pool = ThreadPoolExecutor(
+            max_workers=2 * self.pool_size, thread_name_prefix=f"{self.name}-hedge"
+        ) if self.hedge_after > 0 else None
+        return session, hedge_pool
+
+    def _send(self, url, params, timeout):
+        session, hedge_pool = self._resources.get()
+        self._count("attempts")
+        if hedge_pool is None or timeout <= self.hedge_after:
+            return session.get(url, params=params, timeout=timeout)
+
+        primary = hedge_pool.submit(session.get, url, params=params, timeout=timeout)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self._count("hedged")
+        self._count("attempts")
+        hedge = hedge_pool.submit(session.get, url, params=params, timeout=max(0.001, timeout - self.hedge_after))
+        pending = {primary, hedge}
+        error, retryable = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    resp = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if resp.status_code in RETRY_STATUSES and pending:
+                    # The other copy may still succeed
+                    retryable = resp
+                    continue
+                if future is hedge:
+                    self._count("hedge_wins")
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return resp
+        if retryable is not None:
+            return retryable
+        raise error
+
+    def _backoff(self, attempt, resp):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    # ---------- public ----------
+    def get(self, url, params=None, timeout=None, deadline=None):
+        """
+        GET `url` and return the 2xx response. Raises UpstreamError /
+        CircuitOpenError on failure, TimeoutError once `deadline`
+        (time.monotonic()) has passed.
+        """
+        self._count("requests")
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            attempt_timeout = timeout or self.timeout
+            if deadline is not None:
+                attempt_timeout = min(attempt_timeout, deadline - time.monotonic())
+                if attempt_timeout <= 0:
+                    self._count("failures")
+                    raise TimeoutError(f"Deadline exceeded calling {self.name}")
+
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                raise CircuitOpenError(f"{self.name} circuit is open")
+
+            resp = None
+            try:
+                resp = self._send(url, params, attempt_timeout)
+            except requests.RequestException as e:
+                self._count("connection_errors")
+                error = UpstreamError(f"{self.name} request failed: {e}")
+                error.__cause__ = e  # kept so callers can tell a timeout from other failures
+            except BaseException:
+                # Anything else (e.g. a shut-down hedge pool) must still settle
+                # the breaker, or a half-open trial would stay marked running
+                self.breaker.record(False)
+                self._count("failures")
+                raise
+            else:
+                with self._lock:
+                    self._statuses[resp.status_code] = self._statuses.get(resp.status_code, 0) + 1
+                if resp.status_code < 400:
+                    self.breaker.record(True)
+                    self._count("successes")
+                    with self._lock:
+                        self._latencies.append(time.monotonic() - started)
+                    return resp
+                error = UpstreamError(f"{self.name} returned HTTP {resp.status_code}", resp.status_code)
+                if resp.status_code not in RETRY_STATUSES:
+                    # The provider is up; the request itself is wrong
+                    self.breaker.record(True)
+                    self._count("failures")
+                    raise error
+
+            self.breaker.record(False)
+            delay = self._backoff(attempt, resp)
+            out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+            if attempt >= self.max_retries or out_of_time:
+                self._count("failures")
+                if deadline is not None and time.monotonic() >= deadline:
+                    # The last attempt was cut short by the deadline
+                    raise TimeoutError(f"Deadline exceeded calling {self.name}") from error
+                raise error
+
+            time.sleep(delay)
+            attempt += 1
+            self._count("retries")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            statuses = {str(k): v for k, v in sorted(self._statuses.items())}
+            latencies = sorted(self._latencies)
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+
+        return {
+            **counters,
+            "statuses": statuses,
+            "breaker": self.breaker.stats(),
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)},
+            "pool_size": self.pool_size,
+            "hedge_after_ms": self.hedge_after * 1000,
+        }
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+geoapify = UpstreamClient("geoapify", GEOAPIFY_TIMEOUT, hedge_after=GEOAPIFY_HEDGE_AFTER_MS / 1000)
+serpapi = UpstreamClient("serpapi", SERPAPI_TIMEOUT, hedge_after=SERPAPI_HEDGE_AFTER_MS / 1000)
+
+
+def upstream_stats():
+    return {client.name: client.stats() for client in (geoapify, serpapi)}
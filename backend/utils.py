@@ -1,12 +1,34 @@
 import requests
 import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
 from config import (
     GEOAPIFY_API_KEY,
     GEOAPIFY_PLACES_URL,
     GEOAPIFY_GEOCODE_URL,
-    BUSINESS_DOMAINS
+    GEOAPIFY_MAX_CONCURRENCY,
+    GEOAPIFY_DOMAIN_DEADLINE,
+    GEOAPIFY_FETCH_MODE,
+    GEOAPIFY_SWEEP_PAGE_SIZE,
+    BUSINESS_DOMAINS,
+    SUBCATEGORY_MAPPING,
+    POI_CACHE_ENABLED,
+    POI_CACHE_PATH,
+    POI_CACHE_MAX_ENTRIES,
+    POI_CACHE_TTL,
+    GEOCODE_CACHE_TTL,
+    POI_CACHE_STALE_TTL,
+    POI_CACHE_CENTER_DECIMALS,
+    POI_PROVIDER
 )
+from per_process import PerProcess
+from poi_cache import PersistentCache
+from upstream import geoapify
+from osm_store import get_osm_store
+from spatial import haversine_m, mean_nearest_neighbor_distance, within_box, within_radius
+
+poi_cache = PersistentCache(POI_CACHE_PATH, POI_CACHE_MAX_ENTRIES) if POI_CACHE_ENABLED else None
 
 # -------------------------------
 # Distance (Haversine)
@@ -40,19 +62,57 @@ def get_unique_place_key(props, lat, lon):
     return f"{name}_{round(lat, 6)}_{round(lon, 6)}"
 
 
+# -------------------------------
+# Cache keys
+# -------------------------------
+def normalize_query(text):
+    return " ".join(str(text).lower().split())
+
+
+def places_cache_key(categories, lat, lon, radius):
+    d = POI_CACHE_CENTER_DECIMALS
+    return f"{round(lat, d)},{round(lon, d)}|{radius}|{categories}"
+
+
+def box_cache_key(categories, bbox):
+    d = POI_CACHE_CENTER_DECIMALS
+    return "rect:" + ",".join(str(round(v, d)) for v in bbox) + f"|{categories}"
+
+
 # -------------------------------
 # Geocode location
 # -------------------------------
 def geocode_location(location: str):
+    if POI_PROVIDER == "osm":
+        return get_osm_store().geocode(location)
+    try:
+        return _geocode_cached(location)
+    except (requests.RequestException, ValueError):
+        if POI_PROVIDER != "fallback":
+            raise
+        return get_osm_store().geocode(location)
+
+
+def _geocode_cached(location: str):
+    if poi_cache is None:
+        return _geocode_upstream(location)
+
+    lat, lon = poi_cache.get_or_fetch(
+        "geocode", normalize_query(location),
+        lambda: list(_geocode_upstream(location)),
+        GEOCODE_CACHE_TTL, POI_CACHE_STALE_TTL
+    )
+    return lat, lon
+
+
+def _geocode_upstream(location: str):
     params = {
         "text": location,
         "limit": 1,
         "apiKey": GEOAPIFY_API_KEY
     }
 
-    resp = requests.get(GEOAPIFY_GEOCODE_URL, params=params, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
+    data = geoapify.get(GEOAPIFY_GEOCODE_URL, params=params).json()
 
     if not data.get("features"):
         raise ValueError("Location not found")
@@ -68,129 +128,352 @@ def avg_nearest_neighbor_distance(points):
     if len(points) < 2:
         return 0
 
-    distances = []
-    for i, (lat1, lon1) in enumerate(points):
-        min_dist = float("inf")
-        for j, (lat2, lon2) in enumerate(points):
-            if i != j:
-                d = haversine(lat1, lon1, lat2, lon2)
-                min_dist = min(min_dist, d)
-        distances.append(min_dist)
-
-    return round(sum(distances) / len(distances), 2)
+    return round(mean_nearest_neighbor_distance(points), 2)
 
 
 # -------------------------------
-# Subcategory Counts
+# Paginated POI query
 # -------------------------------
-def fetch_subcategory_counts(subcategories, lat, lon, radius=2000):
-    results = {}
-
-    for sub_cat in subcategories:
-        unique_places = {}
-        offset = 0
-        limit = 100
-
-        while True:
-            params = {
-                "categories": sub_cat,
-                "filter": f"circle:{lon},{lat},{radius}",
-                "type": "poi",
-                "limit": limit,
-                "offset": offset,
-                "apiKey": GEOAPIFY_API_KEY
-            }
+def _iter_pages(categories, place_filter, deadline=None, limit=100):
+    """
+    Pages through a Geoapify places query (`categories` is the comma-separated
+    filter) and yields, per page, a list of (props, lat, lon) for the POIs
+    that carry coordinates. Individual requests never run past `deadline`
+    (time.monotonic()). A page that still fails after the client's retries
+    raises UpstreamError rather than ending pagination early.
+    """
+    offset = 0
+
+    while True:
+        params = {
+            "categories": categories,
+            "filter": place_filter,
+            "type": "poi",
+            "limit": limit,
+            "offset": offset,
+            "apiKey": GEOAPIFY_API_KEY
+        }
 
-            resp = requests.get(GEOAPIFY_PLACES_URL, params=params, timeout=30)
-            if resp.status_code != 200:
-                break
+        resp = geoapify.get(GEOAPIFY_PLACES_URL, params=params, deadline=deadline)
+        features = resp.json().get("features", [])
+        if not features:
+            break
 
-            features = resp.json().get("features", [])
-            if not features:
-                break
+        located = []
+        for f in features:
+            coords = f.get("geometry", {}).get("coordinates")
+            if coords:
+                lon_poi, lat_poi = coords
+                located.append((f.get("properties", {}), lat_poi, lon_poi))
+        if located:
+            yield located
 
-            for f in features:
-                props = f.get("properties", {})
-                coords = f.get("geometry", {}).get("coordinates")
-                if not coords:
-                    continue
+        if len(features) < limit:
+            break
 
-                lon_poi, lat_poi = coords
+        offset += limit
 
-                # Strict radius match
-                if haversine(lat, lon, lat_poi, lon_poi) > radius:
-                    continue
 
-                pid = get_unique_place_key(props, lat_poi, lon_poi)
-                unique_places[pid] = True
+def iter_places(categories, lat, lon, radius=2000, deadline=None, limit=100, offline=False):
+    """
+    Yields (props, lat, lon) for every POI strictly inside the circle, from
+    Geoapify or, with `offline`, from the OSM store.
+    """
+    if offline:
+        yield from get_osm_store().iter_places(categories, lat, lon, radius)
+        return
+
+    for page in _iter_pages(categories, f"circle:{lon},{lat},{radius}", deadline, limit):
+        # Strict radius match, one vectorized distance pass per page
+        inside = within_radius(lat, lon, [(p[1], p[2]) for p in page], radius)
+        for place, keep in zip(page, inside):
+            if keep:
+                yield place
 
-            if len(features) < limit:
-                break
 
-            offset += limit
+def iter_places_in_box(categories, bbox, deadline=None, limit=100, offline=False):
+    """Yields (props, lat, lon) for every POI inside bbox = (west, south, east, north)."""
+    if offline:
+        yield from get_osm_store().iter_places_in_box(categories, bbox)
+        return
 
-        results[sub_cat] = len(unique_places)
+    west, south, east, north = bbox
+    for page in _iter_pages(categories, f"rect:{west},{south},{east},{north}", deadline, limit):
+        inside = within_box([(p[1], p[2]) for p in page], bbox)
+        for place, keep in zip(page, inside):
+            if keep:
+                yield place
 
-    return results
+
+def _cached_places(key, deadline, fetch):
+    """
+    Runs fetch(deadline, offline) -> places for the configured POI_PROVIDER.
+    Geoapify results go through the persistent cache under `key` (see
+    places_cache_key / box_cache_key). "osm" answers from the offline store
+    directly, and "fallback" answers from it when the upstream fetch fails.
+    """
+    if POI_PROVIDER == "osm":
+        return fetch(deadline, True)
+
+    try:
+        return _upstream_places(key, deadline, fetch)
+    except (requests.RequestException, TimeoutError):
+        if POI_PROVIDER != "fallback":
+            raise
+        return fetch(deadline, True)
+
+
+def _upstream_places(key, deadline, fetch):
+    if poi_cache is None:
+        return fetch(deadline)
+
+    # Failed fetches raise, so whatever comes back is a complete result
+    return poi_cache.get_or_fetch(
+        "pois", key,
+        lambda: fetch(deadline),
+        POI_CACHE_TTL, POI_CACHE_STALE_TTL,
+        refresh=lambda: fetch(time.monotonic() + GEOAPIFY_DOMAIN_DEADLINE)
+    )
+
+
+def fetch_category_places(category, lat, lon, radius=2000, deadline=None, memo=None):
+    """
+    Returns {unique place key: (lat, lon)} for one category, in upstream order.
+    `memo(key, fetch)` lets an analysis share results between its stages.
+    """
+    if memo is not None:
+        return memo(
+            ("places", places_cache_key(category, lat, lon, radius)),
+            lambda: fetch_category_places(category, lat, lon, radius, deadline)
+        )
+
+    def fetch(fetch_deadline, offline=False):
+        found = {}
+        for props, lat_poi, lon_poi in iter_places(category, lat, lon, radius, fetch_deadline, offline=offline):
+            pid = get_unique_place_key(props, lat_poi, lon_poi)
+            if pid not in found:
+                found[pid] = [lat_poi, lon_poi]
+        return found
+
+    places = _cached_places(places_cache_key(category, lat, lon, radius), deadline, fetch)
+    return {pid: tuple(point) for pid, point in places.items()}
+
+
+def fetch_places_sweep(categories, lat, lon, radius=2000, deadline=None, memo=None):
+    """
+    Fetches several categories with one paginated query and partitions the
+    POIs locally by their `categories` property (which lists every level of
+    a place's category path, so a parent category matches its children).
+    Returns {category: {unique place key: (lat, lon)}} in `categories` order.
+    """
+    categories = list(dict.fromkeys(categories))
+    if not categories:
+        return {}
+    query = ",".join(categories)
+
+    if memo is not None:
+        return memo(
+            ("places", places_cache_key(query, lat, lon, radius)),
+            lambda: fetch_places_sweep(categories, lat, lon, radius, deadline)
+        )
+
+    def fetch(fetch_deadline, offline=False):
+        places = iter_places(
+            query, lat, lon, radius, fetch_deadline, limit=GEOAPIFY_SWEEP_PAGE_SIZE, offline=offline
+        )
+        return _partition_sweep(categories, places)
+
+    buckets = _cached_places(places_cache_key(query, lat, lon, radius), deadline, fetch)
+    return _sweep_result(categories, buckets)
+
+
+def fetch_places_sweep_box(categories, bbox, deadline=None, memo=None):
+    """
+    fetch_places_sweep over a bounding box (west, south, east, north)
+    instead of a circle, e.g. a whole city for the market-gap heatmap.
+    """
+    categories = list(dict.fromkeys(categories))
+    if not categories:
+        return {}
+    query = ",".join(categories)
+
+    if memo is not None:
+        return memo(
+            ("places", box_cache_key(query, bbox)),
+            lambda: fetch_places_sweep_box(categories, bbox, deadline)
+        )
+
+    def fetch(fetch_deadline, offline=False):
+        places = iter_places_in_box(
+            query, bbox, fetch_deadline, limit=GEOAPIFY_SWEEP_PAGE_SIZE, offline=offline
+        )
+        return _partition_sweep(categories, places)
+
+    buckets = _cached_places(box_cache_key(query, bbox), deadline, fetch)
+    return _sweep_result(categories, buckets)
+
+
+def _partition_sweep(categories, places):
+    buckets = {category: {} for category in categories}
+    for props, lat_poi, lon_poi in places:
+        tags = set(props.get("categories", ()))
+        pid = get_unique_place_key(props, lat_poi, lon_poi)
+        for category in categories:
+            if category in tags and pid not in buckets[category]:
+                buckets[category][pid] = [lat_poi, lon_poi]
+    return buckets
+
+
+def _sweep_result(categories, buckets):
+    return {
+        category: {pid: tuple(point) for pid, point in buckets[category].items()}
+        for category in categories
+    }
 
 
 # -------------------------------
-# Fetch business counts
+# Bounded concurrent fan-out
 # -------------------------------
-def fetch_business_counts(domain: str, location: str, radius=2000):
+# One pool per process, so GEOAPIFY_MAX_CONCURRENCY bounds all concurrent
+# analyses together
+_fan_out_pool = PerProcess(lambda: ThreadPoolExecutor(GEOAPIFY_MAX_CONCURRENCY, thread_name_prefix="geoapify-fan-out"))
 
-    if domain not in BUSINESS_DOMAINS:
-        raise ValueError("Invalid business domain")
 
-    center_lat, center_lon = geocode_location(location)
-    area_sq_km = math.pi * (radius / 1000) ** 2
+def _before_deadline(fn, item, deadline):
+    # Items that waited in the shared queue past the deadline are not started
+    if time.monotonic() >= deadline:
+        raise TimeoutError("Deadline exceeded before the fetch started")
+    return fn(item, deadline)
 
-    category_results = {}
 
-    for category in BUSINESS_DOMAINS[domain]["categories"]:
-        unique_places = {}
-        offset = 0
-        limit = 100
-
-        while True:
-            params = {
-                "categories": category,
-                "filter": f"circle:{center_lon},{center_lat},{radius}",
-                "type": "poi",
-                "limit": limit,
-                "offset": offset,
-                "apiKey": GEOAPIFY_API_KEY
-            }
+def fan_out(fn, items, deadline):
+    """
+    Runs fn(item, deadline) for every item on the process-wide fetch pool
+    and returns the results in item order, so output never depends on
+    completion order. fn must stop at `deadline` (the fetchers pass it to
+    the upstream client). Raises TimeoutError if the items are not all done
+    by then; their queued fetches are cancelled.
+    """
+    items = list(items)
+    if not items:
+        return []
 
-            resp = requests.get(GEOAPIFY_PLACES_URL, params=params, timeout=30)
-            if resp.status_code != 200:
-                break
+    pool = _fan_out_pool.get()
+    futures = [pool.submit(_before_deadline, fn, item, deadline) for item in items]
+    done, pending = wait(futures, timeout=max(0, deadline - time.monotonic()))
+    if pending:
+        for future in pending:
+            future.cancel()
+        raise TimeoutError(f"{len(pending)} of {len(items)} upstream fetches missed the deadline")
+    return [f.result() for f in futures]
 
-            features = resp.json().get("features", [])
-            if not features:
-                break
 
-            for f in features:
-                props = f.get("properties", {})
-                coords = f.get("geometry", {}).get("coordinates")
-                if not coords:
-                    continue
+# -------------------------------
+# Subcategory Counts
+# -------------------------------
+def fetch_subcategory_counts(subcategories, lat, lon, radius=2000, memo=None):
+    deadline = time.monotonic() + GEOAPIFY_DOMAIN_DEADLINE
+    if GEOAPIFY_FETCH_MODE == "sweep":
+        swept = fetch_places_sweep(subcategories, lat, lon, radius, deadline, memo)
+        return {sub_cat: len(swept[sub_cat]) for sub_cat in subcategories}
+
+    places = fan_out(
+        lambda sub_cat, fetch_deadline: fetch_category_places(sub_cat, lat, lon, radius, fetch_deadline, memo),
+        subcategories, deadline
+    )
+    return {sub_cat: len(found) for sub_cat, found in zip(subcategories, places)}
 
-                lon_poi, lat_poi = coords
 
-                # Strict radius match
-                if haversine(center_lat, center_lon, lat_poi, lon_poi) > radius:
-                    continue
+# -------------------------------
+# Fetch business counts
+# -------------------------------
+def fetch_business_counts(domain: str, location: str, radius=2000, center=None, memo=None):
+    """
+    Competitor metrics per domain category around `location`. Pass an
+    already-resolved `center` (lat, lon) to skip geocoding, and `memo` to
+    share upstream results with the rest of an analysis.
+    """
+    if domain not in BUSINESS_DOMAINS:
+        raise ValueError("Invalid business domain")
+
+    center_lat, center_lon = center if center is not None else geocode_location(location)
+    places, subcategory_places = _fetch_domain_places(domain, center_lat, center_lon, radius, memo)
+    return _business_counts(domain, location, radius, places, subcategory_places)
+
+
+def fetch_business_rings(domain: str, location: str, radii, center=None, memo=None):
+    """
+    fetch_business_counts for several radii at the cost of one fetch at the
+    largest: each category's POIs are sorted by distance from the center
+    once, and every ring is the prefix of that order within its radius, so
+    no further requests are made. Returns one fetch_business_counts result
+    per radius, ascending.
+    """
+    if domain not in BUSINESS_DOMAINS:
+        raise ValueError("Invalid business domain")
+
+    radii = sorted(set(radii))
+    center_lat, center_lon = center if center is not None else geocode_location(location)
+    places, subcategory_places = _fetch_domain_places(domain, center_lat, center_lon, radii[-1], memo)
+
+    def by_distance(unique_places):
+        # Sorted once; every ring is then a prefix of the distance order
+        items = list(unique_places.items())
+        points = np.array([point for _, point in items], dtype=float).reshape(-1, 2)
+        dist = haversine_m(center_lat, center_lon, points[:, 0], points[:, 1])
+        order = np.argsort(dist, kind="stable")
+        return items, order, dist[order]
+
+    def ring(sorted_places, radius):
+        items, order, sorted_dist = sorted_places
+        inside = order[:np.searchsorted(sorted_dist, radius, side="right")]
+        # Back in upstream order, so samples match a direct fetch at `radius`
+        return dict(items[i] for i in np.sort(inside))
+
+    sorted_places = [by_distance(unique_places) for unique_places in places]
+    sorted_subs = {sub: by_distance(found) for sub, found in (subcategory_places or {}).items()}
+
+    return [
+        _business_counts(
+            domain, location, radius,
+            [ring(found, radius) for found in sorted_places],
+            None if subcategory_places is None else {
+                sub: ring(found, radius) for sub, found in sorted_subs.items()
+            }
+        )
+        for radius in radii
+    ]
 
-                pid = get_unique_place_key(props, lat_poi, lon_poi)
-                if pid not in unique_places:
-                    unique_places[pid] = (lat_poi, lon_poi)
 
-            if len(features) < limit:
-                break
+def _fetch_domain_places(domain, center_lat, center_lon, radius, memo=None):
+    """
+    ([{unique place key: (lat, lon)} per domain category], {subcategory:
+    places} or None). Subcategories come for free in sweep mode only.
+    """
+    deadline = time.monotonic() + GEOAPIFY_DOMAIN_DEADLINE
+    categories = BUSINESS_DOMAINS[domain]["categories"]
+
+    if GEOAPIFY_FETCH_MODE == "sweep":
+        # One query covers the domain and every subcategory deep-dive candidate
+        subcategories = [sub for category in categories for sub in SUBCATEGORY_MAPPING.get(category, [])]
+        swept = fetch_places_sweep(categories + subcategories, center_lat, center_lon, radius, deadline, memo)
+        return [swept[category] for category in categories], {sub: swept[sub] for sub in subcategories}
+
+    places = fan_out(
+        lambda category, fetch_deadline: fetch_category_places(
+            category, center_lat, center_lon, radius, fetch_deadline, memo
+        ),
+        categories, deadline
+    )
+    return places, None
+
 
-            offset += limit
+def _business_counts(domain, location, radius, places, subcategory_places):
+    area_sq_km = math.pi * (radius / 1000) ** 2
+    categories = BUSINESS_DOMAINS[domain]["categories"]
+    category_results = {}
 
+    for category, unique_places in zip(categories, places):
         locations = list(unique_places.values())
         count = len(locations)
 
@@ -214,7 +497,11 @@ def fetch_business_counts(domain: str, location: str, radius=2000):
         "location": location,
         "radius_meters": radius,
         "area_sq_km": round(area_sq_km, 2),
-        "categories": category_results
+        "categories": category_results,
+        # Only filled in sweep mode; None means subcategories were not fetched
+        "subcategory_counts": None if subcategory_places is None else {
+            sub: len(found) for sub, found in subcategory_places.items()
+        }
     }
 
 def make_json_safe(obj):
@@ -45,10 +45,18 @@ const StrategyDashboard = () => {
         setLoading(true);
         setError(null);
         try {
-            const response = await axios.post('http://127.0.0.1:5000/api/generate_strategy', formData);
-            setData(response.data);
+            // Generation runs as a background job; poll it until it finishes
+            const response = await axios.post('http://127.0.0.1:5000/api/strategy_jobs', formData);
+            const statusUrl = `http://127.0.0.1:5000/api/strategy_jobs/${response.data.id}`;
+            let job = response.data;
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise((resolve) => setTimeout(resolve, 1500));
+                job = (await axios.get(statusUrl)).data;
+            }
+            if (job.status !== 'done') throw new Error(job.error);
+            setData(job.result);
         } catch (error) {
-            console.error("Error generating plan:", error.response?.data?.details );
+            console.error("Error generating plan:", error.response?.data?.details || error.message);
             setError("Failed to generate plan. Please try again later.");
         } finally {
             setLoading(false);
@@ -28,6 +28,39 @@ function CityDashboard() {
     }
   }, [location.state]);
 
+  // Insights are generated in the background; long-poll until they are ready
+  const insightsToken = data?.insights ? null : data?.insights_token;
+  useEffect(() => {
+    if (!insightsToken) return;
+    let cancelled = false;
+    const poll = async () => {
+      // The server caps each wait at a few seconds; give up after about a minute
+      for (let attempt = 0; attempt < 12 && !cancelled; attempt++) {
+        try {
+          const response = await fetch(`http://127.0.0.1:5000/api/insights/${insightsToken}?wait=5`);
+          const result = await response.json();
+          if (cancelled || result.status === "error" || result.status === "unknown") return;
+          if (result.status === "ready") {
+            setData((prev) => {
+              const updated = { ...prev, insights: result.insights, insights_status: "ready" };
+              localStorage.setItem("lastPrediction", JSON.stringify(updated));
+              return updated;
+            });
+            return;
+          }
+        } catch {
+          return;
+        }
+        // A busy server answers at once instead of waiting; pause before asking again
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+      }
+    };
+    poll();
+    return () => {
+      cancelled = true;
+    };
+  }, [insightsToken]);
+
   if (!data) {
     return (
       <div className="flex items-center justify-center min-h-screen bg-[#030303] text-white">